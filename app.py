@@ -1,15 +1,16 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
 import warnings
 import io
+import os
 warnings.filterwarnings('ignore')
 
 # Импорт утилит и модулей вкладок
-from utils import load_data, sample_data_for_plotting, find_target_column
+from utils import load_data, sample_data_for_plotting, find_target_column, load_chunked_profile, resolve_large_file_path, LARGE_FILE_DIR, register_dataset, prepare_frame, CATEGORY_MAX_UNIQUE, STORAGE_BACKENDS, column_types
+from utils import fingerprint_upload, fingerprint_dataframe, pin_session_datasets
 from tabs.tab1_overview import render_overview_tab
 from tabs.tab2_missing import render_missing_tab
 from tabs.tab3_distributions import render_distributions_tab
@@ -103,6 +104,21 @@ delimiter_map = {
     "Точка с запятой (;)": ";"
 }
 selected_delimiter = delimiter_map[delimiter_option]
+storage = st.sidebar.radio(
+    "Хранение данных в памяти",
+    list(STORAGE_BACKENDS),
+    format_func=STORAGE_BACKENDS.get,
+    help="Apache Arrow: строковые и числовые колонки хранятся в типах pyarrow - строки занимают в несколько раз меньше памяти"
+)
+category_max_unique = st.sidebar.number_input(
+    "Категориальный тип: максимум уникальных значений",
+    min_value=0,
+    max_value=100000,
+    value=CATEGORY_MAX_UNIQUE,
+    step=100,
+    help="Строковые колонки с не большим числом уникальных значений хранятся как category (словарь значений и целые коды): "
+         "меньше памяти, группировки и фильтры работают по кодам. 0 - не преобразовывать"
+)
 
 # Настройки производительности
 st.sidebar.subheader("⚡ Настройки производительности")
@@ -119,58 +135,117 @@ use_sampling = st.sidebar.checkbox(
     value=True,
     help="Автоматически применять выборку для датасетов > 10000 строк"
 )
+density_scatter = st.sidebar.checkbox(
+    "Плотность вместо выборки на scatter plots",
+    value=True,
+    help="Если точек больше лимита, scatter plot строится по всем строкам как 2D-гистограмма плотности, "
+         "а не по случайной выборке - редкие точки не теряются"
+)
 fast_mode = st.sidebar.checkbox(
     "Быстрый режим (упрощенные графики)",
     value=False,
     help="Упрощает графики для ускорения (меньше деталей, быстрее построение)"
 )
+out_of_core = st.sidebar.checkbox(
+    "Режим больших файлов (потоковая обработка)",
+    value=False,
+    help="Файл читается по частям, не загружаясь в память целиком. "
+         "Обзор, пропуски, выбросы и корреляции считаются по всему файлу, остальные графики - по выборке"
+)
+large_file_path = None
+if out_of_core and LARGE_FILE_DIR:
+    large_file_path = st.sidebar.text_input(
+        "Путь к файлу на сервере (необязательно)",
+        value="",
+        help=f"Для файлов, которые слишком велики для загрузки через браузер. Путь относительно каталога {LARGE_FILE_DIR}"
+    ).strip() or None
 
 # Все функции перенесены в utils.py
 
 # Загрузка данных
-if uploaded_file is not None or use_example_data:
+# dataset_id - источник статистики (весь файл или потоковый профиль), frame_id - DataFrame во вкладках
+profile = None
+dataset_id = frame_id = None
+if uploaded_file is not None or use_example_data or large_file_path:
     # Обновляем прогресс-бар (он уже создан выше)
-    if uploaded_file is not None:
-        status_text.text("📂 Загрузка файла...")
+    if out_of_core and (large_file_path or uploaded_file is not None):
+        status_text.text("📂 Потоковая обработка файла...")
         progress_bar.progress(10)
         
-        # Вычисляем хеш файла для определения, изменились ли данные
         import hashlib
-        file_hash = hashlib.md5(uploaded_file.getvalue()).hexdigest()
+        error = None
+        has_shift = False
+        df = None
+        if large_file_path:
+            resolved_path = resolve_large_file_path(large_file_path)
+            if resolved_path is None:
+                error = f"Путь вне разрешенного каталога {LARGE_FILE_DIR}: {large_file_path}"
+            elif os.path.isfile(resolved_path):
+                # Для файла на сервере отпечаток строим по пути, размеру и времени изменения
+                file_stat = os.stat(resolved_path)
+                file_hash = hashlib.md5(f"{resolved_path}|{file_stat.st_size}|{file_stat.st_mtime_ns}".encode()).hexdigest()
+                source = resolved_path
+            else:
+                error = f"Файл не найден: {large_file_path}"
+        else:
+            file_hash = fingerprint_upload(uploaded_file)
+            source = uploaded_file
+        
+        if error is None:
+            if 'last_file_hash' not in st.session_state or st.session_state.last_file_hash != file_hash:
+                st.session_state.last_file_hash = file_hash
+            
+            try:
+                with st.spinner("Чтение файла по частям..."):
+                    profile = load_chunked_profile(source, selected_delimiter, file_hash)
+                # Во вкладки передается выборка строк, статистика - из профиля
+                df = profile.sample
+                dataset_id = register_dataset(profile, file_hash, selected_delimiter)
+                frame_id = register_dataset(df, file_hash, selected_delimiter, 'sample')
+            except Exception as e:
+                error = str(e)
+        progress_bar.progress(30)
+    elif uploaded_file is not None:
+        status_text.text("📂 Загрузка файла...")
+        progress_bar.progress(10)
+        
+        # Отпечаток файла (считается один раз на загрузку) для определения, изменились ли данные
+        file_hash = fingerprint_upload(uploaded_file)
         
         # Если файл изменился, сбрасываем состояние
         if 'last_file_hash' not in st.session_state or st.session_state.last_file_hash != file_hash:
             st.session_state.last_file_hash = file_hash
-            st.session_state.tabs_initialized = False
-            st.session_state.last_active_tab = -1
             # Очищаем кэш гипотез при загрузке нового файла
             for key in list(st.session_state.keys()):
                 if key.startswith('hypotheses_cache_'):
                     del st.session_state[key]
         
-        df, error, has_shift = load_data(uploaded_file, selected_delimiter)
+        df, error, has_shift = load_data(uploaded_file, selected_delimiter, file_hash, category_max_unique, storage)
+        if df is not None:
+            dataset_id = frame_id = register_dataset(df, file_hash, selected_delimiter, category_max_unique, storage)
         progress_bar.progress(30)
     else:
         # Используем пример данных напрямую
         status_text.text("📂 Загрузка примера данных...")
         progress_bar.progress(10)
-        df = example_df.copy()
         error = None
         has_shift = False
-        progress_bar.progress(30)
         
-        # Для примера данных используем хеш на основе DataFrame
-        import hashlib
-        example_hash = hashlib.md5(str(df.values.tobytes()).encode()).hexdigest()
+        # Для примера данных используем отпечаток буферов колонок DataFrame; в session_state хранятся исходные
+        # данные, поэтому хранение и категории пересобираются при изменении настроек в боковой панели
+        example_hash = fingerprint_dataframe(example_df)
+        df = prepare_frame(example_df, example_hash, category_max_unique, storage)
+        dataset_id = frame_id = register_dataset(df, example_hash, category_max_unique, storage)
+        progress_bar.progress(30)
         if 'last_file_hash' not in st.session_state or st.session_state.last_file_hash != example_hash:
             st.session_state.last_file_hash = example_hash
-            st.session_state.tabs_initialized = False
-            st.session_state.last_active_tab = -1
             # Очищаем кэш гипотез при загрузке нового файла
             for key in list(st.session_state.keys()):
                 if key.startswith('hypotheses_cache_'):
                     del st.session_state[key]
     
+    pin_session_datasets(dataset_id, frame_id)
+    
     if error:
         progress_bar.progress(40)
         status_text.text("⚠️ Обработка предупреждений...")
@@ -199,10 +274,7 @@ if uploaded_file is not None or use_example_data:
         progress_bar.progress(50)
         
         # Показываем информацию о структуре данных
-        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-        progress_bar.progress(60)
-        
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
+        numeric_cols, categorical_cols = column_types(df)
         progress_bar.progress(70)
         
         # Поиск целевой переменной (для использования во всех вкладках)
@@ -215,9 +287,30 @@ if uploaded_file is not None or use_example_data:
         
         # Обновляем прогресс-бар до 100% и показываем финальный статус
         progress_bar.progress(100)
-        status_text.text(f"✅ Готово: {df.shape[0]} строк × {df.shape[1]} столбцов | Выберите вкладку для анализа")
-        
-        st.success(f"✅ Данные успешно загружены! Размер: {df.shape[0]} строк × {df.shape[1]} столбцов")
+        data_shape = profile.shape if profile is not None else df.shape
+        status_text.text(f"✅ Готово: {data_shape[0]} строк × {data_shape[1]} столбцов | Выберите вкладку для анализа")
+        
+        st.success(f"✅ Данные успешно загружены! Размер: {data_shape[0]} строк × {data_shape[1]} столбцов")
+        if profile is not None:
+            st.info(f"ℹ️ Режим больших файлов: статистика посчитана по всему файлу, графики строятся по случайной выборке из {len(df):,} строк.")
+            if profile.text_cols:
+                text_cols = sorted(map(str, profile.text_cols))
+                st.warning(f"⚠️ Колонки, в которых после первой части файла встречается текст, разобраны как категориальные: "
+                           f"{', '.join(text_cols[:10])}{', ...' if len(text_cols) > 10 else ''}")
+        
+        # Экономия памяти от хранения строковых колонок как category
+        category_encoding = df.attrs.get('category_encoding')
+        if category_encoding:
+            memory_before = sum(before for before, _ in category_encoding.values()) / 1024 ** 2
+            memory_after = sum(after for _, after in category_encoding.values()) / 1024 ** 2
+            st.info(f"🗜️ Строковых колонок в категориальном типе: {len(category_encoding)} "
+                    f"({', '.join(map(str, list(category_encoding)[:10]))}{', ...' if len(category_encoding) > 10 else ''}). Память: {memory_before:.1f} МБ → {memory_after:.1f} МБ "
+                    f"(сэкономлено {memory_before - memory_after:.1f} МБ)")
+        
+        # Сообщаем о строках, пропущенных парсером (неверное число полей)
+        bad_lines = df.attrs.get('bad_lines_skipped', 0)
+        if bad_lines:
+            st.warning(f"⚠️ При загрузке пропущено некорректных строк: {bad_lines:,}")
         
         # Экспорт отчета
         st.sidebar.markdown("---")
@@ -229,170 +322,9 @@ if uploaded_file is not None or use_example_data:
                    f"Статистические расчеты выполняются на полном датасете.")
         
         # Основной контент
-        # ОПТИМИЗАЦИЯ: Выполняем код только для активной вкладки
-        # Определяем активную вкладку по ключам виджетов, которые были изменены
-        
-        # Инициализируем session_state
-        if 'last_active_tab' not in st.session_state:
-            st.session_state.last_active_tab = -1
-        if 'tabs_initialized' not in st.session_state:
-            st.session_state.tabs_initialized = False
-        if 'widget_values' not in st.session_state:
-            st.session_state.widget_values = {}
-        
-        # Флаги для статичных вкладок (выполняются только 1 раз)
-        # Вкладки 0, 1, 5 - статичные (без интерактивных графиков)
-        # Вкладки 2, 3, 4, 6 - интерактивные (с виджетами для изменения графиков)
-        static_tabs = {0, 1, 5}  # Обзор, Пропущенные значения, Гипотезы
-        interactive_tabs = {2, 3, 4, 6}  # Распределения, Выбросы, Корреляции, Визуализации
-        
-        # Флаги для статичных вкладок больше не нужны - они всегда выполняются
-        # (тяжелые операции внутри них кэшируются через @st.cache_data)
-        
-        # Маппинг ключей виджетов на индексы вкладок
-        widget_to_tab = {
-            'dist_col': 2,             # Распределения
-            'show_advanced_dist': 2,  # Распределения
-            'outlier': 3,              # Выбросы
-            'scatter': 3,              # Выбросы
-            'scatter_display_mode': 3, # Выбросы
-            'group': 4,                # Корреляции
-            'num_group': 4,            # Корреляции
-            'scatter_x': 6,            # Визуализации
-            'scatter_y': 6,            # Визуализации
-            'scatter_hue': 6,          # Визуализации
-            'build_matrix': 6,         # Визуализации
-            'violin_cat': 6,           # Визуализации
-            'violin_num': 6            # Визуализации
-        }
-        
-        # ПРИОРИТЕТ 1: Проверяем query_params для переключения вкладок (самый высокий приоритет)
-        query_params = st.query_params
-        active_tab_index = None
-        if 'tab' in query_params:
-            try:
-                tab_value = query_params['tab']
-                if isinstance(tab_value, list) and len(tab_value) > 0:
-                    tab_index = int(tab_value[0])
-                elif isinstance(tab_value, str):
-                    tab_index = int(tab_value)
-                else:
-                    tab_index = None
-                
-                if tab_index is not None and 0 <= tab_index <= 6:
-                    active_tab_index = tab_index
-            except (ValueError, IndexError, TypeError, AttributeError):
-                pass
-        
-        # ПРИОРИТЕТ 2: Если query_params нет, определяем по последнему измененному виджету
-        # НО: если пользователь переключился на статичную вкладку, она должна быть активна
-        if active_tab_index is None:
-            # Сначала проверяем, не переключился ли пользователь на статичную вкладку
-            # (определяем по изменению last_active_tab, если он был установлен ранее)
-            if st.session_state.last_active_tab != -1:
-                # Если last_active_tab указывает на статичную вкладку, используем её
-                if st.session_state.last_active_tab in static_tabs:
-                    active_tab_index = st.session_state.last_active_tab
-                else:
-                    # Иначе определяем по виджетам
-                    active_tab_index = st.session_state.last_active_tab
-            else:
-                active_tab_index = 0
-            
-            # Проверяем, какие виджеты были изменены (сравниваем текущие значения с предыдущими)
-            # Важно: проверяем в обратном порядке, чтобы последний измененный виджет имел приоритет
-            # НО: если активная вкладка статичная, не переопределяем её по виджетам
-            widget_changed_tab = None
-            for widget_key, tab_idx in reversed(list(widget_to_tab.items())):
-                if widget_key in st.session_state:
-                    current_value = st.session_state[widget_key]
-                    previous_value = st.session_state.widget_values.get(widget_key, None)
-                    
-                    # Если значение изменилось, значит эта вкладка активна
-                    if previous_value is None or current_value != previous_value:
-                        widget_changed_tab = tab_idx
-                        st.session_state.widget_values[widget_key] = current_value
-                        break  # Берем последний измененный виджет
-            
-            # Используем вкладку из виджета только если текущая активная вкладка не статичная
-            # или если мы не знаем, какая вкладка активна
-            if widget_changed_tab is not None and active_tab_index not in static_tabs:
-                active_tab_index = widget_changed_tab
-        
-        # Определяем, изменилась ли активная вкладка
-        tab_changed = st.session_state.last_active_tab != active_tab_index
-        
-        # Определяем, нужно ли обрабатывать вкладки:
-        # - Статичные вкладки: только если еще не обработаны
-        # - Интерактивные вкладки: если они активны или их виджеты изменились
-        # - При первом запуске: обрабатываем все вкладки
-        should_render_all = not st.session_state.tabs_initialized or tab_changed
-        
-        # Определяем, нужно ли обрабатывать конкретную вкладку
-        def should_render_tab(tab_idx):
-            if tab_idx in static_tabs:
-                # Статичная вкладка:
-                # - Всегда выполняется, если она активна (определяется по query_params или active_tab_index)
-                # - Или если еще не обработана (при первом запуске)
-                # - НЕ выполняется, если она неактивна и уже обработана (оптимизация)
-                flag_name = f'tab_{tab_idx}_rendered'
-                is_rendered = st.session_state.get(flag_name, False)
-                is_active = active_tab_index == tab_idx
-                
-                # Проверяем также query_params напрямую (на случай, если active_tab_index еще не обновился)
-                is_active_by_url = False
-                if 'tab' in query_params:
-                    try:
-                        tab_value = query_params['tab']
-                        if isinstance(tab_value, list) and len(tab_value) > 0:
-                            url_tab = int(tab_value[0])
-                        elif isinstance(tab_value, str):
-                            url_tab = int(tab_value)
-                        else:
-                            url_tab = None
-                        if url_tab == tab_idx:
-                            is_active_by_url = True
-                    except (ValueError, IndexError, TypeError, AttributeError):
-                        pass
-                
-                # Если вкладка активна (по любому признаку) - всегда выполняем
-                if is_active or is_active_by_url:
-                    return True
-                # Если вкладка неактивна, но еще не обработана - выполняем
-                if not is_rendered:
-                    return True
-                # Если вкладка неактивна и уже обработана - не выполняем (оптимизация)
-                return False
-            elif tab_idx in interactive_tabs:
-                # Интерактивная вкладка - если она активна или при первом запуске
-                return should_render_all or active_tab_index == tab_idx
-            else:
-                # По умолчанию - как раньше
-                return should_render_all or active_tab_index == tab_idx
-        
-        # Отладочная информация в sidebar
-        with st.sidebar.expander("🔧 Отладка вкладок", expanded=False):
-            st.write(f"**Активная вкладка:** {active_tab_index}")
-            st.write(f"**Последняя вкладка:** {st.session_state.last_active_tab}")
-            st.write(f"**Вкладка изменилась:** {tab_changed}")
-            st.write(f"**Обрабатывать все:** {should_render_all}")
-            st.write(f"**Инициализировано:** {st.session_state.tabs_initialized}")
-            query_params = st.query_params
-            if 'tab' in query_params:
-                st.write(f"**URL параметр tab:** {query_params.get('tab')}")
-            else:
-                st.write(f"**URL параметр tab:** отсутствует")
-            if 'widget_values' in st.session_state:
-                st.write(f"**Измененные виджеты:** {list(st.session_state.widget_values.keys())}")
-            st.write("**Статичные вкладки:** Всегда выполняются (легкие операции)")
-            st.write("**Интерактивные вкладки:** Выполняются только при активности")
-        
-        # Обновляем состояние
-        if tab_changed or not st.session_state.tabs_initialized:
-            st.session_state.last_active_tab = active_tab_index
-            st.session_state.tabs_initialized = True
-        
-        tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
+        # Ленивые вкладки: при переключении выполняется только выбранная вкладка,
+        # а виджеты внутри вкладки перезапускают только ее фрагмент (@st.fragment)
+        tab_labels = [
             "📋 Обзор данных",
             "❌ Пропущенные значения",
             "📈 Распределения",
@@ -400,371 +332,122 @@ if uploaded_file is not None or use_example_data:
             "🔗 Корреляции",
             "🎯 Гипотезы",
             "📊 Визуализации"
-        ])
-        
-        # JavaScript для управления вкладками и URL
-        st.markdown(f"""
-        <script>
-            (function() {{
-                // Функция для обновления URL с параметром tab
-                function updateURL(tabIndex) {{
-                    try {{
-                        const currentUrl = window.location.href;
-                        const baseUrl = currentUrl.split('?')[0];
-                        const newUrl = baseUrl + '?tab=' + tabIndex;
-                        window.history.replaceState({{}}, '', newUrl);
-                        console.log('URL updated to tab=' + tabIndex);
-                    }} catch (e) {{
-                        console.error('Error updating URL:', e);
-                        // Fallback: используем более простой метод
-                        const newUrl = window.location.pathname + '?tab=' + tabIndex;
-                        window.history.replaceState({{}}, '', newUrl);
-                    }}
-                }}
-                
-                // Функция для получения текущей активной вкладки
-                function getCurrentTabIndex() {{
-                    // Пробуем разные селекторы для определения активной вкладки
-                    const selectors = [
-                        'button[data-baseweb="tab"][aria-selected="true"]',
-                        '[role="tab"][aria-selected="true"]',
-                        '.stTabs [role="tablist"] button[aria-selected="true"]',
-                        '.stTabs button[aria-selected="true"]'
-                    ];
-                    
-                    for (let selector of selectors) {{
-                        const activeTab = document.querySelector(selector);
-                        if (activeTab) {{
-                            // Находим индекс среди всех вкладок
-                            const baseSelector = selector.replace('[aria-selected="true"]', '');
-                            const allTabs = document.querySelectorAll(baseSelector);
-                            
-                            for (let i = 0; i < allTabs.length; i++) {{
-                                if (allTabs[i] === activeTab) {{
-                                    console.log('getCurrentTabIndex: found tab', i, 'using selector:', selector);
-                                    return i;
-                                }}
-                            }}
-                        }}
-                    }}
-                    
-                    // Альтернативный метод: ищем по классу stTabsActive или другим признакам
-                    const tabsByClass = document.querySelectorAll('.stTabs button, [role="tab"]');
-                    for (let i = 0; i < tabsByClass.length; i++) {{
-                        const ariaSelected = tabsByClass[i].getAttribute('aria-selected');
-                        if (ariaSelected === 'true') {{
-                            console.log('getCurrentTabIndex: found tab', i, 'by aria-selected');
-                            return i;
-                        }}
-                    }}
-                    
-                    console.log('getCurrentTabIndex: could not find active tab, returning -1');
-                    return -1;
-                }}
-                
-                // Функция для переключения на нужную вкладку
-                function switchToTab(tabIndex) {{
-                    const selectors = [
-                        'button[data-baseweb="tab"]',
-                        '[role="tab"]',
-                        '.stTabs [role="tablist"] button',
-                        '.stTabs button'
-                    ];
-                    
-                    for (let selector of selectors) {{
-                        const tabs = document.querySelectorAll(selector);
-                        if (tabs.length > tabIndex) {{
-                            const targetTab = tabs[tabIndex];
-                            if (targetTab) {{
-                                const currentIndex = getCurrentTabIndex();
-                                if (currentIndex !== tabIndex) {{
-                                    targetTab.click();
-                                    updateURL(tabIndex);
-                                    return true;
-                                }} else {{
-                                    // Вкладка уже активна, просто обновляем URL
-                                    updateURL(tabIndex);
-                                    return true;
-                                }}
-                            }}
-                        }}
-                    }}
-                    return false;
-                }}
-                
-                // Отслеживаем изменения активной вкладки и обновляем URL
-                function setupTabMonitoring() {{
-                    let lastTabIndex = -1;
-                    
-                    // Функция для проверки и обновления URL
-                    function checkAndUpdateTab() {{
-                        const currentIndex = getCurrentTabIndex();
-                        const urlParams = new URLSearchParams(window.location.search);
-                        const urlTabIndex = urlParams.get('tab');
-                        
-                        // Если вкладка изменилась или URL не соответствует активной вкладке
-                        if (currentIndex !== lastTabIndex || urlTabIndex !== String(currentIndex)) {{
-                            lastTabIndex = currentIndex;
-                            updateURL(currentIndex);
-                        }}
-                    }}
-                    
-                    // Используем MutationObserver для отслеживания изменений
-                    const observer = new MutationObserver(function(mutations) {{
-                        checkAndUpdateTab();
-                    }});
-                    
-                    // Наблюдаем за изменениями в контейнере вкладок
-                    const tabContainer = document.querySelector('.stTabs') || 
-                                       document.querySelector('[role="tablist"]') ||
-                                       document.body;
-                    
-                    if (tabContainer) {{
-                        observer.observe(tabContainer, {{
-                            attributes: true,
-                            attributeFilter: ['aria-selected', 'class', 'data-testid'],
-                            childList: false,
-                            subtree: true
-                        }});
-                    }}
-                    
-                    // Также отслеживаем клики напрямую
-                    function attachTabClickListeners() {{
-                        const selectors = [
-                            'button[data-baseweb="tab"]',
-                            '[role="tab"]',
-                            '.stTabs [role="tablist"] button',
-                            '.stTabs button'
-                        ];
-                        
-                        for (let selector of selectors) {{
-                            const tabs = document.querySelectorAll(selector);
-                            tabs.forEach((tab, index) => {{
-                                // Удаляем старые обработчики, если есть
-                                if (tab.dataset.listenerAttached === 'true') {{
-                                    return; // Уже прикреплен
-                                }}
-                                tab.dataset.listenerAttached = 'true';
-                                
-                                // Добавляем новый обработчик
-                                tab.addEventListener('click', function(e) {{
-                                    e.stopPropagation();
-                                    console.log('Tab clicked:', index);
-                                    // Обновляем URL СРАЗУ при клике (до rerun Streamlit)
-                                    updateURL(index);
-                                    // Дополнительная проверка через небольшую задержку
-                                    setTimeout(function() {{
-                                        checkAndUpdateTab();
-                                    }}, 50);
-                                }}, true);  // Используем capture phase для более раннего срабатывания
-                            }});
-                        }}
-                    }}
-                    
-                    // Прикрепляем обработчики сразу и периодически (на случай динамического обновления DOM)
-                    attachTabClickListeners();
-                    setInterval(attachTabClickListeners, 1000);
-                    
-                    // Периодическая проверка (на случай, если MutationObserver не сработал)
-                    setInterval(checkAndUpdateTab, 300);
-                    
-                    // Первая проверка сразу (несколько попыток для надежности)
-                    setTimeout(checkAndUpdateTab, 100);
-                    setTimeout(checkAndUpdateTab, 300);
-                    setTimeout(checkAndUpdateTab, 500);
-                    setTimeout(checkAndUpdateTab, 1000);
-                }}
-                
-                // Инициализация
-                const targetTabIndex = {active_tab_index};
-                
-                // Устанавливаем мониторинг вкладок
-                setupTabMonitoring();
-                
-                // Функция для первоначальной установки URL
-                function initializeTabURL() {{
-                    const currentIndex = getCurrentTabIndex();
-                    if (currentIndex >= 0) {{
-                        updateURL(currentIndex);
-                        console.log('initializeTabURL: set URL to tab', currentIndex, 'from active tab');
-                    }} else {{
-                        // Если не удалось определить, используем значение из URL или 0
-                        const urlParams = new URLSearchParams(window.location.search);
-                        const urlTabIndex = urlParams.get('tab');
-                        if (urlTabIndex !== null) {{
-                            const tabNum = parseInt(urlTabIndex);
-                            updateURL(tabNum);
-                            console.log('initializeTabURL: set URL to tab', tabNum, 'from URL param');
-                        }} else {{
-                            updateURL(0);
-                            console.log('initializeTabURL: set URL to tab 0 (default)');
-                        }}
-                    }}
-                }}
-                
-                // Обновляем URL сразу при загрузке (несколько попыток для надежности)
-                setTimeout(initializeTabURL, 50);
-                setTimeout(initializeTabURL, 150);
-                setTimeout(initializeTabURL, 300);
-                setTimeout(initializeTabURL, 500);
-                setTimeout(initializeTabURL, 1000);
-                
-                // Если нужно переключиться на другую вкладку при загрузке
-                if (targetTabIndex > 0) {{
-                    let attempts = 0;
-                    const maxAttempts = 25;
-                    
-                    const trySwitch = function() {{
-                        attempts++;
-                        const currentIndex = getCurrentTabIndex();
-                        
-                        if (currentIndex === targetTabIndex) {{
-                            // Уже на нужной вкладке
-                            updateURL(targetTabIndex);
-                            clearInterval(interval);
-                            return;
-                        }}
-                        
-                        if (switchToTab(targetTabIndex) || attempts >= maxAttempts) {{
-                            clearInterval(interval);
-                            // Обновляем URL после переключения
-                            setTimeout(function() {{
-                                const finalIndex = getCurrentTabIndex();
-                                if (finalIndex >= 0) {{
-                                    updateURL(finalIndex);
-                                }} else {{
-                                    updateURL(targetTabIndex);
-                                }}
-                            }}, 200);
-                        }}
-                    }};
-                    
-                    // Первая попытка сразу
-                    setTimeout(trySwitch, 150);
-                    
-                    // Дополнительные попытки с задержкой
-                    const interval = setInterval(trySwitch, 100);
-                }}
-            }})();
-        </script>
-        """, unsafe_allow_html=True)
-        
-        # ========== ВКЛАДКА 1: ОБЗОР ДАННЫХ (СТАТИЧНАЯ) ==========
+        ]
+        # Активная вкладка хранится в session_state и синхронизируется с параметром URL ?tab=;
+        # выполняется только выбранная вкладка
+        tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(tab_labels, key="tab", on_change="rerun",
+                                                           bind="query-params")
+        
+        # ========== ВКЛАДКА 1: ОБЗОР ДАННЫХ ==========
         with tab1:
-            # Статичные вкладки всегда выполняются (легкие, тяжелые операции кэшируются)
-            render_overview_tab(df, numeric_cols, categorical_cols)
+            if tab1.open:
+                render_overview_tab(df, numeric_cols, categorical_cols, dataset_id)
         
-        # ========== ВКЛАДКА 2: ПРОПУЩЕННЫЕ ЗНАЧЕНИЯ (СТАТИЧНАЯ) ==========
+        # ========== ВКЛАДКА 2: ПРОПУЩЕННЫЕ ЗНАЧЕНИЯ ==========
         with tab2:
-            # Статичные вкладки всегда выполняются (легкие, тяжелые операции кэшируются)
-            render_missing_tab(df)
+            if tab2.open:
+                render_missing_tab(df, dataset_id)
         
-        # ========== ВКЛАДКА 3: РАСПРЕДЕЛЕНИЯ (ИНТЕРАКТИВНАЯ) ==========
+        # ========== ВКЛАДКА 3: РАСПРЕДЕЛЕНИЯ ==========
         with tab3:
-            # Все вкладки всегда выполняются (тяжелые операции кэшируются)
-            render_distributions_tab(df, numeric_cols, categorical_cols)
+            if tab3.open:
+                render_distributions_tab(df, numeric_cols, categorical_cols, dataset_id)
         
-        # ========== ВКЛАДКА 4: ВЫБРОСЫ (ИНТЕРАКТИВНАЯ) ==========
+        # ========== ВКЛАДКА 4: ВЫБРОСЫ ==========
         with tab4:
-            # Все вкладки всегда выполняются (тяжелые операции кэшируются)
-            render_outliers_tab(df, numeric_cols, max_plot_points, use_sampling)
+            if tab4.open:
+                render_outliers_tab(df, numeric_cols, max_plot_points, use_sampling, density_scatter, dataset_id)
         
-        # ========== ВКЛАДКА 5: КОРРЕЛЯЦИИ (ИНТЕРАКТИВНАЯ) ==========
+        # ========== ВКЛАДКА 5: КОРРЕЛЯЦИИ ==========
         with tab5:
-            # Все вкладки всегда выполняются (тяжелые операции кэшируются)
-            render_correlations_tab(df, numeric_cols, categorical_cols)
+            if tab5.open:
+                render_correlations_tab(df, numeric_cols, categorical_cols, dataset_id)
         
-        # ========== ВКЛАДКА 6: ГИПОТЕЗЫ (СТАТИЧНАЯ) ==========
+        # ========== ВКЛАДКА 6: ГИПОТЕЗЫ ==========
         with tab6:
-            # Статичные вкладки всегда выполняются (тяжелые операции кэшируются)
-            render_hypotheses_tab(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling)
+            if tab6.open:
+                render_hypotheses_tab(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling, density_scatter, frame_id)
         
-        # ========== ВКЛАДКА 7: ДОПОЛНИТЕЛЬНЫЕ ВИЗУАЛИЗАЦИИ (ИНТЕРАКТИВНАЯ) ==========
+        # ========== ВКЛАДКА 7: ДОПОЛНИТЕЛЬНЫЕ ВИЗУАЛИЗАЦИИ ==========
         with tab7:
-            # Все вкладки всегда выполняются (тяжелые операции кэшируются)
-            render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling)
+            if tab7.open:
+                render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling, density_scatter, frame_id)
         
         # Обновляем финальный статус после обработки всех вкладок
-        status_text.text(f"✅ Готово: {df.shape[0]} строк × {df.shape[1]} столбцов | Анализ завершен")
+        status_text.text(f"✅ Готово: {data_shape[0]} строк × {data_shape[1]} столбцов | Анализ завершен")
         
         # Экспорт отчета
         st.sidebar.markdown("---")
         st.sidebar.subheader("📤 Экспорт отчета")
         
-        # Подготовка данных для экспорта
-        from utils import generate_html_report, generate_pdf_report, compute_correlation_matrix
-        from tabs.tab6_hypotheses import _compute_hypotheses_data
+        if profile is not None:
+            st.sidebar.info("Экспорт отчета недоступен в режиме больших файлов")
+            st.stop()
         
-        # Вычисляем данные для отчета
-        correlation_matrix = compute_correlation_matrix(df, numeric_cols) if len(numeric_cols) > 1 else None
+        # Отчеты собираются по кнопке в фоновом потоке, результат кэшируется по датасету и параметрам
+        from utils import REPORT_FORMATS, get_report_job, start_report_job
+        from tabs.tab6_hypotheses import _compute_hypotheses_data
         
-        # VIF данные (упрощенная версия для экспорта)
-        vif_data = None
-        if len(numeric_cols) >= 2:
-            try:
-                from statsmodels.stats.outliers_influence import variance_inflation_factor
-                from statsmodels.tools.tools import add_constant
-                df_vif = df[numeric_cols].dropna()
-                if len(df_vif) > len(numeric_cols):
-                    X = add_constant(df_vif)
-                    vif_data = []
-                    for i, col in enumerate(numeric_cols):
+        report_options = (tuple(numeric_cols), tuple(categorical_cols), target_col, max_plot_points, use_sampling, density_scatter)
+        report_keys = {report_format: (dataset_id, report_format, *report_options) for report_format in REPORT_FORMATS}
+        reports_running = any(job is not None and job.running for job in map(get_report_job, report_keys.values()))
+        
+        def get_hypotheses_export():
+            """Гипотезы для экспорта (графики - описаниями, рисуются при сборке отчета)"""
+            hypotheses_full = _compute_hypotheses_data(frame_id, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling,
+                                                       density_scatter)
+            if not hypotheses_full:
+                return None
+            hypotheses_export = []
+            for hyp in hypotheses_full:
+                hyp_export = {
+                    'Гипотеза': hyp.get('Гипотеза', ''),
+                    'Обоснование': hyp.get('Обоснование', ''),
+                    'Метод проверки': hyp.get('Метод проверки', ''),
+                }
+                if 'statistical_test' in hyp:
+                    hyp_export['statistical_test'] = hyp['statistical_test']
+                if hyp.get('plot') is not None:
+                    hyp_export['plot'], hyp_export['plot_key'] = hyp['plot'], hyp['plot_key']
+                hypotheses_export.append(hyp_export)
+            return hypotheses_export
+        
+        def render_report_export():
+            """Кнопки сборки, прогресс и скачивание отчетов"""
+            for report_format, report_spec in REPORT_FORMATS.items():
+                label = report_spec['label']
+                job = get_report_job(report_keys[report_format])
+                if job is None or job.error is not None:
+                    if job is not None:
+                        st.error(f"Ошибка генерации {label}: {job.error}")
+                    if st.button(f"⚙️ Собрать {label}", key=f"build_report_{report_format}", use_container_width=True):
                         try:
-                            vif = variance_inflation_factor(X.values, i + 1)
-                            vif_data.append({
-                                'Признак': col,
-                                'VIF': f"{vif:.2f}",
-                                'Оценка': 'Сильная' if vif >= 10 else ('Умеренная' if vif >= 5 else 'Слабая')
-                            })
-                        except:
-                            pass
-            except:
-                pass
-        
-        # Гипотезы для экспорта (без графиков)
-        hypotheses_export = None
-        try:
-            hypotheses_full = _compute_hypotheses_data(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling)
-            if hypotheses_full:
-                hypotheses_export = []
-                for hyp in hypotheses_full:
-                    hyp_export = {
-                        'Гипотеза': hyp.get('Гипотеза', ''),
-                        'Обоснование': hyp.get('Обоснование', ''),
-                        'Метод проверки': hyp.get('Метод проверки', ''),
-                    }
-                    if 'statistical_test' in hyp:
-                        hyp_export['statistical_test'] = hyp['statistical_test']
-                    hypotheses_export.append(hyp_export)
-        except:
-            pass
-        
-        # Кнопки экспорта
-        col1, col2 = st.sidebar.columns(2)
-        with col1:
-            html_report = generate_html_report(df, numeric_cols, categorical_cols, target_col, 
-                                              correlation_matrix, vif_data, hypotheses_export)
-            st.sidebar.download_button(
-                label="📄 Скачать HTML",
-                data=html_report,
-                file_name=f"eda_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.html",
-                mime="text/html",
-                use_container_width=True
-            )
-        
-        with col2:
-            try:
-                pdf_report = generate_pdf_report(df, numeric_cols, categorical_cols, target_col,
-                                               correlation_matrix, vif_data, hypotheses_export)
-                st.sidebar.download_button(
-                    label="📑 Скачать PDF",
-                    data=pdf_report,
-                    file_name=f"eda_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                    mime="application/pdf",
-                    use_container_width=True
-                )
-            except Exception as e:
-                st.sidebar.error(f"Ошибка генерации PDF: {str(e)}")
+                            hypotheses_export = get_hypotheses_export()
+                        except Exception:
+                            hypotheses_export = None
+                        start_report_job(report_keys[report_format], dataset_id, report_format,
+                                         numeric_cols, categorical_cols, target_col, hypotheses_export)
+                        # Полный перезапуск включает опрос прогресса
+                        st.rerun()
+                elif job.running:
+                    st.progress(job.progress, text=f"{label}: {job.stage}...")
+                else:
+                    st.download_button(
+                        label=f"{report_spec['icon']} Скачать {label}",
+                        data=job.result,
+                        file_name=f"eda_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.{report_format}",
+                        mime=report_spec['mime'],
+                        key=f"download_report_{report_format}",
+                        use_container_width=True
+                    )
+            # Сборка завершилась - полный перезапуск отключает опрос
+            if reports_running and not any(job is not None and job.running
+                                           for job in map(get_report_job, report_keys.values())):
+                st.rerun()
+        
+        # Пока идет сборка, панель экспорта обновляется раз в секунду отдельно от остального приложения
+        with st.sidebar:
+            st.fragment(render_report_export, run_every=1 if reports_running else None)()
     
     else:
         st.info("👆 Пожалуйста, загрузите CSV файл в боковой панели для начала анализа")
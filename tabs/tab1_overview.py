@@ -6,8 +6,10 @@ import pandas as pd
 import numpy as np
 
 
-def render_overview_tab(df, numeric_cols, categorical_cols):
+def render_overview_tab(df, numeric_cols, categorical_cols, dataset_id):
     """Отображает вкладку обзора данных"""
+    from utils import compute_basic_stats, compute_value_counts, compute_column_profiles, profile_series, get_dataset
+    
     # Устанавливаем флаг активной вкладки для изоляции
     st.session_state.current_active_tab = 0
     
@@ -17,36 +19,42 @@ def render_overview_tab(df, numeric_cols, categorical_cols):
     
     st.header("1. Обзор структуры данных")
     
+    # В потоковом режиме статистика берется из профиля, df - только выборка строк
+    stats_source = get_dataset(dataset_id)
+    profiles = compute_column_profiles(dataset_id)
+    missing = profile_series(profiles, 'null_count')
+    nunique = profile_series(profiles, 'nunique')
+    
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Число строк", df.shape[0])
+        st.metric("Число строк", stats_source.shape[0])
     with col2:
-        st.metric("Число столбцов", df.shape[1])
+        st.metric("Число столбцов", stats_source.shape[1])
     with col3:
-        st.metric("Общее значений", df.size)
+        st.metric("Общее значений", stats_source.size)
     with col4:
-        st.metric("Пропусков", df.isnull().sum().sum())
+        st.metric("Пропусков", missing.sum())
     
     st.subheader("Информация о данных")
     st.dataframe(pd.DataFrame({
-        'Тип данных': df.dtypes.astype(str),
-        'Пропущено': df.isnull().sum(),
-        'Процент пропусков': (df.isnull().sum() / len(df) * 100).round(2),
-        'Уникальных значений': [df[col].nunique() for col in df.columns]
+        'Тип данных': profile_series(profiles, 'dtype'),
+        'Пропущено': missing,
+        'Процент пропусков': profile_series(profiles, 'null_pct').round(2),
+        'Уникальных значений': nunique
     }), use_container_width=True)
     
     st.subheader("Первые строки")
-    st.dataframe(df.head(10), use_container_width=True)
+    st.dataframe(stats_source.head(10), use_container_width=True)
     
     st.subheader("Последние строки")
-    st.dataframe(df.tail(10), use_container_width=True)
+    st.dataframe(stats_source.tail(10), use_container_width=True)
     
     if numeric_cols:
         st.subheader("Базовая статистика (числовые признаки)")
-        st.dataframe(df[numeric_cols].describe(), use_container_width=True)
+        st.dataframe(compute_basic_stats(dataset_id, numeric_cols), use_container_width=True)
     
     if categorical_cols:
         st.subheader("Уникальные значения (категориальные признаки)")
         for col in categorical_cols[:5]:  # Показываем первые 5
-            st.write(f"**{col}**: {df[col].nunique()} уникальных значений")
-            st.write(df[col].value_counts().head(10))
+            st.write(f"**{col}**: {nunique[col]:.0f} уникальных значений")
+            st.write(compute_value_counts(dataset_id, col, 10))
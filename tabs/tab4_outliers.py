@@ -4,11 +4,11 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import seaborn as sns
-from utils import sample_data_for_plotting
+from utils import plot_sample_positions, use_density_scatter, show_plot, compute_binned_column, OUTLIER_METHODS, MULTIVARIATE_METHODS, TOP_ANOMALIES_N
 
 
-def render_outliers_tab(df, numeric_cols, max_plot_points, use_sampling):
+@st.fragment
+def render_outliers_tab(df, numeric_cols, max_plot_points, use_sampling, density_scatter, dataset_id):
     """Отображает вкладку анализа выбросов"""
     # Устанавливаем флаг активной вкладки для изоляции
     st.session_state.current_active_tab = 3
@@ -20,23 +20,42 @@ def render_outliers_tab(df, numeric_cols, max_plot_points, use_sampling):
     st.header("4. Выявление выбросов")
     
     if numeric_cols:
+        if len(numeric_cols) > 1:
+            outlier_mode = st.radio("Режим анализа", ["Один признак", "Несколько признаков"], horizontal=True,
+                                    key="outlier_mode")
+            if outlier_mode == "Несколько признаков":
+                _render_multivariate_outliers(df, numeric_cols, dataset_id)
+                return
+        
+        outlier_method = st.radio("Метод поиска выбросов", list(OUTLIER_METHODS), format_func=OUTLIER_METHODS.get,
+                                  horizontal=True, key="outlier_method")
         selected_outlier_col = st.selectbox("Выберите признак для анализа выбросов", numeric_cols, key="outlier")
         
         if selected_outlier_col:
-            from utils import compute_outliers
+            from utils import compute_outlier_table, compute_column_profiles, get_dataset
             
-            # Используем кэшированную функцию
-            Q1, Q3, IQR, lower_bound, upper_bound, outliers = compute_outliers(df, selected_outlier_col)
-            outliers_count = len(outliers)
-            outliers_percent = (outliers_count / len(df)) * 100
+            # Выбросы всех колонок считаются одним проходом и кэшируются (в потоковом режиме - проход по файлу)
+            stats_source = get_dataset(dataset_id)
+            outlier_table = compute_outlier_table(dataset_id, outlier_method)
+            lower_bound, upper_bound = outlier_table.bounds(selected_outlier_col)
+            outliers_count = int(outlier_table.count(selected_outlier_col))
+            outliers_percent = (outliers_count / len(stats_source)) * 100
             
             col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.metric("Q1", f"{Q1:.2f}")
-            with col2:
-                st.metric("Q3", f"{Q3:.2f}")
-            with col3:
-                st.metric("IQR", f"{IQR:.2f}")
+            if outlier_method == 'iqr':
+                col_profile = compute_column_profiles(dataset_id)[selected_outlier_col]
+                Q1, Q3 = col_profile.q25, col_profile.q75
+                with col1:
+                    st.metric("Q1", f"{Q1:.2f}")
+                with col2:
+                    st.metric("Q3", f"{Q3:.2f}")
+                with col3:
+                    st.metric("IQR", f"{Q3 - Q1:.2f}")
+            else:
+                with col1:
+                    st.metric("Нижняя граница", f"{lower_bound:.2f}")
+                with col2:
+                    st.metric("Верхняя граница", f"{upper_bound:.2f}")
             with col4:
                 st.metric("Выбросов", f"{outliers_count} ({outliers_percent:.2f}%)")
             
@@ -45,17 +64,24 @@ def render_outliers_tab(df, numeric_cols, max_plot_points, use_sampling):
             with col1:
                 # Boxplot с выбросами
                 with st.spinner("Построение boxplot..."):
-                    fig, ax = plt.subplots(figsize=(8, 5))  # Уменьшаем размер
-                    sns.boxplot(y=df[selected_outlier_col], ax=ax, color='lightblue')
-                    ax.axhline(lower_bound, color='red', linestyle='--', alpha=0.5, label=f'Нижняя: {lower_bound:.2f}')
-                    ax.axhline(upper_bound, color='red', linestyle='--', alpha=0.5, label=f'Верхняя: {upper_bound:.2f}')
-                    ax.set_title(f'Выбросы в {selected_outlier_col}', fontsize=10, fontweight='bold')
-                    ax.set_ylabel('Значение', fontsize=9)
-                    ax.legend(fontsize=8)
-                    ax.grid(alpha=0.3, axis='y')
-                    plt.tight_layout()
-                    st.pyplot(fig, use_container_width=True)
-                    plt.close(fig)
+                    # Квартили, усы и выбросы - по всем строкам из общей раскладки колонки по бинам
+                    binned = compute_binned_column(dataset_id, selected_outlier_col)
+                    
+                    def draw_box():
+                        fig, ax = plt.subplots(figsize=(8, 5))  # Уменьшаем размер
+                        if binned is not None:
+                            ax.bxp([binned.box()], patch_artist=True, boxprops={'facecolor': 'lightblue'},
+                                   medianprops={'color': 'black'}, flierprops={'marker': 'd', 'markersize': 4})
+                        ax.set_xticks([])
+                        ax.axhline(lower_bound, color='red', linestyle='--', alpha=0.5, label=f'Нижняя: {lower_bound:.2f}')
+                        ax.axhline(upper_bound, color='red', linestyle='--', alpha=0.5, label=f'Верхняя: {upper_bound:.2f}')
+                        ax.set_title(f'Выбросы в {selected_outlier_col}', fontsize=10, fontweight='bold')
+                        ax.set_ylabel('Значение', fontsize=9)
+                        ax.legend(fontsize=8)
+                        ax.grid(alpha=0.3, axis='y')
+                        plt.tight_layout()
+                        return fig
+                    show_plot(dataset_id, ('outlier_box', selected_outlier_col, outlier_method), draw_box)
             
             with col2:
                 # Scatterplot (если есть другой числовой признак)
@@ -73,40 +99,141 @@ def render_outliers_tab(df, numeric_cols, max_plot_points, use_sampling):
                     )
                     
                     with st.spinner("Построение scatter plot..."):
-                        fig, ax = plt.subplots(figsize=(8, 5))  # Уменьшаем размер
+                        def draw_scatter():
+                            fig, ax = plt.subplots(figsize=(8, 5))  # Уменьшаем размер
                         
-                        # Определяем выбросы для выбранного признака
-                        is_outlier = (df[selected_outlier_col] < lower_bound) | (df[selected_outlier_col] > upper_bound)
+                            if use_density_scatter(len(stats_source), max_plot_points, density_scatter):
+                                # Все строки как плотность вместо выборки - редкие точки не теряются
+                                _draw_outlier_density(ax, dataset_id, other_col, selected_outlier_col,
+                                                      lower_bound, upper_bound, display_mode)
+                            else:
+                                # Готовая маска выбросов, а для выборки больших файлов - сравнение с границами
+                                if stats_source is df:
+                                    is_outlier = outlier_table.mask(selected_outlier_col)
+                                else:
+                                    is_outlier = ((df[selected_outlier_col] < lower_bound) | (df[selected_outlier_col] > upper_bound)).to_numpy()
                         
-                        # Разделяем данные на нормальные и выбросы
-                        normal_data = df[~is_outlier]
-                        outlier_data = df[is_outlier]
+                                # Разделяем данные на нормальные и выбросы
+                                outlier_data = df[is_outlier]
+                                normal_count = len(df) - len(outlier_data)
                         
-                        # Отображаем данные в зависимости от выбранного режима
-                        if display_mode in ["Все вместе", "Только нормальные значения"]:
-                            if len(normal_data) > 0:
-                                normal_plot = sample_data_for_plotting(normal_data[[other_col, selected_outlier_col]], 
-                                                                      max_plot_points, use_sampling)
-                                ax.scatter(normal_plot[other_col], normal_plot[selected_outlier_col], 
-                                          color='blue', alpha=0.5, s=15, label=f'Нормальные ({len(normal_data)})')  # Уменьшаем размер точек
+                                # Отображаем данные в зависимости от выбранного режима
+                                if display_mode in ["Все вместе", "Только нормальные значения"]:
+                                    if normal_count > 0:
+                                        # Нормальные точки - из кэшированной выборки строк датасета
+                                        rows = plot_sample_positions(dataset_id, max_plot_points, use_sampling)
+                                        normal_plot = df[[other_col, selected_outlier_col]].iloc[rows][~is_outlier[rows]]
+                                        ax.scatter(normal_plot[other_col], normal_plot[selected_outlier_col], 
+                                                  color='blue', alpha=0.5, s=15, label=f'Нормальные ({normal_count})')  # Уменьшаем размер точек
                         
-                        if display_mode in ["Все вместе", "Только выбросы"]:
-                            # Показываем ВСЕ выбросы (не применяем выборку к выбросам, чтобы не потерять важную информацию)
-                            if len(outlier_data) > 0:
-                                ax.scatter(outlier_data[other_col], outlier_data[selected_outlier_col], 
-                                          color='red', s=40, alpha=0.7, label=f'Выбросы ({len(outlier_data)})')  # Уменьшаем размер точек
+                                if display_mode in ["Все вместе", "Только выбросы"]:
+                                    # Показываем ВСЕ выбросы (не применяем выборку к выбросам, чтобы не потерять важную информацию)
+                                    if len(outlier_data) > 0:
+                                        ax.scatter(outlier_data[other_col], outlier_data[selected_outlier_col], 
+                                                  color='red', s=40, alpha=0.7, label=f'Выбросы ({len(outlier_data)})')  # Уменьшаем размер точек
                         
-                        ax.set_xlabel(other_col, fontsize=9)
-                        ax.set_ylabel(selected_outlier_col, fontsize=9)
-                        ax.set_title(f'Scatterplot: {other_col} vs {selected_outlier_col}', 
-                                    fontsize=10, fontweight='bold')
-                        ax.legend(fontsize=8)
-                        ax.grid(alpha=0.3)
-                        plt.tight_layout()
-                        st.pyplot(fig, use_container_width=True)
-                        plt.close(fig)
+                            ax.set_xlabel(other_col, fontsize=9)
+                            ax.set_ylabel(selected_outlier_col, fontsize=9)
+                            ax.set_title(f'Scatterplot: {other_col} vs {selected_outlier_col}', 
+                                        fontsize=10, fontweight='bold')
+                            ax.legend(fontsize=8)
+                            ax.grid(alpha=0.3)
+                            plt.tight_layout()
+                            return fig
+                        show_plot(dataset_id, ('outlier_scatter', selected_outlier_col, other_col, outlier_method, display_mode,
+                                               max_plot_points, use_sampling, density_scatter), draw_scatter)
             
             if outliers_count > 0:
                 st.subheader("Обнаруженные выбросы")
+                # Строки достаются только для показа
+                outliers = outlier_table.rows(stats_source, selected_outlier_col)
+                if len(outliers) < outliers_count:
+                    st.caption(f"Показаны первые {len(outliers):,} из {outliers_count:,} выбросов")
                 st.dataframe(outliers[[selected_outlier_col] + [c for c in df.columns if c != selected_outlier_col]], 
                             use_container_width=True)
+
+
+def _draw_outlier_density(ax, dataset_id, x_col, y_col, lower_bound, upper_bound, display_mode):
+    """Scatter plot выбросов как плотность по всем строкам: нормальные значения и выбросы - отдельные сетки"""
+    from utils import compute_column_profiles, compute_density_raster
+    
+    y_profile = compute_column_profiles(dataset_id)[y_col]
+    if display_mode in ["Все вместе", "Только нормальные значения"]:
+        normal_range = (max(y_profile.min, lower_bound), min(y_profile.max, upper_bound))
+        raster = compute_density_raster(dataset_id, x_col, y_col, y_range=normal_range)
+        if raster is not None and raster.n_points > 0:
+            raster.draw(ax, color='blue')
+            ax.scatter([], [], color='blue', marker='s', label=f'Нормальные ({raster.n_points})')
+    
+    if display_mode in ["Все вместе", "Только выбросы"]:
+        outliers_count = 0
+        # Выбросы строго за границами (как в таблице выбросов), значения на границе - нормальные
+        for y_range, y_inclusive in [((y_profile.min, lower_bound), 'left'), ((upper_bound, y_profile.max), 'right')]:
+            if y_range[0] < y_range[1]:
+                raster = compute_density_raster(dataset_id, x_col, y_col, y_range=y_range, y_inclusive=y_inclusive)
+                if raster is not None and raster.n_points > 0:
+                    raster.draw(ax, color='red')
+                    outliers_count += raster.n_points
+        if outliers_count > 0:
+            ax.scatter([], [], color='red', marker='s', label=f'Выбросы ({outliers_count})')
+
+
+def _render_multivariate_outliers(df, numeric_cols, dataset_id):
+    """Аномальные строки по нескольким признакам сразу"""
+    from utils import compute_multivariate_outliers, get_dataset
+    
+    selected_cols = st.multiselect("Признаки для многомерного анализа", numeric_cols, default=numeric_cols,
+                                   key="multivariate_cols")
+    multivariate_method = st.radio("Метод", list(MULTIVARIATE_METHODS), format_func=MULTIVARIATE_METHODS.get,
+                                   horizontal=True, key="multivariate_method")
+    top_n = st.slider("Сколько самых аномальных строк показать", 10, 1000, TOP_ANOMALIES_N, step=10,
+                      key="top_anomalies")
+    
+    if len(selected_cols) < 2:
+        st.info("Выберите минимум 2 признака")
+        return
+    
+    # Оценки всех строк кэшируются по датасету (в потоковом режиме - проходы по файлу)
+    stats_source = get_dataset(dataset_id)
+    with st.spinner("Оценка аномальности строк..."):
+        result = compute_multivariate_outliers(dataset_id, tuple(selected_cols), multivariate_method)
+    if result is None:
+        st.warning("Выбранные признаки не меняются - многомерный анализ невозможен")
+        return
+    
+    anomalies_percent = result.count / max(len(result.scores), 1) * 100
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Признаков в модели", len(result.columns))
+    with col2:
+        st.metric("Порог", f"{result.threshold:.2f}")
+    with col3:
+        st.metric("Аномальных строк", f"{result.count} ({anomalies_percent:.2f}%)")
+    
+    if multivariate_method == 'mahalanobis':
+        st.caption("Расстояние Махаланобиса до робастного центра; порог - квантиль 97.5% распределения хи-квадрат. "
+                   "Пропуски заменяются медианой признака.")
+    else:
+        st.caption("Оценка изолирующего леса: чем ближе к 1, тем легче строка отделяется от остальных. "
+                   "Пропуски заменяются медианой признака.")
+    
+    with st.spinner("Построение распределения оценок..."):
+        def draw_scores():
+            fig, ax = plt.subplots(figsize=(10, 4))
+            ax.hist(result.scores, bins=100, color='skyblue', edgecolor='black', alpha=0.7)
+            ax.axvline(result.threshold, color='red', linestyle='--', label=f'Порог: {result.threshold:.2f}')
+            ax.set_yscale('log')
+            ax.set_xlabel('Оценка аномальности', fontsize=9)
+            ax.set_ylabel('Число строк (лог. шкала)', fontsize=9)
+            ax.set_title('Распределение оценок аномальности', fontsize=10, fontweight='bold')
+            ax.legend(fontsize=8)
+            ax.grid(alpha=0.3)
+            plt.tight_layout()
+            return fig
+        show_plot(dataset_id, ('anomaly_scores', tuple(selected_cols), multivariate_method), draw_scores)
+    
+    st.subheader(f"Топ-{top_n} аномальных строк")
+    rows = result.rows(stats_source, top_n)
+    st.dataframe(rows[['Оценка аномальности'] + result.columns + [c for c in rows.columns
+                                                                   if c not in result.columns and c != 'Оценка аномальности']],
+                 use_container_width=True)
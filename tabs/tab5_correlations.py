@@ -6,12 +6,11 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from statsmodels.stats.outliers_influence import variance_inflation_factor
-from statsmodels.tools.tools import add_constant
-from utils import compute_correlation_matrix
+from utils import compute_correlation_matrix, compute_correlation_pairs, compute_vif_data, get_dataset, ChunkedProfile, CORRELATION_METHODS, compute_binned_column, compute_column_profiles, draw_violins, show_plot, compute_categorical_associations, correlation_pairs
 
 
-def render_correlations_tab(df, numeric_cols, categorical_cols):
+@st.fragment
+def render_correlations_tab(df, numeric_cols, categorical_cols, dataset_id):
     """Отображает вкладку анализа корреляций"""
     # Устанавливаем флаг активной вкладки для изоляции
     st.session_state.current_active_tab = 4
@@ -25,35 +24,29 @@ def render_correlations_tab(df, numeric_cols, categorical_cols):
     if len(numeric_cols) > 1:
         # Корреляционная матрица (используем кэшированную функцию)
         st.subheader("5.1. Корреляционная матрица")
+        corr_method = st.radio("Метод корреляции", list(CORRELATION_METHODS), format_func=CORRELATION_METHODS.get,
+                               horizontal=True, key="corr_method")
         with st.spinner("Вычисление корреляций..."):
-            correlation_matrix = compute_correlation_matrix(df, numeric_cols)
+            correlation_matrix = compute_correlation_matrix(dataset_id, numeric_cols, corr_method)
         
         if correlation_matrix is not None:
             with st.spinner("Построение тепловой карты..."):
-                fig, ax = plt.subplots(figsize=(10, 8))  # Уменьшаем размер
-                sns.heatmap(correlation_matrix, annot=True, fmt='.2f', cmap='coolwarm', 
-                           center=0, square=True, linewidths=0.5, cbar_kws={"shrink": 0.8}, 
-                           ax=ax, annot_kws={'size': 8})  # Уменьшаем размер аннотаций
-                ax.set_title('Корреляционная матрица числовых признаков', fontsize=12, fontweight='bold')
-                plt.tight_layout()
-                st.pyplot(fig, use_container_width=True)
-                plt.close(fig)
+                def draw_heatmap():
+                    fig, ax = plt.subplots(figsize=(10, 8))  # Уменьшаем размер
+                    sns.heatmap(correlation_matrix, annot=True, fmt='.2f', cmap='coolwarm', 
+                               center=0, square=True, linewidths=0.5, cbar_kws={"shrink": 0.8}, 
+                               ax=ax, annot_kws={'size': 8})  # Уменьшаем размер аннотаций
+                    ax.set_title(f'Корреляционная матрица числовых признаков ({CORRELATION_METHODS[corr_method]})', fontsize=12, fontweight='bold')
+                    plt.tight_layout()
+                    return fig
+                show_plot(dataset_id, ('corr_heatmap', tuple(numeric_cols), corr_method), draw_heatmap)
         
         # Сильные корреляции
         st.subheader("Сильные корреляции (|r| > 0.5)")
-        strong_corrs = []
-        for i in range(len(correlation_matrix.columns)):
-            for j in range(i+1, len(correlation_matrix.columns)):
-                corr_val = correlation_matrix.iloc[i, j]
-                if abs(corr_val) > 0.5:
-                    strong_corrs.append({
-                        'Признак 1': correlation_matrix.columns[i],
-                        'Признак 2': correlation_matrix.columns[j],
-                        'Корреляция': f"{corr_val:.3f}"
-                    })
+        strong_corrs = compute_correlation_pairs(dataset_id, numeric_cols, corr_method, threshold=0.5)
         
-        if strong_corrs:
-            st.dataframe(pd.DataFrame(strong_corrs), use_container_width=True)
+        if strong_corrs is not None and len(strong_corrs) > 0:
+            st.dataframe(strong_corrs.style.format({'Корреляция': '{:.3f}'}), use_container_width=True)
         else:
             st.info("Сильных корреляций (|r| > 0.5) не обнаружено")
         
@@ -66,51 +59,38 @@ def render_correlations_tab(df, numeric_cols, categorical_cols):
         - VIF ≥ 10: сильная мультиколлинеарность (требует внимания)
         """)
         
+        if isinstance(get_dataset(dataset_id), ChunkedProfile):
+            st.caption(f"В режиме больших файлов VIF считается по всему файлу, сравнение по группам - по выборке из {len(df):,} строк")
+        
         if len(numeric_cols) >= 2:
             with st.spinner("Вычисление VIF..."):
                 try:
-                    # Подготавливаем данные для VIF (убираем пропуски)
-                    df_vif = df[numeric_cols].dropna()
+                    # Все VIF сразу из обратной корреляционной матрицы (общий кэш с экспортом отчетов)
+                    vif_data = compute_vif_data(dataset_id, numeric_cols)
                     
-                    if len(df_vif) > len(numeric_cols):
-                        # Добавляем константу для регрессии
-                        X = add_constant(df_vif)
-                        
-                        # Вычисляем VIF для каждого признака
-                        vif_data = []
-                        for i, col in enumerate(numeric_cols):
-                            try:
-                                vif = variance_inflation_factor(X.values, i + 1)  # +1 из-за константы
-                                vif_data.append({
-                                    'Признак': col,
-                                    'VIF': f"{vif:.2f}",
-                                    'Оценка': 'Сильная' if vif >= 10 else ('Умеренная' if vif >= 5 else 'Слабая')
-                                })
-                            except:
-                                vif_data.append({
-                                    'Признак': col,
-                                    'VIF': 'N/A',
-                                    'Оценка': 'Ошибка вычисления'
-                                })
-                        
+                    if vif_data is not None:
                         vif_df = pd.DataFrame(vif_data)
                         st.dataframe(vif_df, use_container_width=True)
                         
                         # Визуализация VIF
-                        fig, ax = plt.subplots(figsize=(10, 6))
-                        vif_values = [float(v['VIF']) if v['VIF'] != 'N/A' else 0 for v in vif_data]
-                        colors = ['red' if v >= 10 else ('orange' if v >= 5 else 'green') for v in vif_values]
+                        def draw_vif():
+                            fig, ax = plt.subplots(figsize=(10, 6))
+                            vif_values = [float(v['VIF']) if v['VIF'] != 'N/A' else 0 for v in vif_data]
+                            # Бесконечный VIF (точная коллинеарность) рисуем чуть правее максимального конечного
+                            finite_max = max([v for v in vif_values if np.isfinite(v)] + [10])
+                            vif_values = [v if np.isfinite(v) else finite_max * 1.2 for v in vif_values]
+                            colors = ['red' if v >= 10 else ('orange' if v >= 5 else 'green') for v in vif_values]
                         
-                        bars = ax.barh(vif_df['Признак'], vif_values, color=colors, alpha=0.7)
-                        ax.axvline(x=5, color='orange', linestyle='--', label='Порог умеренной мультиколлинеарности (VIF=5)')
-                        ax.axvline(x=10, color='red', linestyle='--', label='Порог сильной мультиколлинеарности (VIF=10)')
-                        ax.set_xlabel('VIF (Variance Inflation Factor)', fontsize=10)
-                        ax.set_title('Анализ мультиколлинеарности (VIF)', fontsize=12, fontweight='bold')
-                        ax.legend(fontsize=8)
-                        ax.grid(alpha=0.3, axis='x')
-                        plt.tight_layout()
-                        st.pyplot(fig, use_container_width=True)
-                        plt.close(fig)
+                            bars = ax.barh(vif_df['Признак'], vif_values, color=colors, alpha=0.7)
+                            ax.axvline(x=5, color='orange', linestyle='--', label='Порог умеренной мультиколлинеарности (VIF=5)')
+                            ax.axvline(x=10, color='red', linestyle='--', label='Порог сильной мультиколлинеарности (VIF=10)')
+                            ax.set_xlabel('VIF (Variance Inflation Factor)', fontsize=10)
+                            ax.set_title('Анализ мультиколлинеарности (VIF)', fontsize=12, fontweight='bold')
+                            ax.legend(fontsize=8)
+                            ax.grid(alpha=0.3, axis='x')
+                            plt.tight_layout()
+                            return fig
+                        show_plot(dataset_id, ('vif', tuple(numeric_cols)), draw_vif)
                         
                         # Предупреждения
                         high_vif = [v for v in vif_data if v['VIF'] != 'N/A' and float(v['VIF']) >= 10]
@@ -134,41 +114,92 @@ def render_correlations_tab(df, numeric_cols, categorical_cols):
             
             if group_col and num_col:
                 # Ограничиваем количество групп
-                top_groups = df[group_col].value_counts().head(10).index
+                top_groups = compute_column_profiles(dataset_id)[group_col].value_counts(10).index
                 df_filtered = df[df[group_col].isin(top_groups)]
+                # Счетчики по группам считаются один раз (в потоковом режиме - по всему файлу)
+                binned = compute_binned_column(dataset_id, num_col, group_col, tuple(top_groups))
                 
                 col1, col2 = st.columns(2)
                 
                 with col1:
                     # Гистограммы по группам
                     with st.spinner("Построение гистограмм..."):
-                        fig, ax = plt.subplots(figsize=(8, 5))  # Уменьшаем размер
-                        for group_val in top_groups[:5]:  # Показываем топ-5
-                            subset = df_filtered[df_filtered[group_col] == group_val][num_col]
-                            ax.hist(subset.dropna(), alpha=0.6, label=f'{group_val}', bins=15)  # Уменьшаем bins
-                        ax.set_title(f'Распределение {num_col} по {group_col}', fontsize=10, fontweight='bold')
-                        ax.set_xlabel(num_col, fontsize=9)
-                        ax.set_ylabel('Частота', fontsize=9)
-                        ax.legend(fontsize=8)
-                        ax.grid(alpha=0.3)
-                        plt.tight_layout()
-                        st.pyplot(fig, use_container_width=True)
-                        plt.close(fig)
+                        def draw_group_hist():
+                            fig, ax = plt.subplots(figsize=(8, 5))  # Уменьшаем размер
+                            for group_val in top_groups[:5] if binned is not None else []:  # Показываем топ-5
+                                if not binned.count(group_val):
+                                    continue
+                                _, _, patches = binned.draw_hist(ax, bins=15, group=group_val, density=True, alpha=0.4,
+                                                                 label=f'{group_val}')
+                                # KDE кривая группы тем же цветом
+                                kde = binned.kde(group_val, cut=0)
+                                if kde is not None:
+                                    ax.plot(*kde, color=patches[0].get_facecolor()[:3], linewidth=1.5)
+                            ax.set_title(f'Распределение {num_col} по {group_col}', fontsize=10, fontweight='bold')
+                            ax.set_xlabel(num_col, fontsize=9)
+                            ax.set_ylabel('Плотность', fontsize=9)
+                            ax.legend(fontsize=8)
+                            ax.grid(alpha=0.3)
+                            plt.tight_layout()
+                            return fig
+                        show_plot(dataset_id, ('group_hist', group_col, num_col), draw_group_hist)
                 
                 with col2:
-                    # Boxplot по группам
-                    with st.spinner("Построение boxplot..."):
-                        fig, ax = plt.subplots(figsize=(8, 5))  # Уменьшаем размер
-                        sns.boxplot(x=group_col, y=num_col, data=df_filtered, ax=ax)
-                        ax.set_title(f'Boxplot {num_col} по {group_col}', fontsize=10, fontweight='bold')
-                        ax.tick_params(axis='x', rotation=45, labelsize=8)
-                        ax.grid(alpha=0.3, axis='y')
-                        plt.tight_layout()
-                        st.pyplot(fig, use_container_width=True)
-                        plt.close(fig)
+                    # Violin plot по группам (внутри - квартили и медиана)
+                    with st.spinner("Построение violin plot..."):
+                        def draw_group_violin():
+                            fig, ax = plt.subplots(figsize=(8, 5))  # Уменьшаем размер
+                            if binned is not None:
+                                draw_violins(ax, binned, groups=top_groups, labels=top_groups,
+                                             colors=sns.color_palette('Set2'))
+                            ax.set_xlabel(group_col, fontsize=9)
+                            ax.set_ylabel(num_col, fontsize=9)
+                            ax.set_title(f'Violin plot {num_col} по {group_col}', fontsize=10, fontweight='bold')
+                            ax.tick_params(axis='x', rotation=45, labelsize=8)
+                            ax.grid(alpha=0.3, axis='y')
+                            plt.tight_layout()
+                            return fig
+                        show_plot(dataset_id, ('group_violin', group_col, num_col), draw_group_violin)
                 
                 # Статистика по группам
-                grouped_stats = df_filtered.groupby(group_col)[num_col].agg(['mean', 'median', 'std', 'count'])
+                grouped_stats = df_filtered.groupby(group_col, observed=True)[num_col].agg(['mean', 'median', 'std', 'count'])
                 st.dataframe(grouped_stats, use_container_width=True)
     else:
         st.warning("Недостаточно числовых признаков для корреляционного анализа")
+    
+    # Связи категориальных признаков (таблицы сопряженности всех пар за один проход)
+    if len(categorical_cols) > 1:
+        st.subheader("5.4. Связи категориальных признаков (V Крамера)")
+        st.markdown("""
+        **V Крамера** — сила связи двух категориальных признаков по таблице сопряженности: 0 — связи нет, 1 — один признак полностью определяет другой. 
+        Значимость связи проверяется критерием хи-квадрат.
+        """)
+        with st.spinner("Вычисление таблиц сопряженности..."):
+            associations = compute_categorical_associations(dataset_id, categorical_cols)
+        if associations.sampled:
+            st.caption(f"Таблицы сопряженности построены по случайной выборке из {associations.rows:,} строк")
+        
+        with st.spinner("Построение тепловой карты..."):
+            def draw_associations():
+                size = min(4 + 0.4 * len(categorical_cols), 16)
+                fig, ax = plt.subplots(figsize=(size, size * 0.8))
+                # Подписи значений только для небольших матриц
+                annotate = len(categorical_cols) <= 20
+                sns.heatmap(associations.cramers_v, annot=annotate, fmt='.2f', cmap='viridis', vmin=0, vmax=1,
+                           square=True, linewidths=0.5 if annotate else 0, cbar_kws={"shrink": 0.8},
+                           ax=ax, annot_kws={'size': 8})
+                ax.set_title('V Крамера для категориальных признаков', fontsize=12, fontweight='bold')
+                plt.tight_layout()
+                return fig
+            show_plot(dataset_id, ('cramers_v', tuple(categorical_cols)), draw_associations)
+        
+        st.subheader("Сильные связи (V > 0.3)")
+        strong_assoc = correlation_pairs(associations.cramers_v, threshold=0.3).rename(columns={'Корреляция': 'V Крамера'})
+        if len(strong_assoc) > 0:
+            p_values = associations.p_values
+            strong_assoc['p-value (хи-квадрат)'] = p_values.to_numpy()[p_values.index.get_indexer(strong_assoc['Признак 1']),
+                                                                       p_values.columns.get_indexer(strong_assoc['Признак 2'])]
+            st.dataframe(strong_assoc.style.format({'V Крамера': '{:.3f}', 'p-value (хи-квадрат)': '{:.2e}'}),
+                         use_container_width=True)
+        else:
+            st.info("Сильных связей (V > 0.3) не обнаружено")
@@ -4,13 +4,10 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from scipy import stats as scipy_stats
-from utils import sample_data_for_plotting
+from utils import sample_data_for_plotting, use_density_scatter, compute_density_raster, compute_column_profiles, compute_correlation_matrix, compute_outlier_table, compute_binned_column, compute_group_screening, FDR_ALPHA, SCREENING_MAX_GROUPS, get_dataset, layer, PlotSpec, cached_plot_specs
 
 
-def render_hypotheses_tab(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling):
+def render_hypotheses_tab(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling, density_scatter, dataset_id):
     """Отображает вкладку автоматической генерации гипотез"""
     # Устанавливаем флаг активной вкладки для изоляции
     st.session_state.current_active_tab = 5
@@ -22,22 +19,43 @@ def render_hypotheses_tab(df, numeric_cols, categorical_cols, target_col, max_pl
     st.header("6. Автоматическая генерация гипотез с визуализациями")
     
     # Используем кэшированную функцию для вычисления гипотез
-    # @st.cache_data автоматически кэширует результаты
-    hypotheses = _compute_hypotheses_data(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling)
+    # @st.cache_data кэширует результаты по идентификатору датасета, без хэширования DataFrame
+    hypotheses = _compute_hypotheses_data(dataset_id, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling,
+                                          density_scatter)
     
+    # Сводка скрининга всех пар категориальный x числовой признак (из того же кэша)
+    screening = compute_group_screening(dataset_id, numeric_cols, categorical_cols)
+    if screening is not None and len(screening):
+        n_significant = int((screening['q-value'] < FDR_ALPHA).sum())
+        with st.expander(f"📋 Скрининг влияния категорий: проверено {len(screening)} пар, "
+                         f"значимых после поправки Бенджамини-Хохберга - {n_significant}"):
+            st.caption(f"Группы - до {SCREENING_MAX_GROUPS} самых частых значений признака; "
+                       f"пары отсортированы по размеру эффекта η²")
+            st.dataframe(screening.style.format({'F': '{:.3f}', 'F Уэлча': '{:.3f}', 'η²': '{:.4f}',
+                                                 'p-value': '{:.2e}', 'p-value Уэлча': '{:.2e}', 'q-value': '{:.2e}'}),
+                         use_container_width=True)
+
     # Отображение гипотез с визуализациями
     if hypotheses:
         st.success(f"✅ Сгенерировано {len(hypotheses)} гипотез")
         st.markdown("---")
         
-        for i, hyp in enumerate(hypotheses, 1):
-            with st.expander(f"**Гипотеза {i}:** {hyp['Гипотеза']}", expanded=(i == 1)):
+        # Состояние раскрытия отслеживается: графики закрытых гипотез не строятся
+        expanders = [st.expander(f"**Гипотеза {i}:** {hyp['Гипотеза']}", expanded=(i == 1),
+                                 key=f"hypothesis_{hyp['id']}", on_change='rerun')
+                     for i, hyp in enumerate(hypotheses, 1)]
+        # Графики раскрытых гипотез рисуются при первом раскрытии одним пакетом в пуле отрисовки,
+        # дальше берутся из кэша картинок
+        shown = [hyp for hyp, expander in zip(hypotheses, expanders) if expander.open and hyp.get('plot') is not None]
+        images = dict(zip((hyp['id'] for hyp in shown), hypothesis_plots(dataset_id, shown)))
+        
+        for hyp, expander in zip(hypotheses, expanders):
+            with expander:
                 col1, col2 = st.columns([2, 1])
                 
                 with col1:
-                    if 'plot' in hyp and hyp['plot'] is not None:
-                        st.pyplot(hyp['plot'])
-                        plt.close(hyp['plot'])  # Закрываем фигуру для освобождения памяти
+                    if hyp['id'] in images:
+                        st.image(images[hyp['id']], width='stretch')
                 
                 with col2:
                     st.markdown("**📝 Обоснование:**")
@@ -59,195 +77,181 @@ def render_hypotheses_tab(df, numeric_cols, categorical_cols, target_col, max_pl
         st.markdown("- Разделители в CSV файле корректны")
 
 
+def hypothesis_plots(dataset_id, hypotheses):
+    """PNG графиков гипотез из кэша отрисованных графиков (недостающие рисуются пакетом в пуле)"""
+    return cached_plot_specs(dataset_id, [hyp['plot_key'] for hyp in hypotheses], [hyp['plot'] for hyp in hypotheses])
+
+
+# Гипотезы о влиянии категорий: не больше стольких сильнейших пар и только с η² не меньше порога
+GROUP_HYPOTHESES_TOP_K = 10
+GROUP_EFFECT_MIN = 0.01
+
+
+def _f_interpretation(stat):
+    """Словесная оценка F-статистики"""
+    if stat < 1:
+        return "Очень слабые различия"
+    elif stat < 5:
+        return "Слабые различия"
+    elif stat < 20:
+        return "Умеренные различия"
+    elif stat < 100:
+        return "Сильные различия"
+    return "Очень сильные различия"
+
+
+def _group_test_text(row, n_pairs):
+    """Результаты ANOVA и теста Уэлча для пары из скрининга (markdown)"""
+    text = "**ANOVA (F-тест):**\n"
+    text += f"- F-статистика: {row['F']:.4f} ({_f_interpretation(row['F'])})\n"
+    text += f"- p-value: {row['p-value']:.6f}\n"
+    if np.isfinite(row['F Уэлча']):
+        text += f"- F Уэлча (без равенства дисперсий): {row['F Уэлча']:.4f}, p-value: {row['p-value Уэлча']:.6f}\n"
+    text += f"- Количество групп: {row['Групп']}, наблюдений: {row['Наблюдений']:,}\n"
+    text += f"- Размер эффекта η²: {row['η²']:.3f}\n"
+    text += f"- q-value (поправка Бенджамини-Хохберга на {n_pairs} проверенных пар): {row['q-value']:.6f}\n"
+    text += f"- ✅ **Статистически значимое различие между группами** (q < {FDR_ALPHA})\n"
+    text += "- 💡 Чем больше η², тем большую долю разброса объясняют группы\n"
+    return text
+
+
 @st.cache_data(show_spinner=False)
-def _compute_hypotheses_data(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling):
-    """Кэшированная функция для вычисления гипотез (графики пересоздаются при каждом отображении)"""
+def _compute_hypotheses_data(dataset_id, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling,
+                             density_scatter=True):
+    """Кэшированная функция для вычисления гипотез (графики - описания PlotSpec, рисуются при просмотре)"""
     hypotheses = []
+    df = get_dataset(dataset_id)
+    profiles = compute_column_profiles(dataset_id)
     
     # Гипотеза 1: Корреляция с целевой переменной
     if target_col and target_col in numeric_cols and len(numeric_cols) > 1:
+        target_corr = compute_correlation_matrix(dataset_id, numeric_cols)[target_col]
         for col in numeric_cols:
             if col != target_col:
                 try:
-                    corr = df[target_col].corr(df[col])
+                    corr = float(target_corr[col])
                     if abs(corr) > 0.3:
-                        # Выбираем данные для визуализации
-                        plot_df = sample_data_for_plotting(df[[col, target_col]], max_plot_points, use_sampling)
-                        
-                        # Создаем scatter plot для визуализации
-                        fig, ax = plt.subplots(figsize=(8, 5))  # Уменьшаем размер
-                        ax.scatter(plot_df[col], plot_df[target_col], alpha=0.4, s=20)  # Уменьшаем размер точек
+                        # Описание scatter plot для визуализации
+                        if use_density_scatter(len(df), max_plot_points, density_scatter):
+                            # Плотность по всем строкам вместо выборки
+                            layers = [layer('density', compute_density_raster(dataset_id, col, target_col), color='tab:blue')]
+                        else:
+                            # Выбираем данные для визуализации (выборка сохраняет крайние значения)
+                            plot_df = sample_data_for_plotting(df[[col, target_col]], max_plot_points, use_sampling,
+                                                               dataset_id, 'extremes', (col, target_col))
+                            layers = [layer('scatter', plot_df[col].to_numpy(), plot_df[target_col].to_numpy(), alpha=0.4, s=20)]  # Уменьшаем размер точек
                         # Линия тренда (используем все данные для точности, но только если не слишком много)
                         if len(df) < 10000:
                             z = np.polyfit(df[col].dropna(), df[target_col].dropna(), 1)
                             p = np.poly1d(z)
                             x_line = np.linspace(df[col].min(), df[col].max(), 50)  # Уменьшаем точки
-                            ax.plot(x_line, p(x_line), 
-                                   "r--", alpha=0.7, linewidth=1.5, label=f'Тренд (r={corr:.3f})')
-                        ax.set_xlabel(col, fontsize=10)
-                        ax.set_ylabel(target_col, fontsize=10)
-                        ax.set_title(f'Корреляция: {col} vs {target_col}', fontsize=11, fontweight='bold')
-                        ax.legend(fontsize=8)
-                        ax.grid(alpha=0.3)
-                        plt.tight_layout()
+                            layers.append(layer('plot', x_line, p(x_line), 
+                                                "r--", alpha=0.7, linewidth=1.5, label=f'Тренд (r={corr:.3f})'))
+                        layers += [
+                            layer('set_xlabel', col, fontsize=10),
+                            layer('set_ylabel', target_col, fontsize=10),
+                            layer('set_title', f'Корреляция: {col} vs {target_col}', fontsize=11, fontweight='bold'),
+                            layer('legend', fontsize=8),
+                            layer('grid', alpha=0.3),
+                        ]
                         
                         hypotheses.append({
                             'id': len(hypotheses),
                             'Гипотеза': f"Признак '{col}' имеет {'положительную' if corr > 0 else 'отрицательную'} корреляцию с '{target_col}'",
                             'Обоснование': f"Корреляция составляет {corr:.3f}, что указывает на {'прямую' if corr > 0 else 'обратную'} связь",
                             'Метод проверки': "Корреляционный анализ, регрессионное моделирование",
-                            'plot': fig
+                            'plot': PlotSpec((layers,), figsize=(8, 5))
                         })
                 except:
                     pass
     
     # Гипотеза 2: Влияние категориальных признаков на числовые
-    if categorical_cols and numeric_cols:
-        for cat_col in categorical_cols[:5]:
-            for num_col in numeric_cols[:5]:
-                try:
-                    grouped_means = df.groupby(cat_col)[num_col].mean()
-                    if len(grouped_means) > 1 and grouped_means.std() > abs(grouped_means.mean()) * 0.1:
-                        # Создаем boxplot для визуализации
-                        fig, axes = plt.subplots(1, 2, figsize=(12, 5))  # Уменьшаем размер
-                        
-                        # Boxplot
-                        top_groups = grouped_means.nlargest(10).index
-                        df_filtered = df[df[cat_col].isin(top_groups)]
-                        sns.boxplot(x=cat_col, y=num_col, data=df_filtered, ax=axes[0])
-                        axes[0].set_title(f'Распределение {num_col} по {cat_col}', fontsize=10, fontweight='bold')
-                        axes[0].tick_params(axis='x', rotation=45, labelsize=8)
-                        axes[0].grid(alpha=0.3, axis='y')
-                        
-                        # Barplot средних значений
-                        grouped_means_sorted = grouped_means.sort_values(ascending=False).head(10)
-                        axes[1].barh(range(len(grouped_means_sorted)), grouped_means_sorted.values, color='skyblue')
-                        axes[1].set_yticks(range(len(grouped_means_sorted)))
-                        axes[1].set_yticklabels(grouped_means_sorted.index, fontsize=8)
-                        axes[1].set_xlabel(f'Среднее значение {num_col}', fontsize=9)
-                        axes[1].set_title(f'Средние значения {num_col} по группам', fontsize=10, fontweight='bold')
-                        axes[1].grid(alpha=0.3, axis='x')
-                        
-                        plt.tight_layout()
-                        
-                        # Выполняем статистические тесты
-                        statistical_test_result = ""
-                        groups_data = [df_filtered[df_filtered[cat_col] == group][num_col].dropna() for group in top_groups]
-                        groups_data = [g for g in groups_data if len(g) > 0]  # Убираем пустые группы
-                        
-                        if len(groups_data) == 2:
-                            # t-тест для двух групп
-                            try:
-                                from scipy.stats import ttest_ind
-                                stat, p_value = ttest_ind(groups_data[0], groups_data[1])
-                                
-                                # Интерпретация t-статистики (по абсолютному значению)
-                                abs_stat = abs(stat)
-                                if abs_stat < 1:
-                                    t_interpretation = "Очень слабые различия"
-                                elif abs_stat < 2:
-                                    t_interpretation = "Слабые различия"
-                                elif abs_stat < 3:
-                                    t_interpretation = "Умеренные различия"
-                                elif abs_stat < 5:
-                                    t_interpretation = "Сильные различия"
-                                else:
-                                    t_interpretation = "Очень сильные различия"
-                                
-                                statistical_test_result = f"**t-тест (две группы):**\n"
-                                statistical_test_result += f"- t-статистика: {stat:.4f} ({t_interpretation})\n"
-                                statistical_test_result += f"- p-value: {p_value:.6f}\n"
-                                statistical_test_result += f"- Размер группы 1: {len(groups_data[0])} наблюдений\n"
-                                statistical_test_result += f"- Размер группы 2: {len(groups_data[1])} наблюдений\n"
-                                if p_value < 0.05:
-                                    statistical_test_result += f"- ✅ **Статистически значимое различие** (p < 0.05)\n"
-                                    statistical_test_result += f"- 💡 Чем больше |t|, тем сильнее различия между группами\n"
-                                else:
-                                    statistical_test_result += f"- ❌ Нет статистически значимого различия (p ≥ 0.05)\n"
-                            except Exception as e:
-                                statistical_test_result = f"Ошибка при выполнении t-теста: {str(e)}"
-                        elif len(groups_data) > 2:
-                            # ANOVA для трех и более групп
-                            try:
-                                from scipy.stats import f_oneway
-                                stat, p_value = f_oneway(*groups_data)
-                                
-                                # Интерпретация F-статистики
-                                if stat < 1:
-                                    f_interpretation = "Очень слабые различия"
-                                elif stat < 5:
-                                    f_interpretation = "Слабые различия"
-                                elif stat < 20:
-                                    f_interpretation = "Умеренные различия"
-                                elif stat < 100:
-                                    f_interpretation = "Сильные различия"
-                                else:
-                                    f_interpretation = "Очень сильные различия"
-                                
-                                statistical_test_result = f"**ANOVA (F-тест):**\n"
-                                statistical_test_result += f"- F-статистика: {stat:.4f} ({f_interpretation})\n"
-                                statistical_test_result += f"- p-value: {p_value:.6f}\n"
-                                statistical_test_result += f"- Количество групп: {len(groups_data)}\n"
-                                if p_value < 0.05:
-                                    statistical_test_result += f"- ✅ **Статистически значимое различие между группами** (p < 0.05)\n"
-                                    statistical_test_result += f"- 💡 Чем больше F-статистика, тем сильнее различия между группами\n"
-                                else:
-                                    statistical_test_result += f"- ❌ Нет статистически значимого различия между группами (p ≥ 0.05)\n"
-                            except Exception as e:
-                                statistical_test_result = f"Ошибка при выполнении ANOVA: {str(e)}"
-                        
-                        hypotheses.append({
-                            'id': len(hypotheses),
-                            'Гипотеза': f"Признак '{cat_col}' влияет на '{num_col}'",
-                            'Обоснование': f"Средние значения '{num_col}' различаются по группам '{cat_col}' (разброс: {grouped_means.std():.2f})",
-                            'Метод проверки': "ANOVA, t-test, визуализация boxplot",
-                            'statistical_test': statistical_test_result,
-                            'plot': fig
-                        })
-                except:
-                    pass
+    # Все пары проверяются сразу по суммам групп; графики - только для сильнейших значимых после поправки BH
+    screening = compute_group_screening(dataset_id, numeric_cols, categorical_cols)
+    if screening is not None:
+        significant = screening[(screening['q-value'] < FDR_ALPHA) & (screening['η²'] >= GROUP_EFFECT_MIN)]
+        for row in significant.head(GROUP_HYPOTHESES_TOP_K).to_dict('records'):
+            cat_col, num_col = row['Категориальный признак'], row['Числовой признак']
+            try:
+                # Boxplot и средние по группам из раскладки колонки по бинам
+                top_groups = profiles[cat_col].value_counts(10).index
+                binned = compute_binned_column(dataset_id, num_col, cat_col, tuple(top_groups))
+                boxes = [dict(binned.box(group), label=str(group)) for group in top_groups if binned.count(group)]
+                box_layers = [
+                    layer('bxp', boxes, patch_artist=True, boxprops={'facecolor': 'lightblue'},
+                          medianprops={'color': 'black'}, flierprops={'marker': 'd', 'markersize': 4}),
+                    layer('set_xlabel', cat_col),
+                    layer('set_ylabel', num_col),
+                    layer('set_title', f'Распределение {num_col} по {cat_col}', fontsize=10, fontweight='bold'),
+                    layer('tick_params', axis='x', rotation=45, labelsize=8),
+                    layer('grid', alpha=0.3, axis='y'),
+                ]
+                
+                # Barplot средних значений
+                grouped_means = pd.Series({group: binned.mean(group) for group in top_groups}).dropna()
+                grouped_means_sorted = grouped_means.sort_values(ascending=False)
+                means_layers = [
+                    layer('labeled_barh', grouped_means_sorted.index, grouped_means_sorted.values, color='skyblue'),
+                    layer('set_xlabel', f'Среднее значение {num_col}', fontsize=9),
+                    layer('set_title', f'Средние значения {num_col} по группам', fontsize=10, fontweight='bold'),
+                    layer('grid', alpha=0.3, axis='x'),
+                ]
+                
+                hypotheses.append({
+                    'id': len(hypotheses),
+                    'Гипотеза': f"Признак '{cat_col}' влияет на '{num_col}'",
+                    'Обоснование': f"Средние значения '{num_col}' различаются по группам '{cat_col}': "
+                                   f"группы объясняют {row['η²'] * 100:.1f}% дисперсии (η² = {row['η²']:.3f})",
+                    'Метод проверки': "ANOVA, F-тест Уэлча, визуализация boxplot",
+                    'statistical_test': _group_test_text(row, len(screening)),
+                    'plot': PlotSpec((box_layers, means_layers), figsize=(12, 5), layout=(1, 2))
+                })
+            except:
+                pass
     
     # Гипотеза 3: Выбросы и аномалии
     if numeric_cols:
+        # Выбросы всех колонок из общего кэша (тот же, что и во вкладке выбросов)
+        outlier_table = compute_outlier_table(dataset_id, 'iqr')
         for col in numeric_cols[:5]:
             try:
-                Q1 = df[col].quantile(0.25)
-                Q3 = df[col].quantile(0.75)
-                IQR = Q3 - Q1
-                if IQR > 0:
-                    outliers = df[(df[col] < Q1 - 1.5*IQR) | (df[col] > Q3 + 1.5*IQR)]
-                    outliers_count = len(outliers)
+                lower_bound, upper_bound = outlier_table.bounds(col)
+                if upper_bound > lower_bound:
+                    outliers_count = int(outlier_table.count(col))
                     if outliers_count > len(df) * 0.05:  # Более 5% выбросов
-                            # Создаем визуализацию выбросов
-                        fig, axes = plt.subplots(1, 2, figsize=(12, 5))  # Уменьшаем размер
-                        
-                        # Boxplot
-                        sns.boxplot(y=df[col], ax=axes[0], color='lightblue')
-                        axes[0].axhline(Q1 - 1.5*IQR, color='red', linestyle='--', alpha=0.7, label='Нижняя граница')
-                        axes[0].axhline(Q3 + 1.5*IQR, color='red', linestyle='--', alpha=0.7, label='Верхняя граница')
-                        axes[0].set_title(f'Выбросы в {col}', fontsize=10, fontweight='bold')
-                        axes[0].set_ylabel('Значение', fontsize=9)
-                        axes[0].legend(fontsize=8)
-                        axes[0].grid(alpha=0.3, axis='y')
+                        # Описание визуализации выбросов: boxplot и гистограммы по общей раскладке колонки по бинам
+                        binned = compute_binned_column(dataset_id, col)
+                        box_layers = [
+                            layer('bxp', [binned.box()], patch_artist=True, boxprops={'facecolor': 'lightblue'},
+                                  medianprops={'color': 'black'}, flierprops={'marker': 'd', 'markersize': 4}),
+                            layer('set_xticks', []),
+                            layer('axhline', lower_bound, color='red', linestyle='--', alpha=0.7, label='Нижняя граница'),
+                            layer('axhline', upper_bound, color='red', linestyle='--', alpha=0.7, label='Верхняя граница'),
+                            layer('set_title', f'Выбросы в {col}', fontsize=10, fontweight='bold'),
+                            layer('set_ylabel', 'Значение', fontsize=9),
+                            layer('legend', fontsize=8),
+                            layer('grid', alpha=0.3, axis='y'),
+                        ]
                         
                         # Гистограмма с выделением выбросов
-                        axes[1].hist(df[col].dropna(), bins=20, color='skyblue', alpha=0.7, edgecolor='black', label='Нормальные значения')  # Уменьшаем bins
+                        hist_layers = [layer('hist', binned, bins=20, color='skyblue', alpha=0.7, edgecolor='black', label='Нормальные значения')]  # Уменьшаем bins
                         if outliers_count > 0:
-                            axes[1].hist(outliers[col], bins=20, color='red', alpha=0.7, edgecolor='black', label='Выбросы')
-                        axes[1].set_xlabel(col, fontsize=9)
-                        axes[1].set_ylabel('Частота', fontsize=9)
-                        axes[1].set_title(f'Распределение с выделением выбросов', fontsize=10, fontweight='bold')
-                        axes[1].legend(fontsize=8)
-                        axes[1].grid(alpha=0.3)
-                        
-                        plt.tight_layout()
+                            hist_layers.append(layer('hist', binned, bins=20, outside=(lower_bound, upper_bound),
+                                                     color='red', alpha=0.7, edgecolor='black', label='Выбросы'))
+                        hist_layers += [
+                            layer('set_xlabel', col, fontsize=9),
+                            layer('set_ylabel', 'Частота', fontsize=9),
+                            layer('set_title', f'Распределение с выделением выбросов', fontsize=10, fontweight='bold'),
+                            layer('legend', fontsize=8),
+                            layer('grid', alpha=0.3),
+                        ]
                         
                         hypotheses.append({
                             'id': len(hypotheses),
                             'Гипотеза': f"В признаке '{col}' присутствует значительное количество выбросов",
                             'Обоснование': f"Обнаружено {outliers_count} выбросов ({outliers_count/len(df)*100:.1f}% данных)",
                             'Метод проверки': "IQR метод, визуализация boxplot, анализ причин выбросов",
-                            'plot': fig
+                            'plot': PlotSpec((box_layers, hist_layers), figsize=(12, 5), layout=(1, 2))
                         })
             except:
                 pass
@@ -256,96 +260,95 @@ def _compute_hypotheses_data(df, numeric_cols, categorical_cols, target_col, max
     if numeric_cols:
         for col in numeric_cols[:5]:
             try:
-                skewness = df[col].skew()
+                skewness = profiles[col].skew
                 if abs(skewness) > 1:
-                    # Создаем визуализацию распределения
-                    fig, axes = plt.subplots(1, 2, figsize=(12, 5))  # Уменьшаем размер
-                    
-                    # Гистограмма
-                    data = df[col].dropna()
-                    axes[0].hist(data, bins=20, color='skyblue', alpha=0.7, edgecolor='black')  # Уменьшаем bins
-                    mean_val = data.mean()
-                    median_val = data.median()
-                    axes[0].axvline(mean_val, color='red', linestyle='--', linewidth=1.5, label=f'Среднее: {mean_val:.2f}')
-                    axes[0].axvline(median_val, color='green', linestyle='--', linewidth=1.5, label=f'Медиана: {median_val:.2f}')
-                    axes[0].set_xlabel(col, fontsize=9)
-                    axes[0].set_ylabel('Частота', fontsize=9)
-                    axes[0].set_title(f'Распределение {col} (асимметрия: {skewness:.2f})', fontsize=10, fontweight='bold')
-                    axes[0].legend(fontsize=8)
-                    axes[0].grid(alpha=0.3)
+                    # Описание визуализации распределения: гистограмма
+                    mean_val = profiles[col].mean
+                    median_val = profiles[col].median
+                    hist_layers = [
+                        layer('hist', compute_binned_column(dataset_id, col), bins=20, color='skyblue', alpha=0.7, edgecolor='black'),  # Уменьшаем bins
+                        layer('axvline', mean_val, color='red', linestyle='--', linewidth=1.5, label=f'Среднее: {mean_val:.2f}'),
+                        layer('axvline', median_val, color='green', linestyle='--', linewidth=1.5, label=f'Медиана: {median_val:.2f}'),
+                        layer('set_xlabel', col, fontsize=9),
+                        layer('set_ylabel', 'Частота', fontsize=9),
+                        layer('set_title', f'Распределение {col} (асимметрия: {skewness:.2f})', fontsize=10, fontweight='bold'),
+                        layer('legend', fontsize=8),
+                        layer('grid', alpha=0.3),
+                    ]
                     
                     # Q-Q plot для проверки нормальности (только для небольших датасетов)
-                    sample = data
+                    sample = df[col].dropna()
                     if len(sample) > 0 and len(sample) < 5000:
                         if len(sample) > 2000:
-                            sample = sample.sample(n=2000, random_state=42)
-                        scipy_stats.probplot(sample, dist="norm", plot=axes[1])
-                        axes[1].set_title(f'Q-Q plot для {col}', fontsize=10, fontweight='bold')
+                            sample = sample_data_for_plotting(df[[col]], 2000, dataset_id=dataset_id)[col].dropna()
+                        qq_layers = [
+                            layer('probplot', sample.to_numpy()),
+                            layer('set_title', f'Q-Q plot для {col}', fontsize=10, fontweight='bold'),
+                        ]
                     else:
                         # Для больших датасетов показываем только статистику
-                        axes[1].text(0.5, 0.5, f'Асимметрия: {skewness:.2f}\nЭксцесс: {data.kurtosis():.2f}', 
-                                    ha='center', va='center', fontsize=12, transform=axes[1].transAxes)
-                        axes[1].set_title(f'Статистика распределения', fontsize=10, fontweight='bold')
-                    axes[1].grid(alpha=0.3)
-                    
-                    plt.tight_layout()
+                        qq_layers = [
+                            layer('axes_text', 0.5, 0.5, f'Асимметрия: {skewness:.2f}\nЭксцесс: {profiles[col].kurtosis:.2f}', 
+                                  ha='center', va='center', fontsize=12),
+                            layer('set_title', f'Статистика распределения', fontsize=10, fontweight='bold'),
+                        ]
+                    qq_layers.append(layer('grid', alpha=0.3))
                     
                     hypotheses.append({
                         'id': len(hypotheses),
                         'Гипотеза': f"Признак '{col}' имеет {'правостороннее' if skewness > 0 else 'левостороннее'} асимметричное распределение",
                         'Обоснование': f"Коэффициент асимметрии: {skewness:.2f} ({'сильная асимметрия' if abs(skewness) > 2 else 'умеренная асимметрия'})",
                         'Метод проверки': "Визуализация гистограммы, применение логарифмического преобразования",
-                        'plot': fig
+                        'plot': PlotSpec((hist_layers, qq_layers), figsize=(12, 5), layout=(1, 2))
                     })
             except:
                 pass
     
     # Гипотеза 5: Пропущенные значения
-    missing_cols = [col for col in df.columns if df[col].isnull().sum() > 0]
+    missing_cols = [col for col, profile in profiles.items() if profile.null_count > 0]
     if missing_cols:
         for col in missing_cols[:3]:
-            missing_pct = df[col].isnull().sum() / len(df) * 100
+            missing_pct = profiles[col].null_pct
             if missing_pct > 10:
-                # Создаем визуализацию пропусков
-                fig, axes = plt.subplots(1, 2, figsize=(12, 5))  # Уменьшаем размер
-                
-                # Тепловая карта пропусков для этого признака (только для небольших датасетов)
+                # Описание визуализации пропусков: тепловая карта для этого признака (только для небольших датасетов)
                 if len(df) < 5000:
-                    missing_data = df[[col]].isnull()
-                    sns.heatmap(missing_data, yticklabels=False, cbar=True, cmap='viridis', ax=axes[0])
-                    axes[0].set_title(f'Паттерн пропусков в {col}', fontsize=10, fontweight='bold')
+                    missing_layers = [
+                        layer('heatmap', df[[col]].isnull(), yticklabels=False, cbar=True, cmap='viridis'),
+                        layer('set_title', f'Паттерн пропусков в {col}', fontsize=10, fontweight='bold'),
+                    ]
                 else:
                     # Для больших датасетов показываем только статистику
-                    axes[0].text(0.5, 0.5, f'Пропущено: {missing_pct:.1f}%', 
-                                ha='center', va='center', fontsize=14, transform=axes[0].transAxes)
-                    axes[0].set_title(f'Пропуски в {col}', fontsize=10, fontweight='bold')
+                    missing_layers = [
+                        layer('axes_text', 0.5, 0.5, f'Пропущено: {missing_pct:.1f}%', 
+                              ha='center', va='center', fontsize=14),
+                        layer('set_title', f'Пропуски в {col}', fontsize=10, fontweight='bold'),
+                    ]
                 
                 # Сравнение распределений: с пропусками vs без пропусков
                 if col in numeric_cols:
-                    not_missing = df[df[col].notna()][col]
-                    axes[1].hist(not_missing, bins=15, alpha=0.7, color='green', label='Не пропущено', edgecolor='black')  # Уменьшаем bins
-                    axes[1].set_xlabel(col, fontsize=9)
-                    axes[1].set_ylabel('Частота', fontsize=9)
-                    axes[1].set_title(f'Распределение (пропущено {missing_pct:.1f}%)', fontsize=10, fontweight='bold')
-                    axes[1].legend(fontsize=8)
-                    axes[1].grid(alpha=0.3)
+                    values_layers = [
+                        layer('hist', compute_binned_column(dataset_id, col), bins=15, alpha=0.7, color='green', label='Не пропущено', edgecolor='black'),  # Уменьшаем bins
+                        layer('set_xlabel', col, fontsize=9),
+                        layer('set_ylabel', 'Частота', fontsize=9),
+                        layer('set_title', f'Распределение (пропущено {missing_pct:.1f}%)', fontsize=10, fontweight='bold'),
+                        layer('legend', fontsize=8),
+                        layer('grid', alpha=0.3),
+                    ]
                 else:
-                    value_counts = df[col].value_counts().head(10)
-                    axes[1].barh(range(len(value_counts)), value_counts.values, color='coral')
-                    axes[1].set_yticks(range(len(value_counts)))
-                    axes[1].set_yticklabels(value_counts.index, fontsize=8)
-                    axes[1].set_xlabel('Количество', fontsize=9)
-                    axes[1].set_title(f'Распределение значений', fontsize=10, fontweight='bold')
-                    axes[1].grid(alpha=0.3, axis='x')
-                
-                plt.tight_layout()
+                    value_counts = profiles[col].value_counts(10)
+                    values_layers = [
+                        layer('labeled_barh', value_counts.index, value_counts.values, color='coral'),
+                        layer('set_xlabel', 'Количество', fontsize=9),
+                        layer('set_title', f'Распределение значений', fontsize=10, fontweight='bold'),
+                        layer('grid', alpha=0.3, axis='x'),
+                    ]
                 
                 hypotheses.append({
                     'id': len(hypotheses),
                     'Гипотеза': f"Пропущенные значения в '{col}' могут быть информативными",
                     'Обоснование': f"Пропущено {missing_pct:.1f}% значений, что может указывать на систематический паттерн",
                     'Метод проверки': "Анализ паттернов пропусков, создание бинарного признака 'есть/нет пропуск'",
-                    'plot': fig
+                    'plot': PlotSpec((missing_layers, values_layers), figsize=(12, 5), layout=(1, 2))
                 })
     
     # Гипотеза 6: Временные тренды
@@ -361,94 +364,55 @@ def _compute_hypotheses_data(df, numeric_cols, categorical_cols, target_col, max
             
             for time_col in potential_time_cols[:1]:  # Берем одну для примера
                 if len(df) > 10:
-                    # Создаем график тренда
-                    fig, ax = plt.subplots(figsize=(10, 5))  # Уменьшаем размер
-                    
-                    # Используем выборку для больших датасетов
-                    if len(df) > 5000:
-                        df_plot = df.sample(n=5000, random_state=42).sort_index()
-                    else:
-                        df_plot = df
-                    
+                    # Описание графика тренда
                     # Если есть категориальный признак для группировки
                     if categorical_cols:
                         cat_col = categorical_cols[0]
-                        top_cats = df_plot[cat_col].value_counts().head(5).index
+                        # Выборка стратифицирована по группирующему признаку: все категории в ней представлены
+                        df_plot = sample_data_for_plotting(df[[time_col, cat_col]], 5000, dataset_id=dataset_id,
+                                                           strategy='stratified', column=cat_col)
+                        # Самые частые категории - по всем строкам, а не по выборке с выровненными стратами
+                        top_cats = compute_column_profiles(dataset_id)[cat_col].value_counts(5).index
                         
+                        trend_layers = []
                         for cat in top_cats:
                             subset = df_plot[df_plot[cat_col] == cat]
                             if len(subset) > 0:
                                 # Сортируем по индексу для временного ряда
                                 subset_sorted = subset.sort_index()
-                                ax.plot(range(len(subset_sorted)), subset_sorted[time_col], 
-                                       marker='o', label=cat, linewidth=1.5, markersize=3)  # Уменьшаем размер
+                                trend_layers.append(layer('plot', np.arange(len(subset_sorted)), subset_sorted[time_col].to_numpy(), 
+                                                          marker='o', label=cat, linewidth=1.5, markersize=3))  # Уменьшаем размер
                         
-                        ax.set_xlabel('Время / Порядок наблюдений', fontsize=10)
-                        ax.set_ylabel(time_col, fontsize=10)
-                        ax.set_title(f'Тренд {time_col} по группам {cat_col}', fontsize=11, fontweight='bold')
-                        ax.legend(fontsize=8)
-                        ax.grid(alpha=0.3)
+                        trend_layers += [
+                            layer('set_xlabel', 'Время / Порядок наблюдений', fontsize=10),
+                            layer('set_ylabel', time_col, fontsize=10),
+                            layer('set_title', f'Тренд {time_col} по группам {cat_col}', fontsize=11, fontweight='bold'),
+                            layer('legend', fontsize=8),
+                            layer('grid', alpha=0.3),
+                        ]
                     else:
-                        # Простой временной ряд
-                        ax.plot(range(len(df_plot)), df_plot[time_col].sort_index(), 
-                               marker='o', linewidth=1.5, markersize=2)  # Уменьшаем размер
-                        ax.set_xlabel('Время / Порядок наблюдений', fontsize=10)
-                        ax.set_ylabel(time_col, fontsize=10)
-                        ax.set_title(f'Тренд {time_col}', fontsize=11, fontweight='bold')
-                        ax.grid(alpha=0.3)
-                    
-                    plt.tight_layout()
+                        # Простой временной ряд по кэшированной случайной выборке
+                        df_plot = sample_data_for_plotting(df[[time_col]], 5000, dataset_id=dataset_id)
+                        trend_layers = [
+                            layer('plot', np.arange(len(df_plot)), df_plot[time_col].sort_index().to_numpy(), 
+                                  marker='o', linewidth=1.5, markersize=2),  # Уменьшаем размер
+                            layer('set_xlabel', 'Время / Порядок наблюдений', fontsize=10),
+                            layer('set_ylabel', time_col, fontsize=10),
+                            layer('set_title', f'Тренд {time_col}', fontsize=11, fontweight='bold'),
+                            layer('grid', alpha=0.3),
+                        ]
                     
                     hypotheses.append({
                         'id': len(hypotheses),
                         'Гипотеза': f"В признаке '{time_col}' наблюдается временной тренд",
                         'Обоснование': f"Значения изменяются во времени, что может указывать на динамику процесса",
                         'Метод проверки': "Временной ряд анализ, тест на стационарность, декомпозиция",
-                        'plot': fig
+                        'plot': PlotSpec((trend_layers,), figsize=(10, 5))
                     })
     
-    # Отображение гипотез с визуализациями
-    if hypotheses:
-        st.success(f"✅ Сгенерировано {len(hypotheses)} гипотез")
-        st.markdown("---")
-        
-        for i, hyp in enumerate(hypotheses, 1):
-            with st.expander(f"**Гипотеза {i}:** {hyp['Гипотеза']}", expanded=(i == 1)):
-                col1, col2 = st.columns([2, 1])
-                
-                with col1:
-                    if 'plot' in hyp and hyp['plot'] is not None:
-                        st.pyplot(hyp['plot'])
-                        plt.close(hyp['plot'])  # Закрываем фигуру для освобождения памяти
-                
-                with col2:
-                    st.markdown("**📝 Обоснование:**")
-                    st.write(hyp['Обоснование'])
-                    st.markdown("---")
-                    st.markdown("**🔬 Метод проверки:**")
-                    st.write(hyp['Метод проверки'])
-                    
-                    # Показываем результаты статистических тестов, если они есть
-                    if 'statistical_test' in hyp and hyp['statistical_test']:
-                        st.markdown("---")
-                        st.markdown("**📊 Статистический тест:**")
-                        st.markdown(hyp['statistical_test'])
-    else:
-        st.info("💡 Гипотезы будут сгенерированы после более детального анализа данных. Убедитесь, что данные загружены корректно.")
-        st.markdown("**Совет:** Проверьте, что:")
-        st.markdown("- В данных есть числовые и категориальные признаки")
-        st.markdown("- Данные не содержат критических ошибок")
-        st.markdown("- Разделители в CSV файле корректны")
-
-
-
-
-
-
-
-
-
-
-
-
-
+    # Ключ графика в кэше картинок: параметры вычисления и номер гипотезы
+    options = (tuple(numeric_cols), tuple(categorical_cols), target_col, max_plot_points, use_sampling, density_scatter)
+    for hyp in hypotheses:
+        hyp['plot_key'] = ('hypothesis', *options, hyp['id'])
+    
+    return hypotheses
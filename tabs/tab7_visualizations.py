@@ -6,10 +6,11 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from utils import sample_data_for_plotting
+from utils import sample_data_for_plotting, use_density_scatter, compute_density_raster, compute_column_profiles, profile_series, compute_binned_column, draw_violins, show_plot, layer, PlotSpec, render_plot_specs, VIOLIN_MAX_GROUPS, SCATTER_COLORS, SAMPLING_STRATEGIES
 
 
-def render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling):
+@st.fragment
+def render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, max_plot_points, use_sampling, density_scatter, dataset_id):
     """Отображает вкладку дополнительных визуализаций"""
     # Устанавливаем флаг, что мы на вкладке визуализации
     # Это поможет изолировать выполнение кода
@@ -40,6 +41,13 @@ def render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, ma
         if x_col and y_col and x_col != y_col:
             with st.spinner("Построение scatter plot..."):
                 try:
+                    # Данные и виджеты готовятся при каждом запуске, а matplotlib - только если картинки нет в кэше
+                    layers = []  # (точки, параметры ax.scatter)
+                    hue_raster = None  # растр плотности по категориям
+                    plain_density = False  # все строки как плотность без группировки
+                    filtered_cats = []
+                    hue_legend = False
+                    
                     # Для цветовой группировки используем полный датасет для определения категорий
                     # Выборку применяем только для визуализации, чтобы не потерять категории
                     if hue_col:
@@ -54,12 +62,10 @@ def render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, ma
                         elif len(full_df) == 0:
                             st.warning(f"Нет данных с заполненным признаком '{hue_col}'")
                             full_df = None
-                    else:
-                        # Без группировки - используем выборку сразу
-                        plot_df = sample_data_for_plotting(df[[x_col, y_col]], 
-                                                          max_plot_points, use_sampling)
-                    
-                    fig, ax = plt.subplots(figsize=(10, 6))
+                    elif not use_density_scatter(len(df), max_plot_points, density_scatter):
+                        # Без группировки - используем кэшированную выборку с крайними значениями
+                        plot_df = sample_data_for_plotting(df[[x_col, y_col]], max_plot_points, use_sampling,
+                                                           dataset_id, 'extremes', (x_col, y_col))
                     
                     # Определяем, есть ли данные для группировки по цвету
                     if hue_col:
@@ -69,8 +75,7 @@ def render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, ma
                             unique_cats = full_df[hue_col].unique()
                             if len(unique_cats) <= 10:  # Ограничиваем количество категорий
                                 # Используем более контрастные цвета
-                                colors_list = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', 
-                                              '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+                                colors_list = SCATTER_COLORS
                                 
                                 # Собираем информацию о категориях для отладки
                                 categories_info = []
@@ -104,53 +109,57 @@ def render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, ma
                                 if len(filtered_cats) == 0:
                                     st.warning("⚠️ Выберите хотя бы одну категорию для отображения")
                                 
-                                # Рисуем категории в прямом порядке: сначала большие (снизу, zorder=1), потом маленькие (сверху, zorder=высокий)
-                                # Это гарантирует, что маленькие категории будут видны поверх больших
-                                for i, cat in enumerate(filtered_cats):
-                                    # Фильтруем данные для каждой категории из ПОЛНОГО датасета
-                                    subset_full = full_df[full_df[hue_col] == cat].copy()
+                                if use_density_scatter(len(full_df), max_plot_points, density_scatter):
+                                    # Плотность по всем строкам: цвет клетки - смесь цветов категорий по их долям
+                                    raster = compute_density_raster(dataset_id, x_col, y_col, hue_col, tuple(sorted_cats))
+                                    if raster is not None and filtered_cats:
+                                        hue_raster = raster
+                                        for cat in filtered_cats:
+                                            categories_info.append(f"{cat}: {raster.group_count(cat)} точек (плотность по всем строкам)")
+                                else:
+                                    # Стратифицированная выборка: от каждой категории не меньше MIN_STRATUM_ROWS строк
+                                    hue_sample = sample_data_for_plotting(df[[x_col, y_col, hue_col]], max_plot_points, use_sampling,
+                                                                          dataset_id, 'stratified', hue_col)
+                                    # Рисуем категории в прямом порядке: сначала большие (снизу, zorder=1), потом маленькие (сверху, zorder=высокий)
+                                    # Это гарантирует, что маленькие категории будут видны поверх больших
+                                    for i, cat in enumerate(filtered_cats):
+                                        # Фильтруем данные для каждой категории из ПОЛНОГО датасета
+                                        subset_full = full_df[full_df[hue_col] == cat].copy()
                                     
-                                    if len(subset_full) > 0:
-                                        # Очищаем от пропущенных значений в x_col и y_col
-                                        subset_clean = subset_full[[x_col, y_col]].dropna()
+                                        if len(subset_full) > 0:
+                                            # Очищаем от пропущенных значений в x_col и y_col
+                                            subset_clean = subset_full[[x_col, y_col]].dropna()
                                         
-                                        if len(subset_clean) > 0:
-                                            # Применяем выборку для визуализации
-                                            max_points_per_cat = max(50, max_plot_points // max(1, len(unique_cats)))
+                                            if len(subset_clean) > 0:
+                                                # Точки категории для визуализации - из общей выборки
+                                                subset_plot = hue_sample[hue_sample[hue_col] == cat][[x_col, y_col]].dropna()
                                             
-                                            if use_sampling and len(subset_clean) > max_points_per_cat:
-                                                n_sample = min(max_points_per_cat, len(subset_clean))
-                                                subset_plot = subset_clean.sample(n=n_sample, random_state=42 + i)
-                                            else:
-                                                subset_plot = subset_clean
-                                            
-                                            # Используем цвет по индексу категории в исходном списке (для консистентности цветов)
-                                            original_idx = sorted_cats.index(cat)
-                                            color = colors_list[original_idx % len(colors_list)]
+                                                # Используем цвет по индексу категории в исходном списке (для консистентности цветов)
+                                                original_idx = sorted_cats.index(cat)
+                                                color = colors_list[original_idx % len(colors_list)]
                                             
-                                            # zorder: большие категории (i=0) -> zorder=1 (снизу), маленькие -> zorder=высокий (сверху)
-                                            zorder_value = i + 1
+                                                # zorder: большие категории (i=0) -> zorder=1 (снизу), маленькие -> zorder=высокий (сверху)
+                                                zorder_value = i + 1
                                             
-                                            # Размер точек: маленькие категории получают больший размер
-                                            if len(subset_clean) < 50:
-                                                point_size = 100
-                                            else:
-                                                point_size = 60
+                                                # Размер точек: маленькие категории получают больший размер
+                                                if len(subset_clean) < 50:
+                                                    point_size = 100
+                                                else:
+                                                    point_size = 60
                                             
-                                            # Рисуем scatter plot для этой категории
-                                            scatter = ax.scatter(subset_plot[x_col], subset_plot[y_col], 
-                                                         alpha=0.8, s=point_size, label=f'{cat} ({len(subset_clean)})', 
-                                                         c=color, edgecolors='black', linewidths=1.2,
-                                                         zorder=zorder_value)
+                                                # Scatter plot для этой категории
+                                                layers.append((subset_plot, dict(alpha=0.8, s=point_size, label=f'{cat} ({len(subset_clean)})',
+                                                                                 c=color, edgecolors='black', linewidths=1.2,
+                                                                                 zorder=zorder_value)))
                                             
-                                            debug_info.append(f"{cat}: {len(subset_clean)} точек, цвет={color}, отображено={len(subset_plot)}, zorder={zorder_value}, x_range=[{subset_plot[x_col].min():.2f}, {subset_plot[x_col].max():.2f}], y_range=[{subset_plot[y_col].min():.2f}, {subset_plot[y_col].max():.2f}]")
-                                            categories_info.append(f"{cat}: {len(subset_clean)} точек (отображено {len(subset_plot)})")
+                                                debug_info.append(f"{cat}: {len(subset_clean)} точек, цвет={color}, отображено={len(subset_plot)}, zorder={zorder_value}, x_range=[{subset_plot[x_col].min():.2f}, {subset_plot[x_col].max():.2f}], y_range=[{subset_plot[y_col].min():.2f}, {subset_plot[y_col].max():.2f}]")
+                                                categories_info.append(f"{cat}: {len(subset_clean)} точек (отображено {len(subset_plot)})")
+                                            else:
+                                                categories_info.append(f"{cat}: нет данных (все пропущены в x/y)")
+                                                debug_info.append(f"{cat}: нет данных после dropna")
                                         else:
-                                            categories_info.append(f"{cat}: нет данных (все пропущены в x/y)")
-                                            debug_info.append(f"{cat}: нет данных после dropna")
-                                    else:
-                                        categories_info.append(f"{cat}: нет данных")
-                                        debug_info.append(f"{cat}: не найдено в full_df")
+                                            categories_info.append(f"{cat}: нет данных")
+                                            debug_info.append(f"{cat}: не найдено в full_df")
                                 
                                 # Показываем информацию о категориях
                                 if len(categories_info) > 0:
@@ -166,54 +175,74 @@ def render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, ma
                                         for debug in debug_info:
                                             st.text(debug)
                                 
-                                if len(unique_cats) > 0:
-                                    ax.legend(title=hue_col, fontsize=9, loc='best', framealpha=0.9)
+                                hue_legend = len(unique_cats) > 0
                             else:
                                 # Слишком много категорий - показываем без группировки
                                 plot_df_clean = full_df[[x_col, y_col]].dropna()
-                                if len(plot_df_clean) > 0:
-                                    plot_df_sampled = sample_data_for_plotting(plot_df_clean, max_plot_points, use_sampling)
-                                    ax.scatter(plot_df_sampled[x_col], plot_df_sampled[y_col], alpha=0.6, s=30)
+                                if use_density_scatter(len(plot_df_clean), max_plot_points, density_scatter):
+                                    plain_density = True
+                                elif len(plot_df_clean) > 0:
+                                    plot_df_sampled = sample_data_for_plotting(df[[x_col, y_col]], max_plot_points, use_sampling,
+                                                                               dataset_id, 'extremes', (x_col, y_col)).dropna()
+                                    layers.append((plot_df_sampled, dict(alpha=0.6, s=30)))
                                 st.warning(f"Слишком много категорий ({len(unique_cats)}). Показан график без группировки.")
                         else:
                             # hue_col указан, но full_df пуст или None - показываем без группировки
                             plot_df_clean = df[[x_col, y_col]].dropna()
-                            plot_df_sampled = sample_data_for_plotting(plot_df_clean, max_plot_points, use_sampling)
-                            if len(plot_df_sampled) > 0:
-                                ax.scatter(plot_df_sampled[x_col], plot_df_sampled[y_col], alpha=0.6, s=30, color='steelblue')
+                            plot_df_sampled = sample_data_for_plotting(df[[x_col, y_col]], max_plot_points, use_sampling,
+                                                                       dataset_id, 'extremes', (x_col, y_col)).dropna()
+                            if use_density_scatter(len(plot_df_clean), max_plot_points, density_scatter):
+                                plain_density = True
+                            elif len(plot_df_sampled) > 0:
+                                layers.append((plot_df_sampled, dict(alpha=0.6, s=30, color='steelblue')))
                             st.warning(f"Признак '{hue_col}' не найден в данных или нет данных. Показан график без группировки.")
+                    elif use_density_scatter(len(df), max_plot_points, density_scatter):
+                        # Без цветовой группировки, все строки как плотность вместо выборки
+                        plain_density = True
                     else:
                         # Без цветовой группировки - просто scatter plot
                         plot_df_clean = plot_df[[x_col, y_col]].dropna()
                         if len(plot_df_clean) > 0:
-                            ax.scatter(plot_df_clean[x_col], plot_df_clean[y_col], alpha=0.6, s=30, color='steelblue')
+                            layers.append((plot_df_clean, dict(alpha=0.6, s=30, color='steelblue')))
                         else:
                             st.warning("⚠️ Нет данных для построения графика (все значения пропущены)")
                     
-                    # Линия тренда
-                    try:
-                        mask = df[[x_col, y_col]].notna().all(axis=1)
-                        if mask.sum() > 2:
-                            z = np.polyfit(df.loc[mask, x_col], df.loc[mask, y_col], 1)
-                            p = np.poly1d(z)
-                            x_line = np.linspace(df[x_col].min(), df[x_col].max(), 100)
-                            ax.plot(x_line, p(x_line), "r--", alpha=0.8, linewidth=2, label='Линия тренда')
-                            # Вычисляем корреляцию
-                            corr = df[[x_col, y_col]].corr().iloc[0, 1]
-                            ax.text(0.05, 0.95, f'Корреляция: {corr:.3f}', 
-                                   transform=ax.transAxes, fontsize=11,
-                                   verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-                    except:
-                        pass
-                    
-                    ax.set_xlabel(x_col, fontsize=11)
-                    ax.set_ylabel(y_col, fontsize=11)
-                    ax.set_title(f'Scatter plot: {x_col} vs {y_col}', fontsize=12, fontweight='bold')
-                    ax.grid(alpha=0.3)
-                    ax.legend()
-                    plt.tight_layout()
-                    st.pyplot(fig)
-                    plt.close(fig)
+                    def draw_scatter():
+                        fig, ax = plt.subplots(figsize=(10, 6))
+                        if plain_density:
+                            _draw_density(fig, ax, dataset_id, x_col, y_col)
+                        if hue_raster is not None:
+                            hue_raster.draw(ax, groups=filtered_cats, colors=SCATTER_COLORS)
+                        for points, scatter_kwargs in layers:
+                            ax.scatter(points[x_col], points[y_col], **scatter_kwargs)
+                        if hue_legend:
+                            ax.legend(title=hue_col, fontsize=9, loc='best', framealpha=0.9)
+                        
+                        # Линия тренда
+                        try:
+                            mask = df[[x_col, y_col]].notna().all(axis=1)
+                            if mask.sum() > 2:
+                                z = np.polyfit(df.loc[mask, x_col], df.loc[mask, y_col], 1)
+                                p = np.poly1d(z)
+                                x_line = np.linspace(df[x_col].min(), df[x_col].max(), 100)
+                                ax.plot(x_line, p(x_line), "r--", alpha=0.8, linewidth=2, label='Линия тренда')
+                                # Вычисляем корреляцию
+                                corr = df[[x_col, y_col]].corr().iloc[0, 1]
+                                ax.text(0.05, 0.95, f'Корреляция: {corr:.3f}', 
+                                       transform=ax.transAxes, fontsize=11,
+                                       verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
+                        except:
+                            pass
+                        
+                        ax.set_xlabel(x_col, fontsize=11)
+                        ax.set_ylabel(y_col, fontsize=11)
+                        ax.set_title(f'Scatter plot: {x_col} vs {y_col}', fontsize=12, fontweight='bold')
+                        ax.grid(alpha=0.3)
+                        ax.legend()
+                        plt.tight_layout()
+                        return fig
+                    show_plot(dataset_id, ('pair_scatter', x_col, y_col, hue_col, tuple(filtered_cats),
+                                           max_plot_points, use_sampling, density_scatter), draw_scatter)
                     st.success("✅ График успешно построен!")
                 except Exception as e:
                     st.error(f"Ошибка при построении графика: {str(e)}")
@@ -238,65 +267,51 @@ def render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, ma
             if build_matrix:
                 with st.spinner("Построение матрицы scatter plots..."):
                     try:
-                        # Выбираем данные для визуализации
-                        plot_df = sample_data_for_plotting(df[numeric_cols], max_plot_points, use_sampling)
-                        st.write(f"📊 Используется выборка из {len(plot_df):,} строк для построения матрицы")
+                        # Выбираем данные для визуализации: все строки как плотность или выборка
+                        matrix_density = use_density_scatter(len(df), max_plot_points, density_scatter)
+                        if matrix_density:
+                            st.write(f"📊 Матрица построена по всем {len(df):,} строкам (плотность точек)")
+                        else:
+                            plot_df = sample_data_for_plotting(df[numeric_cols], max_plot_points, use_sampling,
+                                                               dataset_id, 'extremes', tuple(numeric_cols))
+                            st.write(f"📊 Используется {SAMPLING_STRATEGIES['extremes']} из {len(plot_df):,} строк для построения матрицы")
                         
                         # Создаем кастомную матрицу scatter plots
                         n = len(numeric_cols)
-                        fig, axes = plt.subplots(n, n, figsize=(4*n, 4*n))
-                        
-                        # Убеждаемся, что axes - это двумерный массив
-                        if not isinstance(axes, np.ndarray):
-                            axes = np.array([[axes]])
-                        elif axes.ndim == 1:
-                            axes = axes.reshape(n, n)
-                        
-                        # Прогресс-бар для больших матриц (только если много графиков)
-                        if n * n > 9:
-                            progress_bar = st.progress(0)
-                            total_plots = n * n
-                        else:
-                            progress_bar = None
-                        
-                        for i, col1 in enumerate(numeric_cols):
-                            for j, col2 in enumerate(numeric_cols):
-                                ax = axes[i, j]
-                                
-                                if i == j:
-                                    # Диагональ - гистограмма (используем выборку)
-                                    ax.hist(plot_df[col1].dropna(), bins=15, color='skyblue', alpha=0.7, edgecolor='black')  # Уменьшаем bins
-                                    ax.set_title(col1, fontsize=8, fontweight='bold')
-                                else:
-                                    # Scatter plot (используем выборку)
-                                    ax.scatter(plot_df[col2], plot_df[col1], alpha=0.4, s=8)  # Уменьшаем размер и прозрачность точек
-                                    # Линия тренда (используем все данные для точности, но только если не слишком много данных)
-                                    try:
-                                        if len(df) < 10000:  # Линия тренда только для небольших датасетов
-                                            mask = df[[col1, col2]].notna().all(axis=1)
-                                            if mask.sum() > 2:
-                                                z = np.polyfit(df.loc[mask, col2], df.loc[mask, col1], 1)
-                                                p = np.poly1d(z)
-                                                x_line = np.linspace(df[col2].min(), df[col2].max(), 50)  # Уменьшаем точки
-                                                ax.plot(x_line, p(x_line), "r--", alpha=0.4, linewidth=0.8)
-                                    except:
-                                        pass
-                                    ax.set_xlabel(col2, fontsize=7)
-                                    ax.set_ylabel(col1, fontsize=7)
-                                
-                                ax.grid(alpha=0.2)  # Уменьшаем прозрачность сетки
-                                ax.tick_params(labelsize=6)  # Уменьшаем размер шрифта
-                                
-                                # Обновляем прогресс (только если есть прогресс-бар)
-                                if progress_bar:
-                                    plot_idx = i * n + j + 1
-                                    progress_bar.progress(plot_idx / total_plots)
-                        
-                        if progress_bar:
-                            progress_bar.empty()  # Убираем прогресс-бар
-                        plt.tight_layout()
-                        st.pyplot(fig)
-                        plt.close(fig)  # Закрываем фигуру для освобождения памяти
+                        def draw_matrix():
+                            # Одна фигура n x n: ячейки - панели общего описания
+                            panels = []
+                            for i, col1 in enumerate(numeric_cols):
+                                for j, col2 in enumerate(numeric_cols):
+                                    if i == j:
+                                        # Диагональ - гистограмма по всем строкам из общей раскладки по бинам
+                                        layers = [layer('set_title', col1, fontsize=8, fontweight='bold')]
+                                        binned = compute_binned_column(dataset_id, col1)
+                                        if binned is not None:
+                                            layers.append(layer('hist', binned, bins=15, color='skyblue', alpha=0.7, edgecolor='black'))  # Уменьшаем bins
+                                    else:
+                                        if matrix_density:
+                                            layers = [layer('density', compute_density_raster(dataset_id, col2, col1))]
+                                        else:
+                                            # Scatter plot (используем выборку)
+                                            layers = [layer('scatter', plot_df[col2].to_numpy(), plot_df[col1].to_numpy(), alpha=0.4, s=8)]  # Уменьшаем размер и прозрачность точек
+                                        # Линия тренда (используем все данные для точности, но только если не слишком много данных)
+                                        try:
+                                            if len(df) < 10000:  # Линия тренда только для небольших датасетов
+                                                mask = df[[col1, col2]].notna().all(axis=1)
+                                                if mask.sum() > 2:
+                                                    z = np.polyfit(df.loc[mask, col2], df.loc[mask, col1], 1)
+                                                    p = np.poly1d(z)
+                                                    x_line = np.linspace(df[col2].min(), df[col2].max(), 50)  # Уменьшаем точки
+                                                    layers.append(layer('plot', x_line, p(x_line), "r--", alpha=0.4, linewidth=0.8))
+                                        except:
+                                            pass
+                                        layers += [layer('set_xlabel', col2, fontsize=7), layer('set_ylabel', col1, fontsize=7)]
+                                    
+                                    layers += [layer('grid', alpha=0.2), layer('tick_params', labelsize=6)]  # Уменьшаем шрифт
+                                    panels.append(layers)
+                            return render_plot_specs([PlotSpec(tuple(panels), figsize=(4 * n, 4 * n), layout=(n, n))])[0]
+                        show_plot(dataset_id, ('scatter_matrix', tuple(numeric_cols), max_plot_points, use_sampling, density_scatter), draw_matrix)
                         st.success("✅ Матрица scatter plots успешно построена!")
                     except Exception as e:
                         st.error(f"Ошибка при построении матрицы scatter plots: {str(e)}")
@@ -316,16 +331,25 @@ def render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, ma
         if cat_col and num_col:
             with st.spinner("Построение Violin plot..."):
                 try:
-                    # Используем выборку для violin plot
-                    violin_df = sample_data_for_plotting(df[[cat_col, num_col]], max_plot_points, use_sampling)
+                    # Плотности по всем строкам из общей раскладки колонки по группам, выборка не нужна
+                    group_profile = compute_column_profiles(dataset_id)[cat_col]
+                    top_groups = group_profile.value_counts(VIOLIN_MAX_GROUPS).index
+                    if group_profile.nunique > VIOLIN_MAX_GROUPS:
+                        st.caption(f"Показаны {VIOLIN_MAX_GROUPS} самых частых значений из {group_profile.nunique}")
+                    binned = compute_binned_column(dataset_id, num_col, cat_col, tuple(top_groups))
                     
-                    fig, ax = plt.subplots(figsize=(10, 6))
-                    sns.violinplot(x=cat_col, y=num_col, data=violin_df, ax=ax, palette='Set2')
-                    ax.set_title(f'Распределение {num_col} по {cat_col}', fontsize=12, fontweight='bold')
-                    ax.tick_params(axis='x', rotation=45)
-                    ax.grid(alpha=0.3, axis='y')
-                    st.pyplot(fig)
-                    plt.close(fig)  # Закрываем фигуру для освобождения памяти
+                    def draw_violin():
+                        fig, ax = plt.subplots(figsize=(10, 6))
+                        if binned is not None:
+                            draw_violins(ax, binned, groups=top_groups, labels=top_groups,
+                                         colors=sns.color_palette('Set2'))
+                        ax.set_xlabel(cat_col)
+                        ax.set_ylabel(num_col)
+                        ax.set_title(f'Распределение {num_col} по {cat_col}', fontsize=12, fontweight='bold')
+                        ax.tick_params(axis='x', rotation=45)
+                        ax.grid(alpha=0.3, axis='y')
+                        return fig
+                    show_plot(dataset_id, ('violin', cat_col, num_col), draw_violin)
                 except Exception as e:
                     st.error(f"Ошибка при построении Violin plot: {str(e)}")
                     import traceback
@@ -339,6 +363,14 @@ def render_visualizations_tab(df, numeric_cols, categorical_cols, target_col, ma
     with col2:
         st.write("**Категориальные признаки:**", ", ".join(categorical_cols) if categorical_cols else "Нет")
     
-    st.write(f"**Пропущенных значений:** {df.isnull().sum().sum()}")
+    st.write(f"**Пропущенных значений:** {profile_series(compute_column_profiles(dataset_id), 'null_count').sum()}")
     if target_col:
         st.write(f"**Целевая переменная:** {target_col}")
+
+
+def _draw_density(fig, ax, dataset_id, x_col, y_col):
+    """Scatter plot по всем строкам как 2D-гистограмма плотности с цветовой шкалой"""
+    raster = compute_density_raster(dataset_id, x_col, y_col)
+    image = raster.draw(ax) if raster is not None else None
+    if image is not None:
+        fig.colorbar(image, ax=ax, label='Число точек')
@@ -6,14 +6,32 @@ import numpy as np
 import streamlit as st
 import os
 import json
+import codecs
+import warnings
+import base64
+import io
+import hashlib
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
 from pathlib import Path
 
 
-def sample_data_for_plotting(df, max_points=None, use_sampling=True):
-    """Выбирает данные для визуализации, если датасет слишком большой"""
+def sample_data_for_plotting(df, max_points=None, use_sampling=True, dataset_id=None, strategy='reservoir', column=None):
+    """Выбирает данные для визуализации, если датасет слишком большой
+    
+    С dataset_id строки берутся по кэшированным номерам выборки датасета (df - его строки, например подмножество колонок).
+    """
     if df is None or df.empty:
         return df
     
+    if dataset_id is not None:
+        return df.iloc[plot_sample_positions(dataset_id, max_points, use_sampling, strategy, column)]
+    
     if not use_sampling:
         return df
     
@@ -28,208 +46,2907 @@ def sample_data_for_plotting(df, max_points=None, use_sampling=True):
     return sampled_df
 
 
+# ========== ОЦЕНКА ПЛОТНОСТИ (KDE) ==========
+
+# Узлов сетки, на которую раскладываются точки перед сверткой
+KDE_GRID_POINTS = 512
+# Насколько кривая продолжается за крайние значения (в ширинах окна)
+KDE_CUT = 3
+
+
+def kde_bandwidth(values):
+    """Ширина гауссова окна по правилу Скотта (как у scipy.stats.gaussian_kde)"""
+    return float(np.std(values, ddof=1)) * len(values) ** (-1 / 5) if len(values) > 1 else 0.0
+
+
+def _linear_binning(values, low, step, grid_points, codes=None, n_groups=1):
+    """Раскладывает точки по узлам сетки: каждая делит вес между двумя соседними узлами"""
+    position = (values - low) / step
+    inside = (position >= 0) & (position <= grid_points - 1)
+    position = position[inside]
+    left = np.minimum(position.astype(np.intp), grid_points - 2)
+    weight = position - left
+    if codes is not None:
+        left = left + codes[inside] * grid_points
+    size = grid_points * n_groups
+    counts = np.bincount(left, 1 - weight, minlength=size) + np.bincount(left + 1, weight, minlength=size)
+    return counts if codes is None else counts.reshape(n_groups, grid_points)
+
+
+def _gaussian_smooth(counts, step, bandwidth, n):
+    """Плотность из разложенных по сетке весов: свертка с гауссовым ядром через FFT"""
+    from scipy.signal import fftconvolve
+    
+    # Ядро обрезается на 4 ширинах окна, дальше его вклад пренебрежимо мал
+    half_width = min(int(np.ceil(4 * bandwidth / step)), len(counts) - 1)
+    offsets = np.arange(-half_width, half_width + 1) * step / bandwidth
+    kernel = np.exp(-0.5 * offsets ** 2)
+    # Нормировка на сетке: площадь под кривой равна 1 даже при узком окне
+    kernel /= kernel.sum() * step
+    return np.maximum(fftconvolve(counts, kernel, mode='same') / n, 0.0)
+
+
+def binned_kde(values, grid_points=KDE_GRID_POINTS, bandwidth=None, bounds=None):
+    """KDE за линейное время: линейная раскладка точек по сетке и свертка с гауссовым ядром через FFT
+    
+    Возвращает (сетка, плотность) или None, если плотность не определена.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    n = len(values)
+    if bandwidth is None:
+        bandwidth = kde_bandwidth(values)
+    if n < 2 or not bandwidth > 0:
+        return None
+    if bounds is None:
+        bounds = (values.min() - KDE_CUT * bandwidth, values.max() + KDE_CUT * bandwidth)
+    grid = np.linspace(bounds[0], bounds[1], grid_points)
+    step = grid[1] - grid[0]
+    counts = _linear_binning(values, grid[0], step, grid_points)
+    return grid, _gaussian_smooth(counts, step, bandwidth, n)
+
+
 def detect_and_fix_shift(df):
     """Обнаруживает и исправляет сдвиги в данных из-за запятых в значениях"""
     if df is None or df.empty:
         return df, False
     
-    # Определяем тип разделителя
-    sample_row = df.iloc[0].astype(str).str.cat(sep=' ')
-    has_tabs = '\t' in sample_row
+    # Определяем тип разделителя
+    sample_row = df.iloc[0].astype(str).str.cat(sep=' ')
+    has_tabs = '\t' in sample_row
+    
+    fixed = False
+    original_shape = df.shape[1]
+    
+    # Проверяем числовые колонки - если в них текст, возможно есть сдвиг
+    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    
+    # Если слишком мало числовых колонок, возможно есть проблема
+    if len(numeric_cols) < df.shape[1] * 0.3:
+        # Проверяем последние колонки - они должны быть числовыми
+        last_cols = df.columns[-5:].tolist()
+        for col in last_cols:
+            if df[col].dtype == 'object':
+                # Пытаемся преобразовать в число
+                non_numeric = df[col].astype(str).str.contains(r'[^0-9.\-]', na=False, regex=True)
+                if non_numeric.sum() > len(df) * 0.1:  # Более 10% не числовых
+                    fixed = True
+                    break
+    
+    # Если обнаружен сдвиг, пытаемся исправить
+    if fixed or has_tabs:
+        return df, False  # Пока возвращаем как есть, но добавим предупреждение
+    
+    return df, fixed
+
+
+def fix_data_shift(df):
+    """Проверяет типы данных в первых и последних 15 строках на наличие сдвигов"""
+    if df is None or df.empty or df.shape[0] < 30:
+        return df, False, None
+    
+    # Берем первые и последние 15 строк
+    first_15 = df.head(15)
+    last_15 = df.tail(15)
+    
+    # Определяем типы данных для каждой колонки в первых и последних строках
+    def get_column_type(series):
+        """Определяет тип колонки: numeric или text"""
+        if series.dtype in [np.int64, np.float64]:
+            return 'numeric'
+        
+        # Пробуем преобразовать в число
+        numeric_count = pd.to_numeric(series, errors='coerce').notna().sum()
+        numeric_ratio = numeric_count / len(series) if len(series) > 0 else 0
+        
+        if numeric_ratio > 0.7:  # Более 70% числовых - считаем числовой
+            return 'numeric'
+        else:
+            return 'text'
+    
+    # Получаем типы для каждой колонки
+    first_types = {}
+    last_types = {}
+    
+    for col in df.columns:
+        first_types[col] = get_column_type(first_15[col])
+        last_types[col] = get_column_type(last_15[col])
+    
+    # Проверяем несовпадения
+    mismatches = []
+    for col in df.columns:
+        if first_types[col] != last_types[col]:
+            mismatches.append({
+                'column': col,
+                'first_15_type': first_types[col],
+                'last_15_type': last_types[col]
+            })
+    
+    # Если есть несовпадения - возвращаем ошибку
+    if mismatches:
+        error_msg = "⚠️ Обнаружено несовпадение типов данных между первыми и последними строками:\n\n"
+        for mm in mismatches:
+            error_msg += f"- Колонка '{mm['column']}': первые 15 строк - {mm['first_15_type']}, последние 15 строк - {mm['last_15_type']}\n"
+        error_msg += "\nЭто может указывать на сдвиг данных в середине датасета (например, из-за запятых в текстовых полях)."
+        return df, False, error_msg
+    
+    return df, False, None
+
+
+# Сколько байт читаем из начала файла для определения разделителя и кодировки
+SNIFF_BYTES = 64 * 1024
+
+# Движок парсинга CSV: 'c' (по умолчанию) или 'pyarrow' (многопоточный, если установлен)
+CSV_ENGINE = 'c'
+
+
+def _sniff_encoding(sample):
+    """Определяет кодировку по первым байтам файла"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # final=False - многобайтовый символ может быть обрезан на границе выборки
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _sniff_delimiter(text):
+    """Определяет разделитель по первым строкам файла"""
+    # Считаем количество табуляций, запятых и точек с запятой в первых строках
+    first_lines = [line for line in text.split('\n')[:5] if line.strip()]
+    avg_counts = {
+        sep: np.mean([line.count(sep) for line in first_lines]) if first_lines else 0
+        for sep in ['\t', ',', ';']
+    }
+    
+    # Если табуляций больше и они более равномерны - используем табуляцию
+    if avg_counts['\t'] > avg_counts[','] and avg_counts['\t'] > 2:
+        return '\t'
+    elif avg_counts[','] > 2 and avg_counts[','] >= avg_counts[';']:
+        return ','
+    elif avg_counts[';'] > 2:
+        return ';'
+    return '\t'  # По умолчанию табуляция для TSV
+
+
+def _read_csv_counting_bad_lines(source, delimiter, encoding, engine=None, dtype_backend=None):
+    """Читает CSV быстрым движком и возвращает (df, число пропущенных строк); dtype_backend='pyarrow' - типы Arrow"""
+    engine = engine or CSV_ENGINE
+    backend = {'dtype_backend': dtype_backend} if dtype_backend else {}
+    if engine == 'pyarrow':
+        bad_rows = []
+        df = pd.read_csv(source, sep=delimiter, encoding=encoding, engine='pyarrow',
+                         on_bad_lines=lambda row: bad_rows.append(row) or 'skip', **backend)
+        return df, len(bad_rows)
+    
+    # C-движок не поддерживает callable в on_bad_lines, поэтому считаем предупреждения
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', pd.errors.ParserWarning)
+        df = pd.read_csv(source, sep=delimiter, quotechar='"', encoding=encoding,
+                         on_bad_lines='warn', engine='c', low_memory=False, **backend)
+    bad_lines = sum(str(w.message).count('Skipping line') for w in caught
+                    if issubclass(w.category, pd.errors.ParserWarning))
+    return df, bad_lines
+
+
+# ========== ОТПЕЧАТКИ ДАННЫХ ==========
+
+# Размер блока, которым буфер загрузки подается в хэш
+FINGERPRINT_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def _checksum(parts):
+    """128-битный отпечаток (BLAKE2b) последовательности буферов"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def _buffer_chunks(buffer):
+    """Весь буфер последовательными блоками без копирования"""
+    view = memoryview(buffer)
+    for offset in range(0, len(view), FINGERPRINT_CHUNK_BYTES):
+        yield view[offset:offset + FINGERPRINT_CHUNK_BYTES]
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _upload_fingerprint(file_id, name, size, _uploaded_file):
+    """Отпечаток загрузки, вычисляется один раз на идентификатор файла Streamlit"""
+    with _uploaded_file.getbuffer() as buffer:
+        return _checksum([f"{name}|{size}".encode(), *_buffer_chunks(buffer)])
+
+
+def fingerprint_upload(uploaded_file):
+    """Отпечаток загруженного файла по имени, размеру и всему содержимому"""
+    return _upload_fingerprint(uploaded_file.file_id, uploaded_file.name, uploaded_file.size, uploaded_file)
+
+
+# Отпечатки уже посчитанных DataFrame: id объекта -> (слабая ссылка, отпечаток)
+_FRAME_FINGERPRINTS = {}
+_FRAME_FINGERPRINTS_LOCK = threading.Lock()
+
+
+def fingerprint_dataframe(df):
+    """Отпечаток DataFrame по буферам колонок (без преобразования значений в строки)"""
+    with _FRAME_FINGERPRINTS_LOCK:
+        cached = _FRAME_FINGERPRINTS.get(id(df))
+    if cached is not None and cached[0]() is df:
+        return cached[1]
+    
+    def parts():
+        yield f"{df.shape}|{list(df.columns)}|{list(df.dtypes.astype(str))}".encode()
+        yield pd.util.hash_pandas_object(df.index).to_numpy().view(np.uint8)
+        for col in df.columns:
+            values = df[col].to_numpy()
+            if values.dtype.kind in 'biufcmM':
+                # Числовые буферы хэшируются как есть
+                yield np.ascontiguousarray(values).view(np.uint8)
+            else:
+                yield pd.util.hash_pandas_object(df[col], index=False).to_numpy().view(np.uint8)
+    
+    fingerprint = _checksum(parts())
+    with _FRAME_FINGERPRINTS_LOCK:
+        for key in [key for key, (ref, _) in _FRAME_FINGERPRINTS.items() if ref() is None]:
+            del _FRAME_FINGERPRINTS[key]
+        _FRAME_FINGERPRINTS[id(df)] = (weakref.ref(df), fingerprint)
+    return fingerprint
+
+
+# ========== ДИСКОВЫЙ КЭШ ДАТАСЕТОВ ==========
+
+# Каталог и лимит размера дискового кэша (0 МБ - кэш отключен)
+DATASET_CACHE_DIR = Path(os.environ.get('EDA_CACHE_DIR', Path.home() / '.cache' / 'eda_app' / 'datasets'))
+DATASET_CACHE_MAX_MB = int(os.environ.get('EDA_CACHE_MAX_MB', 2048))
+
+
+def _dataset_cache_path(fingerprint, delimiter, dtype_backend=None):
+    """Путь к файлу кэша для отпечатка загрузки, выбранного разделителя и типов хранения"""
+    delimiter_key = 'auto' if delimiter is None else f"{ord(delimiter):02x}"
+    # Parquet восстанавливает типы колонок, поэтому датасеты в типах Arrow кэшируются отдельно
+    backend_key = f"_{dtype_backend}" if dtype_backend else ''
+    return DATASET_CACHE_DIR / f"{fingerprint}_{delimiter_key}{backend_key}.parquet"
+
+
+def load_cached_dataset(fingerprint, delimiter, dtype_backend=None):
+    """Читает датасет из дискового кэша, если он там есть"""
+    if not fingerprint or DATASET_CACHE_MAX_MB <= 0:
+        return None
+    path = _dataset_cache_path(fingerprint, delimiter, dtype_backend)
+    if not path.exists():
+        return None
+    try:
+        df = pd.read_parquet(path, **({'dtype_backend': dtype_backend} if dtype_backend else {}))
+        # Обновляем время доступа для LRU-вытеснения
+        os.utime(path)
+        return df
+    except Exception:
+        # Поврежденный файл кэша удаляем, данные будут перечитаны из CSV
+        path.unlink(missing_ok=True)
+        return None
+
+
+def save_cached_dataset(fingerprint, delimiter, df, dtype_backend=None):
+    """Сохраняет датасет в дисковый кэш (Parquet) и вытесняет старые записи"""
+    if not fingerprint or DATASET_CACHE_MAX_MB <= 0 or df is None:
+        return False
+    path = _dataset_cache_path(fingerprint, delimiter, dtype_backend)
+    tmp_path = None
+    try:
+        DATASET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Пишем в свой временный файл, чтобы параллельные сессии не прочитали неполный файл
+        # и не писали в один и тот же временный файл
+        with tempfile.NamedTemporaryFile(dir=DATASET_CACHE_DIR, prefix=f"{path.stem}.", suffix='.tmp', delete=False) as f:
+            tmp_path = Path(f.name)
+            df.to_parquet(f, index=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        # Не все датасеты сериализуются в Parquet (например, смешанные типы в колонке)
+        if tmp_path is not None:
+            tmp_path.unlink(missing_ok=True)
+        return False
+    evict_dataset_cache()
+    return True
+
+
+def evict_dataset_cache(max_mb=None):
+    """Удаляет давно неиспользуемые файлы кэша, пока размер не станет меньше лимита"""
+    max_bytes = (DATASET_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    if not DATASET_CACHE_DIR.exists():
+        return
+    entries = []
+    for path in DATASET_CACHE_DIR.glob('*.parquet'):
+        try:
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        except FileNotFoundError:
+            continue
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total_size -= size
+
+
+# ========== ХРАНЕНИЕ КОЛОНОК ==========
+
+# Варианты хранения колонок в памяти: numpy - типы numpy и строки pandas, pyarrow - типы Arrow для всех колонок
+STORAGE_BACKENDS = {'numpy': 'NumPy', 'pyarrow': 'Apache Arrow (pyarrow)'}
+
+
+def is_text_dtype(dtype):
+    """Строковый тип колонки: object, строки pandas или строки Arrow"""
+    return not isinstance(dtype, pd.CategoricalDtype) and pd.api.types.is_string_dtype(dtype)
+
+
+def column_types(df):
+    """Списки числовых и категориальных (строковых и category) колонок при любом хранении"""
+    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    categorical_cols = [col for col, dtype in df.dtypes.items()
+                        if isinstance(dtype, pd.CategoricalDtype) or is_text_dtype(dtype)]
+    return numeric_cols, categorical_cols
+
+
+def numpy_numeric_frame(df):
+    """Числовые колонки в float64 numpy (пропуски - NaN), если среди них есть типы Arrow; иначе без копирования"""
+    if all(isinstance(dtype, np.dtype) for dtype in df.dtypes):
+        return df
+    return pd.DataFrame(df.to_numpy(dtype=np.float64, na_value=np.nan), index=df.index, columns=df.columns)
+
+
+def convert_storage(df, storage='numpy'):
+    """Переводит колонки в типы выбранного хранения (для numpy датасет не меняется)"""
+    if storage == 'pyarrow':
+        return df.convert_dtypes(dtype_backend='pyarrow')
+    return df
+
+
+# ========== СЛОВАРНОЕ КОДИРОВАНИЕ КАТЕГОРИЙ ==========
+
+# Строковые колонки с числом уникальных значений не больше порога хранятся как category (0 - не преобразовывать)
+CATEGORY_MAX_UNIQUE = int(os.environ.get('EDA_CATEGORY_MAX_UNIQUE', 1000))
+# ... и только если уникальных значений не больше этой доли заполненных строк (иначе словарь не экономит память)
+CATEGORY_MAX_UNIQUE_SHARE = 0.5
+
+
+def _dictionary_encode(series, max_unique):
+    """Колонка как category (словарь значений + целые коды) или None, если уникальных значений слишком много"""
+    # Одна хэш-таблица дает и коды, и словарь значений
+    codes, uniques = pd.factorize(series)
+    if len(uniques) > max_unique or len(uniques) > CATEGORY_MAX_UNIQUE_SHARE * (codes >= 0).sum():
+        return None
+    try:
+        # Категории по порядку значений, как у astype('category')
+        order = np.argsort(np.asarray(uniques), kind='stable')
+        ranks = np.empty(len(order), dtype=codes.dtype)
+        ranks[order] = np.arange(len(order), dtype=codes.dtype)
+        codes, uniques = np.where(codes >= 0, ranks[codes], -1), uniques[order]
+    except TypeError:
+        # Значения разных типов не сравниваются - остается порядок появления
+        pass
+    return pd.Series(pd.Categorical.from_codes(codes, categories=uniques), index=series.index, name=series.name)
+
+
+def encode_categories(df, max_unique=CATEGORY_MAX_UNIQUE):
+    """Переводит строковые колонки с малым и средним числом уникальных значений в category
+    
+    Возвращает новый DataFrame (остальные колонки не копируются); в attrs['category_encoding'] -
+    {колонка: (байт до, байт после)}.
+    """
+    encoding = {}
+    encoded = {}
+    if max_unique > 0:
+        for col in df.columns:
+            series = df[col]
+            if not is_text_dtype(series.dtype):
+                continue
+            categorical = _dictionary_encode(series, max_unique)
+            if categorical is not None:
+                encoded[col] = categorical
+                encoding[col] = (int(series.memory_usage(deep=True, index=False)),
+                                 int(categorical.memory_usage(deep=True, index=False)))
+    if encoded:
+        df = df.copy(deep=False)
+        for col, categorical in encoded.items():
+            df[col] = categorical
+    df.attrs['category_encoding'] = encoding
+    return df
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def prepare_frame(_df, fingerprint, category_max_unique=CATEGORY_MAX_UNIQUE, storage='numpy'):
+    """Готовый к анализу DataFrame в памяти (пример, скачанный датасет): типы хранения и категории как при загрузке файла"""
+    return encode_categories(convert_storage(_df, storage), category_max_unique)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def load_data(_uploaded_file, delimiter=None, fingerprint=None, category_max_unique=CATEGORY_MAX_UNIQUE, storage='numpy'):
+    """Загружает данные из файла с обработкой сдвигов и словарным кодированием категорий (кэш по отпечатку файла)
+    
+    storage='pyarrow' - колонки сразу читаются в типах Arrow (см. STORAGE_BACKENDS).
+    """
+    uploaded_file = _uploaded_file
+    dtype_backend = 'pyarrow' if storage == 'pyarrow' else None
+    if uploaded_file is not None:
+        # Повторная загрузка известного файла читается из дискового кэша
+        df = load_cached_dataset(fingerprint, delimiter, dtype_backend)
+        if df is not None:
+            df, was_fixed, shift_error = fix_data_shift(df)
+            return encode_categories(df, category_max_unique), shift_error, was_fixed
+        
+        try:
+            # Для определения разделителя и кодировки достаточно первых килобайт
+            uploaded_file.seek(0)
+            sample = uploaded_file.read(SNIFF_BYTES)
+            uploaded_file.seek(0)
+            encoding = _sniff_encoding(sample)
+            
+            # Если разделитель не указан, определяем автоматически
+            sep = delimiter
+            if sep is None:
+                sep = _sniff_delimiter(sample.decode(encoding, errors='ignore'))
+            
+            try:
+                df, bad_lines = _read_csv_counting_bad_lines(uploaded_file, sep, encoding, dtype_backend=dtype_backend)
+            except UnicodeDecodeError:
+                # Некорректный байт встретился дальше выборки - перечитываем в latin-1
+                uploaded_file.seek(0)
+                df, bad_lines = _read_csv_counting_bad_lines(uploaded_file, sep, 'latin-1', dtype_backend=dtype_backend)
+            
+            uploaded_file.seek(0)
+            df.attrs['bad_lines_skipped'] = bad_lines
+            save_cached_dataset(fingerprint, delimiter, df, dtype_backend)
+            
+            # Применяем проверку сдвигов
+            df, was_fixed, shift_error = fix_data_shift(df)
+            
+            return encode_categories(df, category_max_unique), shift_error, was_fixed
+        except Exception as e:
+            return None, str(e), False
+    return None, None, False
+
+
+def find_target_column(df, numeric_cols, categorical_cols):
+    """Находит целевую переменную в датасете"""
+    target_col = None
+    for col in df.columns:
+        if col.lower() in ['survived', 'target', 'label', 'y', 'class']:
+            target_col = col
+            break
+    
+    # Если нет явной целевой переменной, используем первый категориальный или числовой
+    if target_col is None:
+        if categorical_cols:
+            target_col = categorical_cols[0]
+        elif numeric_cols:
+            target_col = numeric_cols[0]
+    
+    return target_col
+
+
+# ========== РЕЕСТР ДАТАСЕТОВ ==========
+
+# Сколько датасетов одновременно держит реестр (давно не использованные вытесняются)
+DATASET_REGISTRY_MAX_ENTRIES = 8
+
+
+class DatasetRegistry:
+    """Реестр загруженных датасетов: легкий идентификатор -> неизменяемый DataFrame или ChunkedProfile
+    
+    Последние max_entries датасетов хранятся сильными ссылками, остальные - слабыми: вытесненный датасет
+    доступен, пока на него ссылается сессия (см. pin_session_datasets) или фоновая задача.
+    """
+    
+    def __init__(self, max_entries=DATASET_REGISTRY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._datasets = OrderedDict()
+        self._alive = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+    
+    def _touch(self, dataset_id, data):
+        self._datasets[dataset_id] = data
+        self._datasets.move_to_end(dataset_id)
+        while len(self._datasets) > self.max_entries:
+            self._datasets.popitem(last=False)
+    
+    def register(self, dataset_id, data):
+        """Сохраняет датасет под идентификатором; уже зарегистрированный идентификатор не перезаписывается"""
+        with self._lock:
+            data = self._alive.setdefault(dataset_id, data)
+            self._touch(dataset_id, data)
+        return dataset_id
+    
+    def get(self, dataset_id):
+        """Возвращает датасет по идентификатору"""
+        with self._lock:
+            data = self._alive.get(dataset_id)
+            if data is None:
+                raise KeyError(f"Датасет {dataset_id} не найден в реестре")
+            self._touch(dataset_id, data)
+            return data
+
+
+@st.cache_resource(show_spinner=False)
+def get_dataset_registry():
+    """Общий для всех сессий реестр датасетов"""
+    return DatasetRegistry()
+
+
+def register_dataset(data, fingerprint, *options):
+    """Регистрирует датасет и возвращает его идентификатор (отпечаток и параметры загрузки)"""
+    dataset_id = ':'.join(str(part) for part in (fingerprint, *options))
+    return get_dataset_registry().register(dataset_id, data)
+
+
+def get_dataset(dataset_id):
+    """Датасет по идентификатору из реестра (не изменять - объект общий для всех вычислений)"""
+    return get_dataset_registry().get(dataset_id)
+
+
+def pin_session_datasets(*dataset_ids):
+    """Закрепляет датасеты текущей сессии: пока они в session_state, другие сессии не вытеснят их из реестра"""
+    st.session_state.pinned_datasets = {dataset_id: get_dataset(dataset_id) for dataset_id in dataset_ids
+                                        if dataset_id is not None}
+
+
+# ========== ПОТОКОВЫЕ СКЕТЧИ ==========
+
+# Емкость одного уровня скетча квантилей (ошибка ранга порядка 1/k)
+QUANTILE_SKETCH_K = 1024
+
+# Точность HyperLogLog: 2^p регистров, относительная ошибка ~1.04 / sqrt(2^p)
+HLL_PRECISION = 14
+
+# Начиная с этого размера датасета вкладки берут статистику из скетчей, а не точным расчетом
+SKETCH_MIN_ROWS = 1_000_000
+
+
+class MomentSketch:
+    """Моменты до 4-го порядка по Уэлфорду/Пебаю с возможностью объединения"""
+    
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+    
+    def update(self, values):
+        """Добавляет массив значений (пропуски игнорируются)"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        batch = MomentSketch()
+        batch.count = len(values)
+        batch.mean = values.mean()
+        deviations = values - batch.mean
+        batch.m2 = np.sum(deviations ** 2)
+        batch.m3 = np.sum(deviations ** 3)
+        batch.m4 = np.sum(deviations ** 4)
+        batch.min = values.min()
+        batch.max = values.max()
+        return self.merge(batch)
+    
+    def merge(self, other):
+        """Объединяет моменты двух частей данных (формулы Пебая)"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+        n_a, n_b = self.count, other.count
+        n = n_a + n_b
+        delta = other.mean - self.mean
+        delta_n = delta / n
+        m2 = self.m2 + other.m2 + delta * delta_n * n_a * n_b
+        m3 = (self.m3 + other.m3 + delta * delta_n ** 2 * n_a * n_b * (n_a - n_b)
+              + 3 * delta_n * (n_a * other.m2 - n_b * self.m2))
+        m4 = (self.m4 + other.m4 + delta * delta_n ** 3 * n_a * n_b * (n_a ** 2 - n_a * n_b + n_b ** 2)
+              + 6 * delta_n ** 2 * (n_a ** 2 * other.m2 + n_b ** 2 * self.m2)
+              + 4 * delta_n * (n_a * other.m3 - n_b * self.m3))
+        self.count = n
+        self.mean = self.mean + n_b * delta_n
+        self.m2, self.m3, self.m4 = m2, m3, m4
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+    
+    @property
+    def std(self):
+        """Несмещенное стандартное отклонение (как Series.std())"""
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+    
+    @property
+    def skew(self):
+        """Несмещенный коэффициент асимметрии (как Series.skew())"""
+        n = self.count
+        if n < 3 or self.m2 == 0:
+            return np.nan
+        g1 = np.sqrt(n) * self.m3 / self.m2 ** 1.5
+        return np.sqrt(n * (n - 1)) / (n - 2) * g1
+    
+    @property
+    def kurtosis(self):
+        """Несмещенный эксцесс (как Series.kurtosis())"""
+        n = self.count
+        if n < 4 or self.m2 == 0:
+            return np.nan
+        g2 = n * self.m4 / self.m2 ** 2 - 3
+        return ((n + 1) * g2 + 6) * (n - 1) / ((n - 2) * (n - 3))
+    
+    def to_dict(self):
+        return {key: float(value) for key, value in self.__dict__.items()}
+    
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        sketch.__dict__.update(data)
+        sketch.count = int(sketch.count)
+        return sketch
+
+
+class QuantileSketch:
+    """KLL-подобный скетч квантилей: иерархия компакторов, вес элемента уровня h равен 2^h"""
+    
+    def __init__(self, k=QUANTILE_SKETCH_K, seed=42):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+    
+    def update(self, values):
+        """Добавляет массив значений (пропуски игнорируются)"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+    
+    def merge(self, other):
+        """Объединяет скетч с другим скетчем (уровни складываются поэлементно)"""
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+    
+    def _compress(self):
+        """Переполненный уровень сортируется, и каждый второй элемент переходит на уровень выше"""
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # При нечетном размере один элемент остается на текущем уровне
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                items = items[:len(items) - len(keep)]
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+    
+    def quantile(self, q):
+        """Приближенный квантиль (точный, пока в скетч не было сжатий)"""
+        if self.count == 0:
+            return np.nan
+        if len(self.levels) == 1:
+            return float(np.quantile(self.levels[0], q))
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(lvl), 2.0 ** h) for h, lvl in enumerate(self.levels)])
+        order = np.argsort(items)
+        items = items[order]
+        cumulative = np.cumsum(weights[order]) - weights[order] / 2
+        return float(np.interp(q * weights.sum(), cumulative, items))
+    
+    def to_dict(self):
+        return {'k': self.k, 'count': self.count, 'levels': [lvl.tolist() for lvl in self.levels]}
+    
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(k=data['k'])
+        sketch.count = data['count']
+        sketch.levels = [np.asarray(lvl, dtype=float) for lvl in data['levels']]
+        return sketch
+
+
+class HyperLogLog:
+    """Оценка числа уникальных значений по алгоритму HyperLogLog"""
+    
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+    
+    def update(self, values):
+        """Добавляет значения Series/массива (пропуски игнорируются)"""
+        values = pd.Series(values).dropna()
+        if len(values) == 0:
+            return self
+        if pd.api.types.is_numeric_dtype(values):
+            # Приводим к float, чтобы 1 и 1.0 из разных чанков хэшировались одинаково
+            array = values.to_numpy(dtype=float)
+        else:
+            array = values.astype(str).to_numpy(dtype=object)
+        hashes = pd.util.hash_array(array)
+        low_bits = 64 - self.p
+        index = (hashes >> np.uint64(low_bits)).astype(np.intp)
+        remainder = (hashes & np.uint64((1 << low_bits) - 1)).astype(float)
+        # Ранг - позиция первой единицы в оставшихся битах (frexp дает точную длину числа в битах)
+        rank = (low_bits - np.frexp(remainder)[1] + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+    
+    def merge(self, other):
+        """Объединение двух скетчей - поэлементный максимум регистров"""
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+    
+    def estimate(self):
+        """Оценка числа уникальных значений"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if raw <= 2.5 * m and zeros > 0:
+            # Поправка для малых мощностей (linear counting)
+            raw = m * np.log(m / zeros)
+        return int(round(raw))
+    
+    def to_dict(self):
+        return {'p': self.p, 'registers': base64.b64encode(self.registers.tobytes()).decode('ascii')}
+    
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(p=data['p'])
+        sketch.registers = np.frombuffer(base64.b64decode(data['registers']), dtype=np.uint8).copy()
+        return sketch
+
+
+class ColumnSketch:
+    """Скетчи одной колонки: пропуски, уникальные значения, моменты и квантили"""
+    
+    def __init__(self, numeric):
+        self.numeric = numeric
+        self.null_count = 0
+        self.distinct = HyperLogLog()
+        self.moments = MomentSketch() if numeric else None
+        self.quantiles = QuantileSketch() if numeric else None
+    
+    def update(self, series):
+        """Добавляет очередную часть колонки"""
+        self.null_count += int(series.isnull().sum())
+        self.distinct.update(series)
+        if self.numeric:
+            values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            values = values[~np.isnan(values)]
+            self.moments.update(values)
+            self.quantiles.update(values)
+        return self
+    
+    def merge(self, other):
+        """Объединяет скетчи двух частей одной колонки (чанков или воркеров)"""
+        self.null_count += other.null_count
+        self.distinct.merge(other.distinct)
+        if self.numeric:
+            self.moments.merge(other.moments)
+            self.quantiles.merge(other.quantiles)
+        return self
+    
+    def to_dict(self):
+        data = {'numeric': self.numeric, 'null_count': self.null_count, 'distinct': self.distinct.to_dict()}
+        if self.numeric:
+            data['moments'] = self.moments.to_dict()
+            data['quantiles'] = self.quantiles.to_dict()
+        return data
+    
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['numeric'])
+        sketch.null_count = data['null_count']
+        sketch.distinct = HyperLogLog.from_dict(data['distinct'])
+        if sketch.numeric:
+            sketch.moments = MomentSketch.from_dict(data['moments'])
+            sketch.quantiles = QuantileSketch.from_dict(data['quantiles'])
+        return sketch
+
+
+def build_column_sketches(df, columns=None, chunk_rows=None):
+    """Строит скетчи колонок за один проход: по каждому чанку строк отдельно, затем объединяет"""
+    columns = list(df.columns) if columns is None else columns
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    sketches = {}
+    numeric_cols = [col for col in columns if pd.api.types.is_numeric_dtype(df[col])]
+    if _use_profile_pool(len(df), numeric_cols):
+        sketches = profile_numeric_parallel(df, numeric_cols, chunk_rows=chunk_rows)
+        columns = [col for col in columns if col not in sketches]
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        for col in columns:
+            part = ColumnSketch(pd.api.types.is_numeric_dtype(df[col])).update(chunk[col])
+            if col in sketches:
+                sketches[col].merge(part)
+            else:
+                sketches[col] = part
+    return {col: sketches[col] for col in df.columns if col in sketches}
+
+
+# ========== ПОТОКОВЫЙ РЕЖИМ ДЛЯ БОЛЬШИХ ФАЙЛОВ ==========
+
+# Количество строк в одном чанке при потоковом чтении
+CHUNK_ROWS = 200_000
+
+# Размер случайной выборки строк, которая хранится для графиков и квантилей
+PROFILE_SAMPLE_ROWS = 20_000
+
+# Максимум различных значений, отслеживаемых для одной категориальной колонки
+MAX_TRACKED_VALUES = 50_000
+
+# Максимум строк-выбросов, сохраняемых для отображения в таблице
+MAX_OUTLIER_ROWS = 1000
+
+# Каталог, из которого разрешено читать файлы по пути на сервере (не задан - ввод пути отключен)
+LARGE_FILE_DIR = os.environ.get('EDA_LARGE_FILE_DIR') or None
+
+
+class ChunkedProfile:
+    """Статистики датасета, накопленные по чанкам без загрузки всего файла в память"""
+    
+    def __init__(self, source, delimiter, encoding, fingerprint=None, text_cols=()):
+        self.source = source
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.fingerprint = fingerprint
+        # Колонки, которые читаются как текст: в них после первого чанка встретились нечисловые значения
+        self.text_cols = frozenset(text_cols)
+        self.type_conflicts = set()
+        self.n_rows = 0
+        self.columns = None
+        self.dtypes = None
+        self.numeric_cols = []
+        self.categorical_cols = []
+        self.missing = None
+        self.sketches = {}
+        self.value_counts = {}
+        self.value_counts_exact = {}
+        self.sample = None
+        self._head = None
+        self._tail = None
+        self._rng = np.random.default_rng(42)
+        self._sample_keys = None
+        # Попарные суммы для корреляций Пирсона (со сдвигом для численной устойчивости)
+        self._shift = None
+        self._pair_n = None
+        self._pair_sx = None
+        self._pair_sxx = None
+        self._pair_sxy = None
+    
+    @property
+    def shape(self):
+        return (self.n_rows, len(self.columns))
+    
+    @property
+    def size(self):
+        return self.n_rows * len(self.columns)
+    
+    def __len__(self):
+        return self.n_rows
+    
+    def head(self, n=5):
+        return self._head.head(n)
+    
+    def tail(self, n=5):
+        return self._tail.tail(n)
+    
+    def iter_chunks(self, usecols=None):
+        """Читает источник заново по чанкам"""
+        source = self.source
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        dtype = {col: str for col in self.text_cols if usecols is None or col in usecols}
+        reader = pd.read_csv(source, sep=self.delimiter, quotechar='"', encoding=self.encoding,
+                             encoding_errors='replace', on_bad_lines='skip', engine='c',
+                             chunksize=CHUNK_ROWS, usecols=usecols, dtype=dtype or None)
+        with reader:
+            for chunk in reader:
+                yield self._coerce_numeric(chunk)
+    
+    def _coerce_numeric(self, chunk):
+        """Приводит числовые колонки к числу (типы определяются по первому чанку)
+        
+        Текст, который не разбирается как число, не превращается молча в пропуски: колонка попадает
+        в type_conflicts, и build_chunked_profile перечитывает файл, считая ее текстовой.
+        """
+        for col in self.numeric_cols:
+            if col in chunk.columns and not pd.api.types.is_numeric_dtype(chunk[col]):
+                values = pd.to_numeric(chunk[col], errors='coerce')
+                if (values.isna() & chunk[col].notna()).any():
+                    self.type_conflicts.add(col)
+                chunk[col] = values
+        return chunk
+    
+    def update(self, chunk):
+        """Добавляет очередной чанк к накопленной статистике"""
+        if self.columns is None:
+            self._init_from_chunk(chunk)
+        
+        self.n_rows += len(chunk)
+        self._tail = pd.concat([self._tail, chunk.tail(10)]).tail(10)
+        self._update_sample(chunk)
+        
+        for col, sketch in self.sketches.items():
+            sketch.update(chunk[col])
+        
+        if self.numeric_cols:
+            self._update_pairs(chunk[self.numeric_cols].to_numpy(dtype=float, na_value=np.nan))
+        
+        for col in self.categorical_cols:
+            self._update_value_counts(col, chunk[col].value_counts())
+    
+    def _init_from_chunk(self, chunk):
+        """Определяет структуру данных по первому чанку"""
+        self.columns = chunk.columns
+        self.dtypes = chunk.dtypes
+        self.numeric_cols, self.categorical_cols = column_types(chunk)
+        self.sketches = {col: ColumnSketch(col in self.numeric_cols) for col in chunk.columns}
+        self._head = chunk.head(10)
+        self._tail = chunk.iloc[0:0]
+        
+        p = len(self.numeric_cols)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            self._shift = np.nan_to_num(np.nanmean(
+                chunk[self.numeric_cols].to_numpy(dtype=float, na_value=np.nan), axis=0))
+        self._pair_n = np.zeros((p, p))
+        self._pair_sx = np.zeros((p, p))
+        self._pair_sxx = np.zeros((p, p))
+        self._pair_sxy = np.zeros((p, p))
+    
+    def _update_sample(self, chunk):
+        """Поддерживает равномерную случайную выборку строк (резервуар по случайным ключам)"""
+        keys = self._rng.random(len(chunk))
+        if self.sample is not None:
+            chunk = pd.concat([self.sample, chunk])
+            keys = np.concatenate([self._sample_keys, keys])
+        if len(chunk) > PROFILE_SAMPLE_ROWS:
+            keep = np.argpartition(keys, PROFILE_SAMPLE_ROWS)[:PROFILE_SAMPLE_ROWS]
+            chunk = chunk.iloc[keep]
+            keys = keys[keep]
+        self.sample = chunk
+        self._sample_keys = keys
+    
+    def _update_pairs(self, values):
+        """Накапливает попарные суммы по строкам, где заполнены обе колонки"""
+        present = ~np.isnan(values)
+        mask = present.astype(float)
+        centered = np.where(present, values - self._shift, 0.0)
+        self._pair_n += mask.T @ mask
+        self._pair_sx += centered.T @ mask
+        self._pair_sxx += (centered ** 2).T @ mask
+        self._pair_sxy += centered.T @ centered
+    
+    def _update_value_counts(self, col, counts):
+        """Объединяет частоты значений, ограничивая число отслеживаемых значений"""
+        if col in self.value_counts:
+            counts = self.value_counts[col].add(counts, fill_value=0)
+        exact = self.value_counts_exact.get(col, True)
+        if len(counts) > MAX_TRACKED_VALUES:
+            # Редкие значения отбрасываем - частоты популярных остаются точными снизу
+            counts = counts.nlargest(MAX_TRACKED_VALUES // 2)
+            exact = False
+        self.value_counts[col] = counts
+        self.value_counts_exact[col] = exact
+    
+    def finalize(self):
+        """Завершает накопление статистики"""
+        self.missing = pd.Series({col: sketch.null_count for col, sketch in self.sketches.items()},
+                                 index=self.columns, dtype='int64')
+        if self.sample is not None:
+            self.sample = self.sample.sort_index()
+        self._sample_keys = None
+        for col, counts in self.value_counts.items():
+            self.value_counts[col] = counts.astype('int64').sort_values(ascending=False)
+        return self
+    
+    def correlation(self, numeric_cols):
+        """Попарная корреляция Пирсона (как DataFrame.corr()) по накопленным суммам"""
+        idx = [self.numeric_cols.index(col) for col in numeric_cols]
+        grid = np.ix_(idx, idx)
+        n = self._pair_n[grid]
+        sx = self._pair_sx[grid]
+        sxx = self._pair_sxx[grid]
+        sxy = self._pair_sxy[grid]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = sxy - sx * sx.T / n
+            var_x = sxx - sx ** 2 / n
+            var_y = sxx.T - sx.T ** 2 / n
+            corr = cov / np.sqrt(var_x * var_y)
+        corr = np.where(n > 1, np.clip(corr, -1, 1), np.nan)
+        np.fill_diagonal(corr, np.where(np.diag(n) > 1, 1.0, np.nan))
+        return pd.DataFrame(corr, index=numeric_cols, columns=numeric_cols)
+    
+    def find_outliers(self, col, lower_bound, upper_bound, max_rows=MAX_OUTLIER_ROWS):
+        """Второй проход по файлу: считает выбросы и сохраняет первые max_rows из них"""
+        outliers_count = 0
+        parts = []
+        kept = 0
+        for chunk in self.iter_chunks():
+            is_outlier = (chunk[col] < lower_bound) | (chunk[col] > upper_bound)
+            outliers_count += int(is_outlier.sum())
+            if kept < max_rows:
+                part = chunk[is_outlier].head(max_rows - kept)
+                parts.append(part)
+                kept += len(part)
+        outliers = pd.concat(parts) if parts else self._head.iloc[0:0]
+        outliers.attrs['total_count'] = outliers_count
+        return outliers
+    
+    def take_rows(self, positions):
+        """Проход по файлу: достает строки по их номерам (в порядке следования в файле)"""
+        positions = np.sort(np.asarray(positions, dtype=np.int64))
+        parts = []
+        offset = 0
+        if len(positions):
+            for chunk in self.iter_chunks():
+                local = positions[(positions >= offset) & (positions < offset + len(chunk))] - offset
+                if len(local):
+                    parts.append(chunk.iloc[local])
+                offset += len(chunk)
+                if offset > positions[-1]:
+                    break
+        return pd.concat(parts) if parts else self._head.iloc[0:0]
+
+
+
+def build_chunked_profile(source, delimiter=None, fingerprint=None, progress_callback=None):
+    """Строит ChunkedProfile за один проход по файлу (путь или файловый объект)"""
+    if hasattr(source, 'read'):
+        source.seek(0)
+        sample = source.read(SNIFF_BYTES)
+        source.seek(0)
+    else:
+        with open(source, 'rb') as f:
+            sample = f.read(SNIFF_BYTES)
+    encoding = _sniff_encoding(sample)
+    if delimiter is None:
+        delimiter = _sniff_delimiter(sample.decode(encoding, errors='ignore'))
+    
+    text_cols = set()
+    while True:
+        profile = ChunkedProfile(source, delimiter, encoding, f"{fingerprint}:{ord(delimiter):02x}", text_cols)
+        for i, chunk in enumerate(profile.iter_chunks(), 1):
+            if profile.type_conflicts:
+                break
+            profile.update(chunk)
+            if progress_callback:
+                progress_callback(i, profile.n_rows)
+        if not profile.type_conflicts:
+            return profile.finalize()
+        # Тип колонки по первому чанку оказался неверным (например, он был пуст) - проход заново
+        text_cols |= profile.type_conflicts
+
+
+def resolve_large_file_path(path):
+    """Реальный путь к файлу внутри LARGE_FILE_DIR или None, если путь указывает за пределы каталога"""
+    if LARGE_FILE_DIR is None:
+        return None
+    root = os.path.realpath(LARGE_FILE_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        return None
+    return resolved
+
+
+def _spill_upload(uploaded_file):
+    """Копирует загруженный файл во временный файл на диске и возвращает путь к нему"""
+    uploaded_file.seek(0)
+    with tempfile.NamedTemporaryFile(prefix='eda_upload_', suffix='.csv', delete=False) as f:
+        shutil.copyfileobj(uploaded_file, f, FINGERPRINT_CHUNK_BYTES)
+    uploaded_file.seek(0)
+    return f.name
+
+
+def _unlink_quietly(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_chunked_profile(_source, delimiter, fingerprint):
+    """Кэшированное построение потокового профиля (один экземпляр на файл)"""
+    if hasattr(_source, 'read'):
+        # Профиль общий для всех сессий и перечитывает файл при каждом запросе строк, поэтому
+        # читает собственную копию на диске, а не буфер загрузки первой сессии
+        path = _spill_upload(_source)
+        try:
+            profile = build_chunked_profile(path, delimiter, fingerprint)
+        except Exception:
+            _unlink_quietly(path)
+            raise
+        weakref.finalize(profile, _unlink_quietly, path)
+        return profile
+    return build_chunked_profile(_source, delimiter, fingerprint)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def compute_column_sketches(dataset_id):
+    """Кэшированные скетчи всех колонок (объекты не меняются после построения и не копируются)"""
+    df = get_dataset(dataset_id)
+    if isinstance(df, ChunkedProfile):
+        return df.sketches
+    return build_column_sketches(df)
+
+
+def _use_sketches(df):
+    """Для потокового режима и очень больших датасетов статистика берется из скетчей"""
+    return isinstance(df, ChunkedProfile) or len(df) >= SKETCH_MIN_ROWS
+
+
+# ========== ПРОФИЛЬ КОЛОНОК ==========
+
+# Сколько самых частых значений сохраняется в профиле колонки
+TOP_VALUES_N = 20
+
+
+@dataclass(frozen=True)
+class ColumnProfile:
+    """Неизменяемые сводные характеристики одной колонки датасета"""
+    name: object
+    dtype: str
+    is_numeric: bool
+    count: int
+    null_count: int
+    null_pct: float
+    nunique: int
+    mean: float = np.nan
+    std: float = np.nan
+    min: float = np.nan
+    q25: float = np.nan
+    median: float = np.nan
+    q75: float = np.nan
+    max: float = np.nan
+    skew: float = np.nan
+    kurtosis: float = np.nan
+    top_values: tuple = ()
+    
+    def value_counts(self, top_n=10):
+        """Самые частые значения в формате value_counts().head(top_n)"""
+        top = self.top_values[:top_n]
+        return pd.Series([count for _, count in top], index=pd.Index([value for value, _ in top], name=self.name),
+                         name='count', dtype='int64')
+    
+    def describe(self):
+        """Статистика колонки в формате DataFrame.describe()"""
+        return pd.Series({
+            'count': float(self.count), 'mean': self.mean, 'std': self.std, 'min': self.min,
+            '25%': self.q25, '50%': self.median, '75%': self.q75, 'max': self.max,
+        })
+
+
+def _top_values(counts, top_n):
+    """Первые top_n частот в виде кортежа пар (значение, количество)"""
+    return tuple((value, int(count)) for value, count in counts.head(top_n).items())
+
+
+def build_column_profiles(df, top_n=TOP_VALUES_N, sketches=None):
+    """Профилирует все колонки за один проход (векторно или по скетчам для больших данных)"""
+    n_rows = len(df)
+    if isinstance(df, ChunkedProfile):
+        numeric_cols = set(df.numeric_cols)
+    else:
+        numeric_cols = set(df.select_dtypes(include=[np.number]).columns)
+    profiles = {}
+    
+    if _use_sketches(df):
+        if sketches is None:
+            sketches = df.sketches if isinstance(df, ChunkedProfile) else build_column_sketches(df)
+        for col in df.columns:
+            sketch = sketches[col]
+            is_numeric = col in numeric_cols
+            if isinstance(df, ChunkedProfile):
+                counts = df.value_counts.get(col)
+                exact = df.value_counts_exact.get(col, False)
+            else:
+                # Частоты считаем только для нечисловых колонок - для чисел они не нужны
+                counts = None if is_numeric else df[col].value_counts()
+                exact = counts is not None
+            stats = {}
+            if is_numeric and sketch.moments.count > 0:
+                moments, quantiles = sketch.moments, sketch.quantiles
+                stats = {
+                    'mean': moments.mean, 'std': moments.std, 'min': moments.min, 'max': moments.max,
+                    'q25': quantiles.quantile(0.25), 'median': quantiles.quantile(0.5),
+                    'q75': quantiles.quantile(0.75), 'skew': moments.skew, 'kurtosis': moments.kurtosis,
+                }
+            profiles[col] = ColumnProfile(
+                name=col,
+                dtype=str(df.dtypes[col]),
+                is_numeric=is_numeric,
+                count=n_rows - sketch.null_count,
+                null_count=sketch.null_count,
+                null_pct=sketch.null_count / n_rows * 100 if n_rows else 0.0,
+                nunique=len(counts) if exact else sketch.distinct.estimate(),
+                top_values=_top_values(counts, top_n) if counts is not None else (),
+                **stats
+            )
+        return MappingProxyType(profiles)
+    
+    numeric_list = [col for col in df.columns if col in numeric_cols]
+    if _use_profile_pool(n_rows, numeric_list):
+        # Широкие таблицы: числовые колонки профилируются параллельно в процессах
+        for col, stats in profile_numeric_parallel(df, numeric_list, top_n).items():
+            values, counts = stats.pop('top_values')
+            values = pd.Index(values).astype(df.dtypes[col])
+            null_count = stats.pop('null_count')
+            profiles[col] = ColumnProfile(
+                name=col,
+                dtype=str(df.dtypes[col]),
+                is_numeric=True,
+                count=n_rows - null_count,
+                null_count=null_count,
+                null_pct=null_count / n_rows * 100 if n_rows else 0.0,
+                top_values=tuple((value, int(count)) for value, count in zip(values, counts)),
+                **stats
+            )
+        numeric_list = []
+    
+    # Пропуски и моменты считаются сразу по всем колонкам одним векторным вызовом
+    null_counts = df.isnull().sum()
+    if numeric_list:
+        numeric_df = numpy_numeric_frame(df[numeric_list])
+        moments = numeric_df.agg(['mean', 'std', 'min', 'max', 'skew', 'kurt'])
+        quantiles = numeric_df.quantile([0.25, 0.5, 0.75])
+    for col in df.columns:
+        if col in profiles:
+            continue
+        # Одна хэш-таблица дает и число уникальных значений, и самые частые значения
+        counts = df[col].value_counts()
+        stats = {}
+        if col in numeric_cols:
+            stats = {
+                'mean': moments.at['mean', col], 'std': moments.at['std', col],
+                'min': moments.at['min', col], 'max': moments.at['max', col],
+                'q25': quantiles.at[0.25, col], 'median': quantiles.at[0.5, col],
+                'q75': quantiles.at[0.75, col], 'skew': moments.at['skew', col],
+                'kurtosis': moments.at['kurt', col],
+            }
+        null_count = int(null_counts[col])
+        profiles[col] = ColumnProfile(
+            name=col,
+            dtype=str(df.dtypes[col]),
+            is_numeric=col in numeric_cols,
+            count=n_rows - null_count,
+            null_count=null_count,
+            null_pct=null_count / n_rows * 100 if n_rows else 0.0,
+            nunique=len(counts),
+            top_values=_top_values(counts, top_n),
+            **stats
+        )
+    return MappingProxyType({col: profiles[col] for col in df.columns})
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def compute_column_profiles(dataset_id):
+    """Кэшированный профиль колонок - единый источник статистики для всех вкладок и отчетов"""
+    df = get_dataset(dataset_id)
+    return build_column_profiles(df, sketches=compute_column_sketches(dataset_id) if _use_sketches(df) else None)
+
+
+def profile_series(profiles, field):
+    """Одно поле профиля по всем колонкам в виде Series"""
+    return pd.Series({col: getattr(profile, field) for col, profile in profiles.items()},
+                     index=list(profiles.keys()))
+
+
+# ========== ПАРАЛЛЕЛЬНОЕ ПРОФИЛИРОВАНИЕ ==========
+
+# Число процессов для профилирования колонок (1 - без пула процессов)
+PROFILE_WORKERS = int(os.environ.get('EDA_PROFILE_WORKERS', os.cpu_count() or 1))
+
+# Пул включается только для широких таблиц, где выигрыш перекрывает запуск процессов
+PARALLEL_MIN_COLUMNS = 32
+PARALLEL_MIN_CELLS = 2_000_000
+
+
+@st.cache_resource(show_spinner=False)
+def get_profile_pool():
+    """Общий пул процессов для профилирования колонок"""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    # spawn: форк многопоточного сервера Streamlit небезопасен
+    return ProcessPoolExecutor(max_workers=PROFILE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+
+def _use_profile_pool(n_rows, numeric_cols):
+    """Стоит ли раздавать числовые колонки по процессам"""
+    return (PROFILE_WORKERS > 1 and len(numeric_cols) >= PARALLEL_MIN_COLUMNS
+            and n_rows * len(numeric_cols) >= PARALLEL_MIN_CELLS)
+
+
+def _exact_numeric_stats(values, top_n):
+    """Точная статистика числовой колонки по одной сортировке (совпадает с формулами pandas)"""
+    valid = np.sort(values[~np.isnan(values)])
+    n = len(valid)
+    stats = {'null_count': len(values) - n, 'nunique': 0, 'top_values': ((), ())}
+    if n == 0:
+        return stats
+    # Уникальные значения и их частоты по отсортированному массиву
+    starts = np.flatnonzero(np.concatenate(([True], valid[1:] != valid[:-1])))
+    counts = np.diff(np.append(starts, n))
+    top = np.argsort(-counts, kind='stable')[:top_n]
+    stats['nunique'] = len(starts)
+    stats['top_values'] = (valid[starts][top], counts[top])
+    
+    def quantile(q):
+        pos = q * (n - 1)
+        lo = int(np.floor(pos))
+        hi = min(lo + 1, n - 1)
+        return valid[lo] + (valid[hi] - valid[lo]) * (pos - lo)
+    
+    mean = valid.mean()
+    dev = valid - mean
+    m2 = float(np.dot(dev, dev))
+    m3 = float(np.dot(dev * dev, dev))
+    m4 = float(np.dot(dev * dev, dev * dev))
+    skew = kurtosis = np.nan
+    if n >= 3:
+        skew = 0.0 if m2 == 0 else (n * (n - 1)) ** 0.5 / (n - 2) * (m3 / n) / (m2 / n) ** 1.5
+    if n >= 4:
+        kurtosis = 0.0 if m2 == 0 else (n * (n + 1) * (n - 1) * m4 / ((n - 2) * (n - 3) * m2 ** 2)
+                                        - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3)))
+    stats.update({
+        'mean': mean, 'std': np.sqrt(m2 / (n - 1)) if n > 1 else np.nan,
+        'min': valid[0], 'max': valid[-1],
+        'q25': quantile(0.25), 'median': quantile(0.5), 'q75': quantile(0.75),
+        'skew': skew, 'kurtosis': kurtosis,
+    })
+    return stats
+
+
+def _profile_shared_block(shm_name, shape, column_ids, top_n, chunk_rows):
+    """Воркер: профилирует свои колонки блока из разделяемой памяти (скетчами, если задан chunk_rows)"""
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order='F')
+        results = {}
+        for j in column_ids:
+            if chunk_rows:
+                sketch = ColumnSketch(numeric=True)
+                for start in range(0, max(shape[0], 1), chunk_rows):
+                    sketch.merge(ColumnSketch(numeric=True).update(pd.Series(block[start:start + chunk_rows, j].copy())))
+                results[j] = sketch
+            else:
+                results[j] = _exact_numeric_stats(block[:, j], top_n)
+        del block
+        return results
+    finally:
+        shm.close()
+
+
+def profile_numeric_parallel(df, numeric_cols, top_n=TOP_VALUES_N, chunk_rows=None):
+    """Раздает числовые колонки пулу процессов через shared_memory вместо копий в pickle"""
+    from multiprocessing import shared_memory
+    shape = (len(df), len(numeric_cols))
+    shm = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1] * 8, 1))
+    try:
+        # Колоночный порядок: каждая колонка лежит в памяти непрерывно
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order='F')
+        for j, col in enumerate(numeric_cols):
+            block[:, j] = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        del block
+        pool = get_profile_pool()
+        batches = np.array_split(np.arange(shape[1]), min(shape[1], PROFILE_WORKERS * 4))
+        futures = [pool.submit(_profile_shared_block, shm.name, shape, batch.tolist(), top_n, chunk_rows)
+                   for batch in batches if len(batch)]
+        results = {}
+        for future in futures:
+            results.update(future.result())
+        return {numeric_cols[j]: result for j, result in results.items()}
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+# ========== КОРРЕЛЯЦИИ ==========
+
+CORRELATION_METHODS = {'pearson': 'Пирсон', 'spearman': 'Спирмен', 'kendall': 'Кендалл'}
+
+# Ширина блока колонок: промежуточные матрицы не больше CORR_BLOCK_COLS x CORR_BLOCK_COLS
+CORR_BLOCK_COLS = 512
+
+# Кендалл считается попарно за O(n log n), поэтому строки для него ограничиваются выборкой
+KENDALL_MAX_ROWS = 5000
+
+
+def _centered_float32(df, columns, rank=False):
+    """Колонки в float32 (ранги для Спирмена), центрированные по непропущенным значениям"""
+    X = np.empty((len(df), len(columns)), dtype=np.float32, order='F')
+    for j, col in enumerate(columns):
+        values = df[col].rank() if rank else df[col]
+        X[:, j] = values.to_numpy(dtype=np.float32, na_value=np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        X -= np.nanmean(X, axis=0)
+    return X
+
+
+def correlation_matrix(df, columns, method='pearson', block_cols=CORR_BLOCK_COLS):
+    """Матрица корреляций с попарным учетом пропусков, блоками по колонкам в float32 (ранги Спирмена - по колонке целиком)"""
+    columns = list(columns)
+    if method == 'kendall':
+        data = df[columns]
+        if len(data) > KENDALL_MAX_ROWS:
+            data = data.sample(KENDALL_MAX_ROWS, random_state=42)
+        return data.corr(method='kendall').astype(np.float32)
+    
+    X = _centered_float32(df, columns, rank=method == 'spearman')
+    valid = ~np.isnan(X)
+    complete = bool(valid.all())
+    if not complete:
+        X[~valid] = 0
+        M = valid.astype(np.float32)
+    del valid
+    
+    p = len(columns)
+    corr = np.empty((p, p), dtype=np.float32)
+    norms = np.sqrt(np.einsum('ij,ij->j', X, X)) if complete else None
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i0 in range(0, p, block_cols):
+            Xi = X[:, i0:i0 + block_cols]
+            if not complete:
+                Mi = M[:, i0:i0 + block_cols]
+                Xi2 = Xi * Xi
+            for j0 in range(i0, p, block_cols):
+                Xj = X[:, j0:j0 + block_cols]
+                if complete:
+                    block = (Xi.T @ Xj) / np.outer(norms[i0:i0 + block_cols], norms[j0:j0 + block_cols])
+                else:
+                    # Суммы только по строкам, где заполнены обе колонки пары
+                    Mj = M[:, j0:j0 + block_cols]
+                    n = Mi.T @ Mj
+                    sx = Xi.T @ Mj
+                    sy = Mi.T @ Xj
+                    cov = Xi.T @ Xj - sx * sy / n
+                    var_x = Xi2.T @ Mj - sx * sx / n
+                    var_y = Mi.T @ (Xj * Xj) - sy * sy / n
+                    block = np.where(n > 1, cov / np.sqrt(var_x * var_y), np.nan)
+                block = np.clip(block, -1, 1)
+                corr[i0:i0 + block_cols, j0:j0 + block_cols] = block
+                corr[j0:j0 + block_cols, i0:i0 + block_cols] = block.T
+    diagonal = np.diagonal(corr)
+    np.fill_diagonal(corr, np.where(np.isnan(diagonal), np.nan, 1.0))
+    return pd.DataFrame(corr, index=columns, columns=columns)
+
+
+def correlation_pairs(corr, threshold=None, top_k=None):
+    """Пары признаков из верхнего треугольника: |r| > threshold и/или top_k сильнейших"""
+    values = corr.to_numpy()
+    rows, cols = np.triu_indices(len(values), k=1)
+    pair_values = values[rows, cols]
+    strength = np.nan_to_num(np.abs(pair_values), nan=-1.0)
+    selected = np.flatnonzero(strength > threshold) if threshold is not None else np.arange(len(strength))
+    if top_k is not None and len(selected) > top_k:
+        selected = selected[np.argpartition(-strength[selected], top_k - 1)[:top_k]]
+    selected = selected[np.argsort(-strength[selected], kind='stable')]
+    return pd.DataFrame({
+        'Признак 1': corr.index[rows[selected]],
+        'Признак 2': corr.columns[cols[selected]],
+        'Корреляция': pair_values[selected].astype(float),
+    })
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def compute_correlation_matrix(dataset_id, numeric_cols, method='pearson'):
+    """Кэшированное вычисление корреляционной матрицы"""
+    if len(numeric_cols) < 2:
+        return None
+    df = get_dataset(dataset_id)
+    if isinstance(df, ChunkedProfile):
+        # Пирсон считается по всему файлу, ранговые методы - по выборке строк
+        if method == 'pearson':
+            return df.correlation(numeric_cols)
+        df = df.sample
+    return correlation_matrix(df, numeric_cols, method)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def compute_correlation_pairs(dataset_id, numeric_cols, method='pearson', threshold=0.5, top_k=None):
+    """Кэшированный список сильных пар признаков по корреляционной матрице"""
+    correlation = compute_correlation_matrix(dataset_id, numeric_cols, method)
+    if correlation is None:
+        return None
+    return correlation_pairs(correlation, threshold, top_k)
+
+
+def vif_from_correlation(corr):
+    """VIF всех признаков сразу: диагональ обратной корреляционной матрицы (через собственные числа)"""
+    R = np.asarray(corr, dtype=np.float64)
+    vif = np.full(len(R), np.nan)
+    # Константные признаки (NaN в корреляциях) исключаются
+    usable = ~np.isnan(np.diagonal(R))
+    if usable.sum() < 2:
+        return vif
+    eigvals, eigvecs = np.linalg.eigh(R[np.ix_(usable, usable)])
+    weights = eigvecs ** 2
+    tolerance = len(eigvals) * np.finfo(np.float64).eps * max(np.abs(eigvals).max(), 1.0)
+    # Почти нулевые собственные числа - точная мультиколлинеарность: VIF бесконечен
+    singular = np.abs(eigvals) <= tolerance
+    # Отрицательные - матрица попарных корреляций (потоковый режим, пропуски) несогласована: VIF не определен
+    negative = eigvals < -tolerance
+    positive = ~singular & ~negative
+    usable_vif = weights[:, positive] @ (1.0 / eigvals[positive])
+    usable_vif[(weights[:, singular] > 1e-10).any(axis=1)] = np.inf
+    usable_vif[(weights[:, negative] > 1e-10).any(axis=1)] = np.nan
+    vif[usable] = usable_vif
+    return vif
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def compute_vif(dataset_id, numeric_cols):
+    """Кэшированные VIF (Series по признакам) или None, если данных недостаточно"""
+    if len(numeric_cols) < 2:
+        return None
+    df = get_dataset(dataset_id)
+    if isinstance(df, ChunkedProfile):
+        # Потоковый режим: корреляции по всему файлу
+        corr = df.correlation(numeric_cols)
+    else:
+        # Как и при VIF через регрессии - только по строкам без пропусков
+        X = df[numeric_cols].dropna().to_numpy(dtype=np.float64)
+        if len(X) <= len(numeric_cols):
+            return None
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.corrcoef(X, rowvar=False)
+    return pd.Series(vif_from_correlation(corr), index=numeric_cols)
+
+
+def compute_vif_data(dataset_id, numeric_cols):
+    """Таблица VIF для вкладки и отчетов (None, если данных недостаточно)"""
+    vif = compute_vif(dataset_id, numeric_cols)
+    if vif is None:
+        return None
+    profiles = compute_column_profiles(dataset_id)
+    vif_data = []
+    for col, value in vif.items():
+        if np.isnan(value):
+            # VIF не определен для константного признака и для несогласованной матрицы попарных корреляций
+            reason = 'Константный признак' if not profiles[col].std > 0 else 'Не определен (несогласованные попарные корреляции)'
+            vif_data.append({'Признак': col, 'VIF': 'N/A', 'Оценка': reason})
+        else:
+            vif_data.append({
+                'Признак': col,
+                'VIF': f"{value:.2f}",
+                'Оценка': 'Сильная' if value >= 10 else ('Умеренная' if value >= 5 else 'Слабая')
+            })
+    return vif_data
+
+
+def compute_basic_stats(dataset_id, numeric_cols):
+    """Базовая статистика (describe) по профилю колонок"""
+    if not numeric_cols:
+        return None
+    profiles = compute_column_profiles(dataset_id)
+    return pd.DataFrame({col: profiles[col].describe() for col in numeric_cols})
+
+
+def compute_value_counts(dataset_id, col, top_n=10):
+    """Частоты значений по профилю колонок"""
+    profile = compute_column_profiles(dataset_id)[col]
+    if profile.top_values and top_n <= TOP_VALUES_N:
+        return profile.value_counts(top_n)
+    df = get_dataset(dataset_id)
+    if isinstance(df, ChunkedProfile):
+        return df.sample[col].value_counts().head(top_n)
+    return df[col].value_counts().head(top_n)
+
+
+# ========== СКРИНИНГ ВЛИЯНИЯ КАТЕГОРИЙ НА ЧИСЛОВЫЕ ПРИЗНАКИ ==========
+
+# Группы категориального признака - самые частые значения из профиля колонки, остальные строки не участвуют
+SCREENING_MAX_GROUPS = TOP_VALUES_N
+# Размер временных массивов bincount: не больше стольких ячеек (строки x числовые колонки) за раз
+SCREENING_BLOCK_CELLS = 2_000_000
+# Уровень FDR для поправки Бенджамини-Хохберга
+FDR_ALPHA = 0.05
+
+
+def benjamini_hochberg(p_values):
+    """q-values по Бенджамини-Хохбергу (NaN в поправке не участвуют)"""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    q_values = np.full(p_values.shape, np.nan)
+    valid = np.flatnonzero(np.isfinite(p_values))
+    if not len(valid):
+        return q_values
+    order = valid[np.argsort(p_values[valid], kind='stable')]
+    ranked = p_values[order] * len(order) / np.arange(1, len(order) + 1)
+    q_values[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1.0)
+    return q_values
+
+
+def _group_moments(df, numeric_cols, categorical_cols, groups, shift):
+    """Число значений, суммы и суммы квадратов (от shift) всех числовых колонок по группам всех категориальных: (3, C, G, P)"""
+    n_num = len(numeric_cols)
+    moments = np.zeros((3, len(categorical_cols), SCREENING_MAX_GROUPS, n_num))
+    for chunk in _iter_frame_chunks(df, numeric_cols + categorical_cols):
+        values = chunk[numeric_cols].to_numpy(dtype=np.float64, na_value=np.nan) - shift
+        valid = np.isfinite(values)
+        complete = bool(valid.all())
+        values[~valid] = 0.0
+        # Квадраты и маска заполненности считаются один раз на блок строк, общие для всех категориальных
+        squares = values * values
+        valid = valid.astype(np.float64)
+        width = max(1, min(n_num, SCREENING_BLOCK_CELLS // max(len(chunk), 1)))
+        for c, cat_col in enumerate(categorical_cols):
+            codes = pd.Categorical(chunk[cat_col], categories=groups[c]).codes.astype(np.intp)
+            rows = np.flatnonzero(codes >= 0)
+            if not len(rows):
+                continue
+            if len(rows) == len(codes):
+                rows = slice(None)
+            if complete:
+                # Без пропусков число значений в группе одинаково для всех числовых колонок
+                moments[0, c] += np.bincount(codes[rows], minlength=SCREENING_MAX_GROUPS)[:, None]
+            for j0 in range(0, n_num, width):
+                j1 = min(j0 + width, n_num)
+                # Общий код (группа, колонка): один bincount на весь блок колонок
+                index = (codes[rows, None] * (j1 - j0) + np.arange(j1 - j0)).ravel()
+                size = SCREENING_MAX_GROUPS * (j1 - j0)
+                for m, data in enumerate((valid, values, squares)):
+                    if m == 0 and complete:
+                        continue
+                    weights = data[rows, j0:j1].ravel()
+                    moments[m, c, :, j0:j1] += np.bincount(index, weights, minlength=size).reshape(-1, j1 - j0)
+    return moments
+
+
+def group_screening(moments, numeric_cols, categorical_cols):
+    """ANOVA, F-тест Уэлча и η² для всех пар сразу по моментам групп; q-values по BH, сортировка по η²"""
+    from scipy.stats import f as f_dist
+    n, s1, s2 = moments
+    present = n > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(present, s1 / n, 0.0)
+        ss_groups = np.where(present, np.maximum(s2 - s1 * means, 0.0), 0.0)
+        k = present.sum(axis=1)
+        total = n.sum(axis=1)
+        grand = s1.sum(axis=1) / total
+        ss_between = (n * (means - grand[:, None, :]) ** 2).sum(axis=1)
+        ss_within = ss_groups.sum(axis=1)
+        df_between, df_within = k - 1, total - k
+        testable = (k > 1) & (df_within > 0)
+        f_stat = np.where(testable, (ss_between / df_between) / (ss_within / df_within), np.nan)
+        p_value = np.where(testable, f_dist.sf(f_stat, df_between, df_within), np.nan)
+        eta_sq = np.where(testable, ss_between / (ss_between + ss_within), np.nan)
+        
+        # Уэлч: веса групп n/s², группы из одного значения или с нулевой дисперсией не участвуют
+        variances = ss_groups / (n - 1)
+        usable = (n > 1) & (variances > 0)
+        weights = np.where(usable, n / np.where(usable, variances, 1.0), 0.0)
+        k_w = usable.sum(axis=1)
+        weight_sum = weights.sum(axis=1)
+        weighted_mean = (weights * means).sum(axis=1) / weight_sum
+        spread = (weights * (means - weighted_mean[:, None, :]) ** 2).sum(axis=1) / (k_w - 1)
+        tmp = np.where(usable, (1 - weights / weight_sum[:, None, :]) ** 2 / np.where(usable, n - 1, 1.0), 0.0).sum(axis=1)
+        welch_testable = (k_w > 1) & (tmp > 0)
+        welch_f = np.where(welch_testable, spread / (1 + 2 * (k_w - 2) / (k_w ** 2 - 1) * tmp), np.nan)
+        welch_p = np.where(welch_testable, f_dist.sf(welch_f, k_w - 1, (k_w ** 2 - 1) / (3 * tmp)), np.nan)
+    
+    # Для поправки берется тест Уэлча (устойчив к разным дисперсиям), без него - обычный ANOVA
+    test_p = np.where(np.isfinite(welch_p), welch_p, p_value)
+    cat_index, num_index = np.nonzero(testable)
+    result = pd.DataFrame({
+        'Категориальный признак': np.asarray(categorical_cols, dtype=object)[cat_index],
+        'Числовой признак': np.asarray(numeric_cols, dtype=object)[num_index],
+        'Групп': k[cat_index, num_index],
+        'Наблюдений': total[cat_index, num_index].astype(np.int64),
+        'F': f_stat[cat_index, num_index],
+        'p-value': p_value[cat_index, num_index],
+        'F Уэлча': welch_f[cat_index, num_index],
+        'p-value Уэлча': welch_p[cat_index, num_index],
+        'η²': eta_sq[cat_index, num_index],
+        'q-value': benjamini_hochberg(test_p[cat_index, num_index]),
+    })
+    return result.sort_values('η²', ascending=False, kind='stable', ignore_index=True)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def compute_group_screening(dataset_id, numeric_cols, categorical_cols):
+    """Кэшированный скрининг всех пар категориальный x числовой признак (None, если пар нет)"""
+    if not numeric_cols or not categorical_cols:
+        return None
+    profiles = compute_column_profiles(dataset_id)
+    numeric_cols, categorical_cols = list(numeric_cols), list(categorical_cols)
+    groups = [list(profiles[col].value_counts(SCREENING_MAX_GROUPS).index) for col in categorical_cols]
+    shift = np.array([profiles[col].mean if np.isfinite(profiles[col].mean) else 0.0 for col in numeric_cols])
+    moments = _group_moments(get_dataset(dataset_id), numeric_cols, categorical_cols, groups, shift)
+    return group_screening(moments, numeric_cols, categorical_cols)
+
+
+# ========== СВЯЗИ КАТЕГОРИАЛЬНЫХ ПРИЗНАКОВ ==========
+
+# Уровни признака - самые частые значения из профиля; остальные значения объединяются в уровень "прочие"
+ASSOCIATION_MAX_LEVELS = TOP_VALUES_N
+# Код на колонку: уровни, "прочие" и пропуск (пропуски в таблицу сопряженности не входят)
+ASSOCIATION_CODES = ASSOCIATION_MAX_LEVELS + 2
+# Бюджет (пары x строки): при большем объеме связи считаются по случайной выборке строк
+ASSOCIATION_MAX_CELLS = 500_000_000
+# Размер временных массивов bincount: не больше стольких ячеек (строки x пары) за раз
+ASSOCIATION_BLOCK_CELLS = 4_000_000
+
+
+@dataclass(frozen=True)
+class CategoricalAssociations:
+    """Матрицы V Крамера и p-values хи-квадрат для всех пар категориальных признаков"""
+    cramers_v: pd.DataFrame
+    p_values: pd.DataFrame
+    rows: int       # по скольким строкам построены таблицы сопряженности
+    sampled: bool   # True, если строки - случайная выборка
+
+
+def _association_codes(chunk, categorical_cols, levels):
+    """Коды уровней всех колонок блока строк: (строки, колонки), "прочие" и пропуски - последние коды"""
+    codes = np.empty((len(chunk), len(categorical_cols)), dtype=np.intp)
+    for c, col in enumerate(categorical_cols):
+        column_codes = pd.Categorical(chunk[col], categories=levels[c]).codes.astype(np.intp)
+        column_codes[column_codes < 0] = ASSOCIATION_CODES - 2
+        column_codes[chunk[col].isna().to_numpy()] = ASSOCIATION_CODES - 1
+        codes[:, c] = column_codes
+    return codes
+
+
+def contingency_tables(df, categorical_cols, levels):
+    """Таблицы сопряженности всех пар колонок (верхний треугольник): (пары, коды, коды), один bincount на блок пар"""
+    n_cat = len(categorical_cols)
+    size = ASSOCIATION_CODES * ASSOCIATION_CODES
+    tables = np.zeros((n_cat * (n_cat - 1) // 2, size))
+    for chunk in _iter_frame_chunks(df, categorical_cols):
+        codes = _association_codes(chunk, categorical_cols, levels)
+        width = max(1, ASSOCIATION_BLOCK_CELLS // max(len(chunk), 1))
+        # Пары верхнего треугольника идут подряд по первой колонке: вторые колонки - срез, без копирования
+        offset = 0
+        for i in range(n_cat - 1):
+            for j0 in range(i + 1, n_cat, width):
+                j1 = min(j0 + width, n_cat)
+                # Общий код (пара, уровень первой колонки, уровень второй)
+                index = codes[:, j0:j1] + (codes[:, i, None] * ASSOCIATION_CODES + np.arange(j1 - j0) * size)
+                tables[offset:offset + j1 - j0] += np.bincount(index.ravel(), minlength=(j1 - j0) * size).reshape(-1, size)
+                offset += j1 - j0
+    # Строки и столбцы пропусков отбрасываются
+    return tables.reshape(-1, ASSOCIATION_CODES, ASSOCIATION_CODES)[:, :-1, :-1]
+
+
+def cramers_v(tables):
+    """V Крамера, хи-квадрат и p-values для стопки таблиц сопряженности (пустые уровни не учитываются)"""
+    from scipy.stats import chi2
+    n = tables.sum(axis=(1, 2))
+    row_sums, col_sums = tables.sum(axis=2), tables.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = row_sums[:, :, None] * col_sums[:, None, :] / n[:, None, None]
+        statistic = np.where(expected > 0, (tables - expected) ** 2 / expected, 0.0).sum(axis=(1, 2))
+        n_rows, n_cols = (row_sums > 0).sum(axis=1), (col_sums > 0).sum(axis=1)
+        dof = (n_rows - 1) * (n_cols - 1)
+        testable = dof > 0
+        v = np.where(testable, np.sqrt(statistic / n / (np.minimum(n_rows, n_cols) - 1)), np.nan)
+        p_value = np.where(testable, chi2.sf(statistic, np.maximum(dof, 1)), np.nan)
+    return np.clip(v, 0, 1), statistic, p_value
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def compute_categorical_associations(dataset_id, categorical_cols):
+    """Кэшированные матрицы V Крамера и p-values хи-квадрат (None, если признаков меньше двух)"""
+    if len(categorical_cols) < 2:
+        return None
+    categorical_cols = list(categorical_cols)
+    profiles = compute_column_profiles(dataset_id)
+    levels = [list(profiles[col].value_counts(ASSOCIATION_MAX_LEVELS).index) for col in categorical_cols]
+    
+    df = get_dataset(dataset_id)
+    n_pairs = len(categorical_cols) * (len(categorical_cols) - 1) // 2
+    max_rows = max(ASSOCIATION_MAX_CELLS // n_pairs, PROFILE_SAMPLE_ROWS)
+    sampled = len(df) > max_rows
+    if sampled:
+        # Слишком много пар x строк: таблицы по случайной выборке (в потоковом режиме - по выборке профиля)
+        df = df.sample if isinstance(df, ChunkedProfile) else df.iloc[compute_sample_indices(dataset_id, max_rows)]
+    
+    v, _, p_value = cramers_v(contingency_tables(df, categorical_cols, levels))
+    v_matrix = np.eye(len(categorical_cols))
+    p_matrix = np.zeros((len(categorical_cols), len(categorical_cols)))
+    first, second = np.triu_indices(len(categorical_cols), k=1)
+    v_matrix[first, second] = v_matrix[second, first] = v
+    p_matrix[first, second] = p_matrix[second, first] = p_value
+    return CategoricalAssociations(pd.DataFrame(v_matrix, index=categorical_cols, columns=categorical_cols),
+                                   pd.DataFrame(p_matrix, index=categorical_cols, columns=categorical_cols),
+                                   len(df), sampled)
+
+
+# ========== ВЫБРОСЫ ==========
+
+OUTLIER_METHODS = {
+    'iqr': 'IQR (1.5 × межквартильный размах)',
+    'zscore': 'Z-оценка (|z| > 3)',
+    'mad': 'Модифицированная z-оценка по MAD (|z| > 3.5)',
+    'percentile': 'Перцентили (1% и 99%)',
+}
+ZSCORE_THRESHOLD = 3.0
+MODIFIED_Z_THRESHOLD = 3.5
+OUTLIER_PERCENTILES = (0.01, 0.99)
+
+# Сколько колонок обрабатывается за один векторный шаг
+OUTLIER_BLOCK_COLS = 64
+
+
+class OutlierTable:
+    """Выбросы всех числовых колонок одним методом: границы, счетчики и упакованные битовые маски строк"""
+    
+    def __init__(self, method, columns, lower, upper, counts, n_rows, bits=None):
+        self.method = method
+        self.columns = list(columns)
+        self.lower = pd.Series(lower, index=self.columns, dtype=float)
+        self.upper = pd.Series(upper, index=self.columns, dtype=float)
+        self.counts = pd.Series(counts, index=self.columns, dtype='int64')
+        self.n_rows = n_rows
+        # По строке на колонку, бит на строку датасета (None в потоковом режиме)
+        self.bits = bits
+        self._positions = {col: j for j, col in enumerate(self.columns)}
+    
+    def bounds(self, col):
+        return self.lower[col], self.upper[col]
+    
+    def count(self, col):
+        return self.counts[col]
+    
+    def mask(self, col):
+        """Булева маска выбросов колонки (None, если маски не хранятся)"""
+        if self.bits is None:
+            return None
+        return np.unpackbits(self.bits[self._positions[col]], count=self.n_rows).astype(bool)
+    
+    def indices(self, col):
+        """Номера строк-выбросов колонки"""
+        mask = self.mask(col)
+        return None if mask is None else np.flatnonzero(mask)
+    
+    def rows(self, df, col, max_rows=MAX_OUTLIER_ROWS):
+        """Строки-выбросы, материализуются только при показе (в потоковом режиме - проход по файлу)"""
+        if isinstance(df, ChunkedProfile):
+            return df.find_outliers(col, *self.bounds(col), max_rows=max_rows)
+        rows = df.iloc[self.indices(col)[:max_rows]]
+        rows.attrs['total_count'] = int(self.counts[col])
+        return rows
+    
+    def summary(self):
+        """Число и доля выбросов по колонкам, где они есть"""
+        summary = pd.DataFrame({
+            'Нижняя граница': self.lower, 'Верхняя граница': self.upper, 'Выбросов': self.counts,
+            'Процент': self.counts / self.n_rows * 100 if self.n_rows else 0.0,
+        })
+        return summary[summary['Выбросов'] > 0].sort_values('Выбросов', ascending=False)
+
+
+def _outlier_bounds(method, profiles, columns, block=None):
+    """Нижние и верхние границы выбросов для колонок (block - значения колонок для MAD и перцентилей)"""
+    if method == 'iqr':
+        q25 = np.array([profiles[col].q25 for col in columns], dtype=float)
+        q75 = np.array([profiles[col].q75 for col in columns], dtype=float)
+        return q25 - 1.5 * (q75 - q25), q75 + 1.5 * (q75 - q25)
+    if method == 'zscore':
+        mean = np.array([profiles[col].mean for col in columns], dtype=float)
+        std = np.array([profiles[col].std for col in columns], dtype=float)
+        # Нулевой разброс - выбросов нет
+        std = np.where(std > 0, std, np.inf)
+        return mean - ZSCORE_THRESHOLD * std, mean + ZSCORE_THRESHOLD * std
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if method == 'mad':
+            median = np.array([profiles[col].median for col in columns], dtype=float)
+            mad = np.nanmedian(np.abs(block - median), axis=0)
+            # |0.6745 * (x - median) / MAD| > порога
+            spread = np.where(mad > 0, MODIFIED_Z_THRESHOLD * mad / 0.6745, np.inf)
+            return median - spread, median + spread
+        if method == 'percentile':
+            lower, upper = np.nanquantile(block, OUTLIER_PERCENTILES, axis=0)
+            return lower, upper
+    raise ValueError(f"Неизвестный метод поиска выбросов: {method}")
+
+
+def build_outlier_table(df, method, profiles):
+    """Ищет выбросы во всех числовых колонках за один векторный проход блоками колонок"""
+    columns = [col for col, profile in profiles.items() if profile.is_numeric]
+    n_rows = len(df)
+    lower = np.empty(len(columns))
+    upper = np.empty(len(columns))
+    counts = np.zeros(len(columns), dtype=np.int64)
+    
+    if isinstance(df, ChunkedProfile):
+        # Границы по профилю (MAD и перцентили - по выборке строк), затем один проход по файлу со счетчиками
+        if columns:
+            sample = df.sample[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+            lower[:], upper[:] = _outlier_bounds(method, profiles, columns, sample)
+        for chunk in df.iter_chunks(usecols=columns or None):
+            values = chunk[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+            counts += ((values < lower) | (values > upper)).sum(axis=0)
+        return OutlierTable(method, columns, lower, upper, counts, n_rows)
+    
+    bits = np.zeros((len(columns), (n_rows + 7) // 8), dtype=np.uint8)
+    for start in range(0, len(columns), OUTLIER_BLOCK_COLS):
+        block_cols = columns[start:start + OUTLIER_BLOCK_COLS]
+        block = df[block_cols].to_numpy(dtype=np.float64, na_value=np.nan)
+        block_lower, block_upper = _outlier_bounds(method, profiles, block_cols, block)
+        # Сравнение с NaN дает False - пропуски выбросами не считаются
+        mask = (block < block_lower) | (block > block_upper)
+        stop = start + len(block_cols)
+        lower[start:stop], upper[start:stop] = block_lower, block_upper
+        counts[start:stop] = mask.sum(axis=0)
+        bits[start:stop] = np.packbits(mask, axis=0).T
+    return OutlierTable(method, columns, lower, upper, counts, n_rows, bits)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def compute_outlier_table(dataset_id, method='iqr'):
+    """Кэшированные выбросы всех числовых колонок (объект общий, не изменять)"""
+    return build_outlier_table(get_dataset(dataset_id), method, compute_column_profiles(dataset_id))
+
+
+def compute_outlier_summary(dataset_id, method='iqr'):
+    """Сводка выбросов для отчетов: признак, количество и процент"""
+    summary = compute_outlier_table(dataset_id, method).summary()
+    return [{'Признак': col, 'Выбросов': int(row['Выбросов']), 'Процент': f"{row['Процент']:.2f}%"}
+            for col, row in summary.iterrows()]
+
+
+# ========== МНОГОМЕРНЫЕ ВЫБРОСЫ ==========
+
+MULTIVARIATE_METHODS = {
+    'mahalanobis': 'Расстояние Махаланобиса (робастная ковариация)',
+    'isolation_forest': 'Изолирующий лес',
+}
+# Доля строк, по которой ищется "ядро" данных при робастной оценке (h в MCD)
+ROBUST_SUPPORT_FRACTION = 0.75
+ROBUST_CSTEPS = 20
+ROBUST_SAMPLE_ROWS = 50_000
+# Строка - выброс, если квадрат расстояния больше этого квантиля хи-квадрат
+MAHALANOBIS_QUANTILE = 0.975
+ISOLATION_TREES = 100
+ISOLATION_SUBSAMPLE = 256
+# Оценка изолирующего леса выше порога - аномалия (0.5 - обычная строка)
+ISOLATION_THRESHOLD = 0.6
+TOP_ANOMALIES_N = 100
+
+
+class MultivariateOutliers:
+    """Оценки аномальности всех строк по нескольким признакам (чем больше, тем аномальнее)"""
+    
+    def __init__(self, method, columns, scores, threshold, center=None, covariance=None):
+        self.method = method
+        self.columns = list(columns)
+        self.scores = scores
+        self.threshold = threshold
+        self.center = center
+        self.covariance = covariance
+        self.count = int((scores > threshold).sum())
+    
+    def top(self, n=TOP_ANOMALIES_N):
+        """Номера n самых аномальных строк по убыванию оценки"""
+        n = min(n, len(self.scores))
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-self.scores, n - 1)[:n]
+        return top[np.argsort(-self.scores[top], kind='stable')]
+    
+    def rows(self, df, n=TOP_ANOMALIES_N):
+        """Самые аномальные строки с оценкой (в потоковом режиме - проход по файлу)"""
+        positions = self.top(n)
+        if isinstance(df, ChunkedProfile):
+            rows = df.take_rows(positions)
+            rows = rows.iloc[np.searchsorted(np.sort(positions), positions)]
+        else:
+            rows = df.iloc[positions]
+        rows = rows.copy()
+        rows.insert(0, 'Оценка аномальности', self.scores[positions])
+        return rows
+
+
+def _iter_frame_chunks(df, columns):
+    """Колонки датасета блоками строк (в потоковом режиме - проход по файлу)"""
+    if isinstance(df, ChunkedProfile):
+        for chunk in df.iter_chunks(usecols=columns):
+            yield chunk[columns]
+    else:
+        positions = df.columns.get_indexer(columns)
+        for start in range(0, len(df), CHUNK_ROWS):
+            yield df.iloc[start:start + CHUNK_ROWS, positions]
+
+
+def _iter_numeric_blocks(df, columns, fill=None):
+    """Значения колонок блоками строк (float64, пропуски заменяются на fill)"""
+    for block in _iter_frame_chunks(df, columns):
+        values = block.to_numpy(dtype=np.float64, na_value=np.nan)
+        if fill is not None:
+            values = np.where(np.isnan(values), fill, values)
+        yield values
+
+
+def _fit_sample(df, columns, fill):
+    """Случайная выборка строк для построения моделей"""
+    if isinstance(df, ChunkedProfile):
+        sample = df.sample[columns]
+    elif len(df) > ROBUST_SAMPLE_ROWS:
+        rng = np.random.default_rng(42)
+        sample = df.iloc[np.sort(rng.choice(len(df), ROBUST_SAMPLE_ROWS, replace=False)), df.columns.get_indexer(columns)]
+    else:
+        sample = df[columns]
+    values = sample.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.where(np.isnan(values), fill, values)
+
+
+def _mahalanobis_sq(values, center, precision):
+    diff = values - center
+    return np.einsum('ij,ij->i', diff @ precision, diff)
+
+
+def _robust_covariance(sample):
+    """Начальная робастная оценка по выборке: C-шаги MCD от покоординатной медианы"""
+    from scipy.stats import chi2
+    n, p = sample.shape
+    h = min(n, max(int(n * ROBUST_SUPPORT_FRACTION), p + 1))
+    center = np.median(sample, axis=0)
+    scale = np.median(np.abs(sample - center), axis=0) * 1.4826
+    scale = np.where(scale > 0, scale, sample.std(axis=0))
+    scale = np.where(scale > 0, scale, 1.0)
+    d2 = (((sample - center) / scale) ** 2).sum(axis=1)
+    support = None
+    for _ in range(ROBUST_CSTEPS):
+        new_support = np.sort(np.argpartition(d2, h - 1)[:h])
+        if support is not None and np.array_equal(support, new_support):
+            break
+        support = new_support
+        center = sample[support].mean(axis=0)
+        covariance = np.cov(sample[support], rowvar=False).reshape(p, p)
+        d2 = _mahalanobis_sq(sample, center, np.linalg.pinv(covariance, hermitian=True))
+    # Поправка на согласованность: по ядру из h строк ковариация занижена
+    correction = np.median(d2) / chi2.ppf(0.5, p)
+    if correction > 0:
+        covariance = covariance * correction
+    return center, covariance
+
+
+def build_mahalanobis_outliers(df, columns, fill):
+    """Расстояния Махаланобиса всех строк: старт по выборке, перевзвешивание и оценки - проходами по блокам"""
+    from scipy.stats import chi2
+    p = len(columns)
+    center, covariance = _robust_covariance(_fit_sample(df, columns, fill))
+    cutoff = chi2.ppf(MAHALANOBIS_QUANTILE, p)
+    
+    # Перевзвешивание по всем строкам: ковариация по строкам внутри границы
+    precision = np.linalg.pinv(covariance, hermitian=True)
+    n_inliers = 0
+    sums = np.zeros(p)
+    cross = np.zeros((p, p))
+    for values in _iter_numeric_blocks(df, columns, fill):
+        inliers = values[_mahalanobis_sq(values, center, precision) <= cutoff] - center
+        n_inliers += len(inliers)
+        sums += inliers.sum(axis=0)
+        cross += inliers.T @ inliers
+    if n_inliers > p:
+        shift = sums / n_inliers
+        covariance = (cross - n_inliers * np.outer(shift, shift)) / (n_inliers - 1)
+        # Поправка на усечение распределения по квантилю
+        covariance = covariance * MAHALANOBIS_QUANTILE / chi2.cdf(cutoff, p + 2)
+        center = center + shift
+    
+    precision = np.linalg.pinv(covariance, hermitian=True)
+    scores = np.concatenate([np.sqrt(_mahalanobis_sq(values, center, precision)).astype(np.float32)
+                             for values in _iter_numeric_blocks(df, columns, fill)] or [np.empty(0, np.float32)])
+    return MultivariateOutliers('mahalanobis', columns, scores, np.sqrt(cutoff), center, covariance)
+
+
+def _average_path_length(n):
+    """Средняя длина пути неуспешного поиска в двоичном дереве из n элементов"""
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        length = 2.0 * (np.log(n - 1.0) + np.euler_gamma) - 2.0 * (n - 1.0) / n
+    return np.where(n > 2, length, np.where(n == 2, 1.0, 0.0))
+
+
+def _build_isolation_tree(sample, rng, max_depth):
+    """Дерево изолирующего леса в полной двоичной раскладке: потомки узла i - узлы 2i+1 и 2i+2"""
+    n_nodes = 2 ** (max_depth + 1) - 1
+    feature = np.zeros(n_nodes, dtype=np.intp)
+    # Порог +inf у листьев: строка уходит влево до нижнего уровня, где записана длина пути
+    threshold = np.full(n_nodes, np.inf, dtype=np.float32)
+    path_length = np.zeros(n_nodes)
+    stack = [(0, np.arange(len(sample)), 0)]
+    while stack:
+        node, rows, depth = stack.pop()
+        candidates = []
+        if depth < max_depth and len(rows) > 1:
+            values = sample[rows]
+            low, high = values.min(axis=0), values.max(axis=0)
+            candidates = np.flatnonzero(high > low)
+        if len(candidates):
+            f = rng.choice(candidates)
+            split = np.float32(rng.uniform(low[f], high[f]))
+            goes_left = values[:, f] < split
+            feature[node], threshold[node] = f, split
+            stack.append((2 * node + 1, rows[goes_left], depth + 1))
+            stack.append((2 * node + 2, rows[~goes_left], depth + 1))
+        else:
+            path_length[(node + 1) * 2 ** (max_depth - depth) - 1] = depth + _average_path_length(len(rows))
+    return feature, threshold, path_length
+
+
+def _isolation_path_length(columns_flat, n, tree, max_depth):
+    """Длина пути каждой из n строк в дереве (значения - колонки подряд, float32)"""
+    feature, threshold, path_length = tree
+    rows = np.arange(n)
+    node = np.zeros(n, dtype=np.intp)
+    for _ in range(max_depth):
+        node = 2 * node + 1 + (columns_flat[feature[node] * n + rows] >= threshold[node])
+    return path_length[node]
+
+
+def build_isolation_forest_outliers(df, columns, fill):
+    """Оценки изолирующего леса: деревья по подвыборкам, оценка всех строк проходом по блокам"""
+    sample = _fit_sample(df, columns, fill).astype(np.float32)
+    rng = np.random.default_rng(42)
+    subsample = min(ISOLATION_SUBSAMPLE, len(sample))
+    max_depth = int(np.ceil(np.log2(max(subsample, 2))))
+    trees = [_build_isolation_tree(sample[rng.choice(len(sample), subsample, replace=False)], rng, max_depth)
+             for _ in range(ISOLATION_TREES)]
+    normalizer = float(_average_path_length(subsample)) or 1.0
+    
+    scores = []
+    for values in _iter_numeric_blocks(df, columns, fill):
+        columns_flat = np.ascontiguousarray(values.T, dtype=np.float32).ravel()
+        path = sum(_isolation_path_length(columns_flat, len(values), tree, max_depth) for tree in trees) / len(trees)
+        scores.append((2.0 ** (-path / normalizer)).astype(np.float32))
+    scores = np.concatenate(scores) if scores else np.empty(0, np.float32)
+    return MultivariateOutliers('isolation_forest', columns, scores, ISOLATION_THRESHOLD)
+
+
+def build_multivariate_outliers(df, columns, method, profiles):
+    """Многомерные выбросы по выбранным колонкам (постоянные колонки не участвуют)"""
+    columns = [col for col in columns if profiles[col].is_numeric and profiles[col].std > 0]
+    if not columns:
+        return None
+    # Пропуски заменяются медианой - по такой координате строка не выделяется
+    fill = np.array([profiles[col].median for col in columns], dtype=np.float64)
+    if method == 'mahalanobis':
+        return build_mahalanobis_outliers(df, columns, fill)
+    if method == 'isolation_forest':
+        return build_isolation_forest_outliers(df, columns, fill)
+    raise ValueError(f"Неизвестный метод поиска многомерных выбросов: {method}")
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def compute_multivariate_outliers(dataset_id, columns, method='mahalanobis'):
+    """Кэшированные оценки аномальности строк (объект общий, не изменять)"""
+    return build_multivariate_outliers(get_dataset(dataset_id), list(columns), method,
+                                       compute_column_profiles(dataset_id))
+
+
+# ========== КЭШ ГИСТОГРАММ И ПЛОТНОСТЕЙ ==========
+
+# Мелких бинов на колонку: делится на 10, 12, 15, 20, 24, 25, 30, 40, 50, 60 - обычные гистограммы
+# собираются из них без потерь
+HIST_BINS = 600
+# Запас сетки KDE за крайними значениями рассчитан на группы от стольких строк
+KDE_MIN_GROUP_ROWS = 100
+VIOLIN_MAX_GROUPS = 20
+# Больше стольких различных выбросов boxplot не рисует (берутся равномерно по порядку, крайние - всегда)
+BOX_MAX_FLIERS = 1000
+
+
+@dataclass(frozen=True)
+class BinnedColumn:
+    """Колонка, один раз разложенная по бинам (вся и по группам): гистограммы, KDE и квартили без сырых данных"""
+    column: str
+    edges: np.ndarray        # границы мелких бинов от минимума до максимума
+    counts: np.ndarray       # (1 + число групп, HIST_BINS), строка 0 - все значения
+    grid: np.ndarray         # сетка KDE
+    grid_counts: np.ndarray  # (1 + число групп, KDE_GRID_POINTS), линейная раскладка
+    moments: np.ndarray      # (1 + число групп, 3): число значений, сумма и сумма квадратов отклонений от shift
+    shift: float = 0.0
+    groups: tuple = ()
+    boxes: tuple = ()        # статистики boxplot по строкам счетчиков (точные квартили, усы и выбросы)
+    
+    def _row(self, group):
+        return 0 if group is None else 1 + self.groups.index(group)
+    
+    def count(self, group=None):
+        return int(self.moments[self._row(group), 0])
+    
+    def mean(self, group=None):
+        n, s1, _ = self.moments[self._row(group)]
+        return float(self.shift + s1 / n) if n > 0 else np.nan
+    
+    def std(self, group=None):
+        n, s1, s2 = self.moments[self._row(group)]
+        return float(np.sqrt(max(s2 - s1 ** 2 / n, 0.0) / (n - 1))) if n > 1 else np.nan
+    
+    def value_range(self, group=None):
+        """Минимум и максимум значений"""
+        box = self.boxes[self._row(group)]
+        return box['min'], box['max']
+    
+    def histogram(self, bins=25, group=None):
+        """Границы и счетчики гистограммы из bins равных интервалов"""
+        counts = self.counts[self._row(group)]
+        edges = np.linspace(self.edges[0], self.edges[-1], bins + 1)
+        cumulative = np.concatenate([[0.0], np.cumsum(counts)])
+        return edges, np.diff(np.interp(edges, self.edges, cumulative))
     
-    fixed = False
-    original_shape = df.shape[1]
+    def draw_hist(self, ax, bins=25, group=None, density=False, mask=None, **kwargs):
+        """Рисует гистограмму по готовым счетчикам (mask(центры мелких бинов) оставляет часть бинов)"""
+        if mask is None:
+            edges, counts = self.histogram(bins, group)
+        else:
+            centers = (self.edges[:-1] + self.edges[1:]) / 2
+            selected = np.where(mask(centers), self.counts[self._row(group)], 0)
+            edges = np.linspace(self.edges[0], self.edges[-1], bins + 1)
+            counts = np.diff(np.interp(edges, self.edges, np.concatenate([[0.0], np.cumsum(selected)])))
+        if density and counts.sum() > 0:
+            counts = counts / (counts.sum() * np.diff(edges))
+        return ax.hist(edges[:-1], bins=edges, weights=counts, **kwargs)
     
-    # Проверяем числовые колонки - если в них текст, возможно есть сдвиг
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    def kde(self, group=None, cut=None):
+        """Сетка и плотность KDE (окно по правилу Скотта); cut обрезает кривую в ширинах окна за крайними значениями"""
+        n = self.count(group)
+        bandwidth = self.std(group) * n ** (-1 / 5) if n > 1 else np.nan
+        if not bandwidth > 0:
+            return None
+        step = self.grid[1] - self.grid[0]
+        density = _gaussian_smooth(self.grid_counts[self._row(group)], step, bandwidth, n)
+        if cut is None:
+            return self.grid, density
+        low, high = self.value_range(group)
+        keep = (self.grid >= low - cut * bandwidth) & (self.grid <= high + cut * bandwidth)
+        return self.grid[keep], density[keep]
     
-    # Если слишком мало числовых колонок, возможно есть проблема
-    if len(numeric_cols) < df.shape[1] * 0.3:
-        # Проверяем последние колонки - они должны быть числовыми
-        last_cols = df.columns[-5:].tolist()
-        for col in last_cols:
-            if df[col].dtype == 'object':
-                # Пытаемся преобразовать в число
-                non_numeric = df[col].astype(str).str.contains(r'[^0-9.\-]', na=False, regex=True)
-                if non_numeric.sum() > len(df) * 0.1:  # Более 10% не числовых
-                    fixed = True
-                    break
+    def box(self, group=None):
+        """Статистики boxplot для Axes.bxp: квартили, усы на 1.5 IQR и выбросы за усами"""
+        box = self.boxes[self._row(group)]
+        return {key: box[key] for key in ('med', 'q1', 'q3', 'whislo', 'whishi', 'fliers')}
+
+
+def _binned_values(df, col, group_col=None, groups=()):
+    """Блоки (номера строк счетчиков, значения): все значения со строкой 0 и значения групп еще раз со своими строками"""
+    columns = [col] if group_col is None else [col, group_col]
+    for chunk in _iter_frame_chunks(df, columns):
+        values = chunk[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = np.isfinite(values)
+        codes = np.zeros(valid.sum(), dtype=np.intp)
+        values = values[valid]
+        if group_col is not None:
+            group_codes = pd.Categorical(chunk[group_col], categories=list(groups)).codes[valid] + 1
+            in_group = group_codes > 0
+            codes = np.concatenate([codes, group_codes[in_group]])
+            values = np.concatenate([values, values[in_group]])
+        yield codes, values
+
+
+def _group_quartiles(df, col, group_col, groups):
+    """Квартили и медиана значений по группам, (число групп, 3): точные или по скетчам для больших датасетов"""
+    if not _use_sketches(df):
+        values = pd.to_numeric(df[col], errors='coerce').astype(np.float64)
+        keys = pd.Categorical(df[group_col], categories=list(groups))
+        quartiles = values.groupby(keys, observed=False).quantile([0.25, 0.5, 0.75]).unstack()
+        return quartiles.reindex(list(groups)).to_numpy(dtype=np.float64)
+    sketches = [QuantileSketch() for _ in groups]
+    for codes, values in _binned_values(df, col, group_col, groups):
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(1, len(groups) + 2))
+        for i, sketch in enumerate(sketches):
+            sketch.update(values[order[bounds[i]:bounds[i + 1]]])
+    return np.array([[sketch.quantile(q) for q in (0.25, 0.5, 0.75)] for sketch in sketches]).reshape(-1, 3)
+
+
+def _box_stats(df, col, profile, group_col, groups):
+    """Статистики boxplot всей колонки (квартили из профиля колонок) и групп: усы и выбросы - отдельным проходом"""
+    n_rows = 1 + len(groups)
+    quartiles = np.array([[profile.q25, profile.median, profile.q75]])
+    if groups:
+        quartiles = np.vstack([quartiles, _group_quartiles(df, col, group_col, groups)])
+    iqr = quartiles[:, 2] - quartiles[:, 0]
+    fence_low, fence_high = quartiles[:, 0] - 1.5 * iqr, quartiles[:, 2] + 1.5 * iqr
     
-    # Если обнаружен сдвиг, пытаемся исправить
-    if fixed or has_tabs:
-        return df, False  # Пока возвращаем как есть, но добавим предупреждение
+    extremes = np.tile([np.inf, -np.inf], (n_rows, 1))
+    whiskers = np.tile([np.inf, -np.inf], (n_rows, 1))
+    fliers = [[] for _ in range(n_rows)]
+    for codes, values in _binned_values(df, col, group_col, groups):
+        if not len(values):
+            continue
+        inside = (values >= fence_low[codes]) & (values <= fence_high[codes])
+        for target, mask in ((extremes, slice(None)), (whiskers, inside)):
+            grouped = pd.Series(values[mask]).groupby(codes[mask]).agg(['min', 'max'])
+            rows = grouped.index.to_numpy()
+            target[rows, 0] = np.minimum(target[rows, 0], grouped['min'].to_numpy())
+            target[rows, 1] = np.maximum(target[rows, 1], grouped['max'].to_numpy())
+        outside = ~inside
+        for row in np.unique(codes[outside]):
+            fliers[row].append(np.unique(values[outside & (codes == row)]))
     
-    return df, fixed
+    boxes = []
+    for row in range(n_rows):
+        q1, median, q3 = quartiles[row]
+        row_fliers = np.unique(np.concatenate(fliers[row])) if fliers[row] else np.empty(0)
+        if len(row_fliers) > BOX_MAX_FLIERS:
+            row_fliers = row_fliers[np.linspace(0, len(row_fliers) - 1, BOX_MAX_FLIERS).round().astype(np.intp)]
+        low, high = extremes[row]
+        boxes.append({
+            'med': median, 'q1': q1, 'q3': q3,
+            'whislo': min(whiskers[row, 0], q1) if np.isfinite(whiskers[row, 0]) else q1,
+            'whishi': max(whiskers[row, 1], q3) if np.isfinite(whiskers[row, 1]) else q3,
+            'fliers': row_fliers,
+            'min': low if np.isfinite(low) else np.nan, 'max': high if np.isfinite(high) else np.nan,
+        })
+    return tuple(boxes)
 
 
-def fix_data_shift(df):
-    """Проверяет типы данных в первых и последних 15 строках на наличие сдвигов"""
-    if df is None or df.empty or df.shape[0] < 30:
-        return df, False, None
+def build_binned_column(df, col, profile, group_col=None, groups=()):
+    """Раскладывает колонку по бинам за один проход (по всем строкам и по группам group_col)"""
+    low, high = profile.min, profile.max
+    if not (np.isfinite(low) and np.isfinite(high)):
+        return None
+    if high <= low:
+        # Постоянная колонка - как np.histogram, интервал единичной ширины
+        low, high = low - 0.5, high + 0.5
+    edges = np.linspace(low, high, HIST_BINS + 1)
+    spread = profile.std if profile.std > 0 else (high - low)
+    margin = KDE_CUT * spread * min(profile.count, KDE_MIN_GROUP_ROWS) ** (-1 / 5)
+    grid = np.linspace(low - margin, high + margin, KDE_GRID_POINTS)
+    step = grid[1] - grid[0]
+    shift = profile.mean if np.isfinite(profile.mean) else 0.0
     
-    # Берем первые и последние 15 строк
-    first_15 = df.head(15)
-    last_15 = df.tail(15)
+    n_rows = 1 + len(groups)
+    counts = np.zeros((n_rows, HIST_BINS))
+    grid_counts = np.zeros((n_rows, KDE_GRID_POINTS))
+    moments = np.zeros((n_rows, 3))
+    for codes, values in _binned_values(df, col, group_col, groups):
+        bins = np.clip(((values - low) / (high - low) * HIST_BINS).astype(np.intp), 0, HIST_BINS - 1)
+        counts += np.bincount(codes * HIST_BINS + bins, minlength=n_rows * HIST_BINS).reshape(n_rows, HIST_BINS)
+        grid_counts += _linear_binning(values, grid[0], step, KDE_GRID_POINTS, codes, n_rows)
+        centered = values - shift
+        moments[:, 0] += np.bincount(codes, minlength=n_rows)
+        moments[:, 1] += np.bincount(codes, centered, minlength=n_rows)
+        moments[:, 2] += np.bincount(codes, centered ** 2, minlength=n_rows)
+    # Квартили и усы не берутся из бинов: одно далекое значение делает бины шире межквартильного размаха
+    boxes = _box_stats(df, col, profile, group_col, tuple(groups))
+    return BinnedColumn(col, edges, counts, grid, grid_counts, moments, shift, tuple(groups), boxes)
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def compute_binned_column(dataset_id, col, group_col=None, groups=()):
+    """Кэшированная раскладка колонки по бинам (объект общий, не изменять)"""
+    return build_binned_column(get_dataset(dataset_id), col, compute_column_profiles(dataset_id)[col],
+                               group_col, tuple(groups))
+
+
+def draw_violins(ax, binned, groups=None, labels=None, color='lightcoral', colors=None):
+    """Рисует violin plot по раскладке колонки (внутри - квартили, усы и медиана)"""
+    groups = [None] if groups is None else list(groups)
+    labels = [binned.column] * len(groups) if labels is None else list(labels)
+    for i, group in enumerate(groups):
+        if not binned.count(group):
+            continue
+        face = colors[i % len(colors)] if colors is not None else color
+        # Как в seaborn: кривая обрезается на 2 ширинах окна за крайними значениями
+        kde = binned.kde(group, cut=2)
+        if kde is not None:
+            grid, density = kde
+            half = density / density.max() * 0.4
+            ax.fill_betweenx(grid, i - half, i + half, facecolor=face, edgecolor='dimgray', linewidth=1, alpha=0.8)
+        box = binned.box(group)
+        ax.vlines(i, box['whislo'], box['whishi'], color='dimgray', linewidth=1)
+        ax.vlines(i, box['q1'], box['q3'], color='dimgray', linewidth=5)
+        ax.scatter([i], [box['med']], color='white', s=15, zorder=3)
+    ax.set_xticks(range(len(groups)))
+    ax.set_xticklabels([str(label) for label in labels])
+
+
+# ========== АГРЕГАЦИЯ ТОЧЕК ДЛЯ SCATTER PLOT ==========
+
+# Клеток сетки плотности по каждой оси
+DENSITY_GRID_BINS = 200
+SCATTER_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+                  '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+
+
+@dataclass(frozen=True)
+class DensityRaster:
+    """Все точки пары колонок, собранные в 2D-сетку счетчиков (отдельно по значениям hue)"""
+    x_col: str
+    y_col: str
+    x_edges: np.ndarray
+    y_edges: np.ndarray
+    counts: np.ndarray  # (число групп или 1, клетки по y, клетки по x)
+    groups: tuple = ()
     
-    # Определяем типы данных для каждой колонки в первых и последних строках
-    def get_column_type(series):
-        """Определяет тип колонки: numeric или text"""
-        if series.dtype in [np.int64, np.float64]:
-            return 'numeric'
+    @property
+    def n_points(self):
+        return int(self.counts.sum())
+    
+    @property
+    def extent(self):
+        return (self.x_edges[0], self.x_edges[-1], self.y_edges[0], self.y_edges[-1])
+    
+    def group_count(self, group):
+        return int(self.counts[self.groups.index(group)].sum())
+    
+    def draw(self, ax, cmap='viridis', color=None, groups=None, colors=SCATTER_COLORS):
+        """Рисует плотность точек: пустые клетки прозрачны, любая непустая видна (логарифмическая шкала)
         
-        # Пробуем преобразовать в число
-        numeric_count = pd.to_numeric(series, errors='coerce').notna().sum()
-        numeric_ratio = numeric_count / len(series) if len(series) > 0 else 0
+        Без hue и color возвращает изображение для colorbar; иначе прозрачность клетки растет с числом точек,
+        а цвет - смесь цветов групп по их долям.
+        """
+        from matplotlib.colors import LogNorm, to_rgb
         
-        if numeric_ratio > 0.7:  # Более 70% числовых - считаем числовой
-            return 'numeric'
+        if not self.n_points:
+            return None
+        if not self.groups and color is None:
+            counts = np.ma.masked_equal(self.counts[0], 0)
+            return ax.imshow(counts, extent=self.extent, origin='lower', aspect='auto', interpolation='nearest',
+                             cmap=cmap, norm=LogNorm(vmin=1, vmax=max(counts.max(), 2)))
+        
+        if self.groups:
+            groups = list(self.groups) if groups is None else list(groups)
+            positions = [self.groups.index(group) for group in groups]
+            palette = np.array([to_rgb(colors[i % len(colors)]) for i in positions])
         else:
-            return 'text'
+            positions = [0]
+            palette = np.array([to_rgb(color)])
+        counts = self.counts[positions]
+        total = counts.sum(axis=0)
+        rgb = np.tensordot(counts, palette, axes=([0], [0])) / np.maximum(total, 1)[..., None]
+        alpha = np.where(total > 0, 0.35 + 0.65 * np.log1p(total) / np.log1p(max(total.max(), 1)), 0.0)
+        ax.imshow(np.dstack([rgb, alpha]), extent=self.extent, origin='lower', aspect='auto', interpolation='nearest')
+        for i, group in zip(positions, groups if self.groups else []):
+            # Пустой scatter - только для подписи группы в легенде
+            ax.scatter([], [], color=colors[i % len(colors)], marker='s', label=f'{group} ({self.group_count(group)})')
+        return None
+
+
+def _axis_range(low, high):
+    if high <= low:
+        return low - 0.5, high + 0.5
+    return low, high
+
+
+def build_density_raster(df, x_col, y_col, profiles, hue_col=None, hue_values=(), y_range=None,
+                         y_inclusive='both', bins=DENSITY_GRID_BINS):
+    """Собирает все точки пары колонок в 2D-сетку за один проход
     
-    # Получаем типы для каждой колонки
-    first_types = {}
-    last_types = {}
+    y_range оставляет только точки с y в диапазоне; y_inclusive - какие концы диапазона включаются
+    ('both', 'left', 'right', 'neither', как в Series.between).
+    """
+    x_low, x_high = profiles[x_col].min, profiles[x_col].max
+    y_low, y_high = (profiles[y_col].min, profiles[y_col].max) if y_range is None else y_range
+    if not np.isfinite([x_low, x_high, y_low, y_high]).all():
+        return None
+    x_low, x_high = _axis_range(x_low, x_high)
+    y_low, y_high = _axis_range(y_low, y_high)
     
-    for col in df.columns:
-        first_types[col] = get_column_type(first_15[col])
-        last_types[col] = get_column_type(last_15[col])
+    n_groups = max(len(hue_values), 1)
+    counts = np.zeros(n_groups * bins * bins)
+    columns = [x_col, y_col] + ([hue_col] if hue_col is not None else [])
+    for chunk in _iter_frame_chunks(df, columns):
+        x = chunk[x_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        y = chunk[y_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(invalid='ignore'):
+            valid = np.isfinite(x) & np.isfinite(y)
+            valid &= (y >= y_low) if y_inclusive in ('both', 'left') else (y > y_low)
+            valid &= (y <= y_high) if y_inclusive in ('both', 'right') else (y < y_high)
+        codes = 0
+        if hue_col is not None:
+            group_codes = pd.Categorical(chunk[hue_col], categories=list(hue_values)).codes
+            valid &= group_codes >= 0
+            codes = group_codes[valid].astype(np.intp)
+        ix = np.clip(((x[valid] - x_low) / (x_high - x_low) * bins).astype(np.intp), 0, bins - 1)
+        iy = np.clip(((y[valid] - y_low) / (y_high - y_low) * bins).astype(np.intp), 0, bins - 1)
+        counts += np.bincount((codes * bins + iy) * bins + ix, minlength=len(counts))
+    return DensityRaster(x_col, y_col, np.linspace(x_low, x_high, bins + 1), np.linspace(y_low, y_high, bins + 1),
+                         counts.reshape(n_groups, bins, bins), tuple(hue_values))
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def compute_density_raster(dataset_id, x_col, y_col, hue_col=None, hue_values=(), y_range=None, y_inclusive='both'):
+    """Кэшированная 2D-сетка плотности по всем строкам (объект общий, не изменять)"""
+    return build_density_raster(get_dataset(dataset_id), x_col, y_col, compute_column_profiles(dataset_id),
+                                hue_col, tuple(hue_values), y_range, y_inclusive)
+
+
+def use_density_scatter(n_points, max_points, density_scatter):
+    """Scatter plot строится как плотность, если точек больше лимита и режим включен"""
+    return density_scatter and n_points > max_points
+
+
+# ========== ВЫБОРКИ СТРОК ДЛЯ ГРАФИКОВ ==========
+
+SAMPLING_STRATEGIES = {
+    'reservoir': 'случайная выборка',
+    'stratified': 'стратифицированная выборка по категориям',
+    'extremes': 'выборка с сохранением крайних значений',
+}
+SAMPLE_SEED = 42
+# Сколько строк стратифицированная выборка берет от каждой категории (если в ней столько есть)
+MIN_STRATUM_ROWS = 50
+# Доля выборки, которую занимают строки с минимальными и максимальными значениями колонок
+EXTREMES_SHARE = 0.1
+
+
+def _plot_frame(data):
+    """Строки, из которых строятся выборки: датафрейм или равномерная выборка профиля больших файлов"""
+    return data.sample if isinstance(data, ChunkedProfile) else data
+
+
+def _row_keys(n_rows):
+    """Случайные ключи строк: выборка - строки с наименьшими ключами (как резервуар в ChunkedProfile)"""
+    return np.random.default_rng(SAMPLE_SEED).random(n_rows)
+
+
+def _smallest(keys, n):
+    """Номера n наименьших ключей"""
+    if n >= len(keys):
+        return np.arange(len(keys))
+    return np.argpartition(keys, n)[:n]
+
+
+def _stratum_quotas(counts, n, min_rows=MIN_STRATUM_ROWS):
+    """Размеры выборки по стратам: не меньше min_rows (или всей страты), остаток - пропорционально размеру"""
+    floor = np.minimum(counts, min_rows)
+    if floor.sum() >= n:
+        # Даже минимумы не помещаются - по строке на страту, остаток делим пропорционально минимумам
+        ones = np.minimum(counts, 1)
+        rest = floor - ones
+        return ones + rest * max(n - ones.sum(), 0) // max(rest.sum(), 1)
+    spare = counts - floor
+    extra = np.minimum(spare, spare * (n - floor.sum()) // max(spare.sum(), 1))
+    return floor + extra
+
+
+def _stratified_positions(values, n, keys):
+    """Выборка, в которой представлена каждая категория (пропуски - отдельная категория)"""
+    codes, _ = pd.factorize(values, use_na_sentinel=False)
+    counts = np.bincount(codes)
+    if len(counts) > n:
+        # Страт больше, чем строк в выборке - по строке из n страт с наименьшими ключами
+        stratum_keys = np.full(len(counts), np.inf)
+        np.minimum.at(stratum_keys, codes, keys)
+        quotas = np.zeros_like(counts)
+        quotas[_smallest(stratum_keys, n)] = 1
+    else:
+        quotas = _stratum_quotas(counts, n)
+    # Внутри категории строки упорядочены по ключу, берем первые quota
+    order = np.lexsort((keys, codes))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(len(order)) - starts[codes[order]]
+    return order[rank < quotas[codes[order]]]
+
+
+def _extreme_positions(df, columns, budget):
+    """Строки с наименьшими и наибольшими значениями каждой колонки"""
+    per_side = max(1, budget // (2 * max(len(columns), 1)))
+    found = []
+    for col in columns:
+        values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        filled = np.isfinite(values)
+        if not filled.any():
+            continue
+        found.append(_smallest(np.where(filled, values, np.inf), per_side))
+        found.append(_smallest(np.where(filled, -values, np.inf), per_side))
+    return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+
+def build_sample_positions(df, n, strategy='reservoir', column=None):
+    """Отсортированные номера строк выборки из n строк выбранной стратегией
     
-    # Проверяем несовпадения
-    mismatches = []
-    for col in df.columns:
-        if first_types[col] != last_types[col]:
-            mismatches.append({
-                'column': col,
-                'first_15_type': first_types[col],
-                'last_15_type': last_types[col]
-            })
+    column - категория для стратификации; для крайних значений - колонка или кортеж колонок графика
+    (по умолчанию все числовые).
+    """
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия выборки: {strategy}")
+    keys = _row_keys(len(df))
+    if strategy == 'stratified' and column is not None:
+        positions = _stratified_positions(df[column], n, keys)
+    elif strategy == 'extremes':
+        if column is None:
+            columns = df.select_dtypes(include=[np.number]).columns
+        else:
+            # Крайние значения ищутся только по числовым колонкам графика
+            columns = [col for col in (column if isinstance(column, tuple) else (column,))
+                       if pd.api.types.is_numeric_dtype(df[col])]
+        extremes = _extreme_positions(df, columns, int(n * EXTREMES_SHARE))
+        if len(extremes) > n:
+            extremes = extremes[_smallest(keys[extremes], n)]
+        # Остаток выборки - случайные строки из оставшихся
+        keys[extremes] = np.inf
+        positions = np.concatenate([extremes, _smallest(keys, n - len(extremes))])
+    else:
+        positions = _smallest(keys, n)
+    return np.unique(positions).astype(np.int64)
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def compute_sample_indices(dataset_id, n, strategy='reservoir', column=None):
+    """Кэшированные номера строк выборки датасета (массив общий, не изменять)"""
+    return build_sample_positions(_plot_frame(get_dataset(dataset_id)), n, strategy, column)
+
+
+def plot_sample_positions(dataset_id, max_points=None, use_sampling=True, strategy='reservoir', column=None):
+    """Номера строк для графика: все строки или кэшированная выборка (в потоковом режиме - внутри выборки профиля)"""
+    if max_points is None:
+        max_points = 10000
+    if not use_sampling or len(_plot_frame(get_dataset(dataset_id))) <= max_points:
+        return slice(None)
+    return compute_sample_indices(dataset_id, max_points, strategy, column)
+
+
+# ========== КЭШ ОТРИСОВАННЫХ ГРАФИКОВ ==========
+
+# Лимит памяти под готовые картинки (давно не показанные вытесняются)
+PLOT_CACHE_MAX_MB = int(os.environ.get('EDA_PLOT_CACHE_MAX_MB', 256))
+# Те же параметры, с которыми st.pyplot сохраняет фигуру
+PLOT_SAVEFIG_OPTIONS = {'dpi': 200, 'bbox_inches': 'tight'}
+
+
+class PlotCache:
+    """LRU-кэш отрисованных графиков: (идентификатор датасета, описание графика) -> байты PNG/SVG"""
     
-    # Если есть несовпадения - возвращаем ошибку
-    if mismatches:
-        error_msg = "⚠️ Обнаружено несовпадение типов данных между первыми и последними строками:\n\n"
-        for mm in mismatches:
-            error_msg += f"- Колонка '{mm['column']}': первые 15 строк - {mm['first_15_type']}, последние 15 строк - {mm['last_15_type']}\n"
-        error_msg += "\nЭто может указывать на сдвиг данных в середине датасета (например, из-за запятых в текстовых полях)."
-        return df, False, error_msg
+    def __init__(self, max_bytes=PLOT_CACHE_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
     
-    return df, False, None
+    def get(self, key):
+        """Байты картинки или None, если графика нет в кэше"""
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+    
+    def put(self, key, image):
+        """Сохраняет картинку и вытесняет давно не показанные, пока кэш больше лимита"""
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            if len(image) > self.max_bytes:
+                return
+            self._images[key] = image
+            self.size += len(image)
+            while self.size > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self.size -= len(evicted)
 
 
-@st.cache_data
-def load_data(uploaded_file, delimiter=None):
-    """Загружает данные из файла с обработкой сдвигов"""
-    if uploaded_file is not None:
-        try:
-            # Читаем первые строки для определения разделителя
-            content = uploaded_file.read().decode('utf-8')
-            uploaded_file.seek(0)
-            
-            # Если разделитель не указан, определяем автоматически
-            if delimiter is None:
-                # Считаем количество табуляций и запятых в первых строках
-                first_lines = content.split('\n')[:5]
-                tab_counts = [line.count('\t') for line in first_lines if line.strip()]
-                comma_counts = [line.count(',') for line in first_lines if line.strip()]
-                
-                avg_tabs = np.mean(tab_counts) if tab_counts else 0
-                avg_commas = np.mean(comma_counts) if comma_counts else 0
-                
-                # Если табуляций больше и они более равномерны - используем табуляцию
-                if avg_tabs > avg_commas and avg_tabs > 2:
-                    delimiter = '\t'
-                elif avg_commas > 2:
-                    delimiter = ','
-                else:
-                    delimiter = '\t'  # По умолчанию табуляция для TSV
-            
-            # Загружаем данные
-            if delimiter == '\t':
-                df = pd.read_csv(uploaded_file, sep='\t', encoding='utf-8', on_bad_lines='skip', engine='python')
-            else:
-                df = pd.read_csv(uploaded_file, sep=delimiter, quotechar='"', encoding='utf-8', on_bad_lines='skip', engine='python')
-            
-            uploaded_file.seek(0)
-            
-            # Применяем проверку сдвигов
-            df, was_fixed, shift_error = fix_data_shift(df)
-            
-            return df, shift_error, was_fixed
-        except Exception as e:
-            try:
-                # Пробуем альтернативные кодировки
-                uploaded_file.seek(0)
-                if delimiter == '\t':
-                    df = pd.read_csv(uploaded_file, sep='\t', encoding='latin-1', on_bad_lines='skip', engine='python')
-                else:
-                    df = pd.read_csv(uploaded_file, sep=delimiter or ',', encoding='latin-1', on_bad_lines='skip', engine='python')
-                uploaded_file.seek(0)
-                df, was_fixed, shift_error = fix_data_shift(df)
-                return df, shift_error, was_fixed
-            except Exception as e2:
-                return None, f"{str(e)} / {str(e2)}", False
-    return None, None, False
+@st.cache_resource(show_spinner=False)
+def get_plot_cache():
+    """Общий для всех сессий кэш отрисованных графиков"""
+    return PlotCache()
 
 
-def find_target_column(df, numeric_cols, categorical_cols):
-    """Находит целевую переменную в датасете"""
-    target_col = None
-    for col in df.columns:
-        if col.lower() in ['survived', 'target', 'label', 'y', 'class']:
-            target_col = col
-            break
-    
-    # Если нет явной целевой переменной, используем первый категориальный или числовой
-    if target_col is None:
-        if categorical_cols:
-            target_col = categorical_cols[0]
-        elif numeric_cols:
-            target_col = numeric_cols[0]
+def render_figure(fig, fmt='png'):
+    """Сохраняет фигуру matplotlib в байты и закрывает ее (если она создана через pyplot)"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, **PLOT_SAVEFIG_OPTIONS)
+    if fig.canvas.manager is not None:
+        import matplotlib.pyplot as plt
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+def cached_plot(dataset_id, spec, draw, fmt='png'):
+    """Картинка графика из кэша; draw() строит фигуру matplotlib (или сразу байты картинки) только при промахе
     
-    return target_col
+    spec - хэшируемое описание графика: все параметры, от которых зависит картинка (колонки, виджеты, режимы).
+    """
+    cache = get_plot_cache()
+    key = (dataset_id, fmt, spec)
+    image = cache.get(key)
+    if image is None:
+        image = draw()
+        if not isinstance(image, bytes):
+            image = render_figure(image, fmt)
+        cache.put(key, image)
+    return image
 
 
-@st.cache_data
-def compute_correlation_matrix(df, numeric_cols):
-    """Кэшированное вычисление корреляционной матрицы"""
-    if len(numeric_cols) < 2:
-        return None
-    return df[numeric_cols].corr()
+def show_plot(dataset_id, spec, draw, fmt='png'):
+    """Показывает график из кэша отрисованных картинок (см. cached_plot)"""
+    image = cached_plot(dataset_id, spec, draw, fmt)
+    st.image(image.decode() if fmt == 'svg' else image, width='stretch')
 
 
-@st.cache_data
-def compute_basic_stats(df, numeric_cols):
-    """Кэшированное вычисление базовой статистики"""
-    if not numeric_cols:
-        return None
-    return df[numeric_cols].describe()
+# ========== ПАРАЛЛЕЛЬНАЯ ОТРИСОВКА ГРАФИКОВ ==========
 
+# Число процессов отрисовки (1 - рисовать в вызывающем потоке); описания рисуются без pyplot, процессы - ради параллелизма
+RENDER_WORKERS = int(os.environ.get('EDA_RENDER_WORKERS', os.cpu_count() or 1))
 
-@st.cache_data
-def compute_value_counts(df, col, top_n=10):
-    """Кэшированное вычисление частот значений"""
-    return df[col].value_counts().head(top_n)
+
+def layer(kind, *args, **kwargs):
+    """Слой панели: метод Axes (scatter, plot, set_title, legend...) или слой из PLOT_LAYERS с аргументами"""
+    return kind, args, kwargs
+
+
+@dataclass(frozen=True)
+class PlotSpec:
+    """Декларативное описание фигуры: панели из слоев поверх заранее агрегированных данных, без объектов matplotlib"""
+    panels: tuple            # по списку слоев на каждую ось, построчно
+    figsize: tuple = (8, 5)
+    layout: tuple = (1, 1)   # строк и столбцов осей
+
+
+def _hist_layer(ax, binned, bins=25, group=None, density=False, outside=None, **kwargs):
+    """Гистограмма раскладки колонки (outside=(нижняя, верхняя) - только значения за границами)"""
+    mask = None if outside is None else (lambda x: (x < outside[0]) | (x > outside[1]))
+    binned.draw_hist(ax, bins=bins, group=group, density=density, mask=mask, **kwargs)
+
+
+def _kde_layer(ax, binned, group=None, cut=None, **kwargs):
+    kde = binned.kde(group, cut=cut)
+    if kde is not None:
+        ax.plot(*kde, **kwargs)
+
+
+def _density_layer(ax, raster, colorbar=None, **kwargs):
+    """Растр плотности; colorbar - подпись цветовой шкалы (только для одноцветного растра)"""
+    if raster is None:
+        return
+    image = raster.draw(ax, **kwargs)
+    if colorbar and image is not None:
+        ax.figure.colorbar(image, ax=ax, label=colorbar)
+
+
+def _probplot_layer(ax, values):
+    from scipy import stats as scipy_stats
+    scipy_stats.probplot(values, dist="norm", plot=ax)
+
+
+def _heatmap_layer(ax, data, **kwargs):
+    import seaborn as sns
+    sns.heatmap(data, ax=ax, **kwargs)
+
+
+def _axes_text_layer(ax, x, y, text, **kwargs):
+    """Текст в координатах осей (0..1)"""
+    ax.text(x, y, text, transform=ax.transAxes, **kwargs)
 
 
-@st.cache_data
-def compute_outliers(df, col):
-    """Кэшированное вычисление выбросов"""
-    Q1 = df[col].quantile(0.25)
-    Q3 = df[col].quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    outliers = df[(df[col] < lower_bound) | (df[col] > upper_bound)]
-    return Q1, Q3, IQR, lower_bound, upper_bound, outliers
+def _labeled_barh_layer(ax, labels, values, **kwargs):
+    """Горизонтальные столбцы с подписями значений по оси Y"""
+    ax.barh(range(len(values)), values, **kwargs)
+    ax.set_yticks(range(len(values)))
+    ax.set_yticklabels(labels, fontsize=8)
 
 
-@st.cache_data
-def compute_missing_stats(df):
-    """Кэшированное вычисление статистики пропусков"""
-    missing_data = df.isnull().sum()
-    missing_percent = (missing_data / len(df)) * 100
+PLOT_LAYERS = {
+    'hist': _hist_layer,
+    'kde': _kde_layer,
+    'violins': draw_violins,
+    'density': _density_layer,
+    'probplot': _probplot_layer,
+    'heatmap': _heatmap_layer,
+    'axes_text': _axes_text_layer,
+    'labeled_barh': _labeled_barh_layer,
+}
+
+
+def draw_plot_spec(spec):
+    """Строит фигуру matplotlib по описанию (без pyplot, поэтому безопасно вне потока скрипта)"""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=spec.figsize)
+    axes = fig.subplots(*spec.layout, squeeze=False)
+    for ax, layers in zip(axes.flat, spec.panels):
+        for kind, args, kwargs in layers:
+            if kind in PLOT_LAYERS:
+                PLOT_LAYERS[kind](ax, *args, **kwargs)
+            else:
+                getattr(ax, kind)(*args, **kwargs)
+    fig.tight_layout()
+    return fig
+
+
+def _render_plot_spec(spec, fmt='png'):
+    """Отрисовка одного описания в байты картинки (выполняется в процессе пула)"""
+    return render_figure(draw_plot_spec(spec), fmt)
+
+
+def _init_render_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+@st.cache_resource(show_spinner=False)
+def get_render_pool():
+    """Общий пул процессов отрисовки графиков"""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    # spawn: форк многопоточного сервера Streamlit небезопасен
+    return ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_render_worker)
+
+
+def render_plot_specs(specs, fmt='png', progress_callback=None):
+    """Байты картинок по описаниям фигур, в порядке описаний; фигуры рисуются параллельно в пуле процессов
+    
+    Одна фигура тоже уходит в пул: отрисовка не занимает GIL процесса сервера, и другие сессии ее не ждут.
+    """
+    specs = list(specs)
+    images = [None] * len(specs)
+    if RENDER_WORKERS > 1 and specs:
+        from concurrent.futures import as_completed
+        pool = get_render_pool()
+        futures = {pool.submit(_render_plot_spec, spec, fmt): i for i, spec in enumerate(specs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            images[futures[future]] = future.result()
+            if progress_callback:
+                progress_callback(done / len(specs))
+        return images
+    for i, spec in enumerate(specs):
+        images[i] = _render_plot_spec(spec, fmt)
+        if progress_callback:
+            progress_callback((i + 1) / len(specs))
+    return images
+
+
+def cached_plot_specs(dataset_id, keys, specs, fmt='png', progress_callback=None):
+    """Картинки по описаниям фигур через кэш отрисованных графиков: недостающие рисуются одним пакетом (см. render_plot_specs)
+    
+    keys - хэшируемые описания графиков (как spec в cached_plot), по одному на описание фигуры.
+    """
+    cache = get_plot_cache()
+    specs = list(specs)
+    cache_keys = [(dataset_id, fmt, key) for key in keys]
+    images = [cache.get(key) for key in cache_keys]
+    missing = [i for i, image in enumerate(images) if image is None]
+    for i, image in zip(missing, render_plot_specs([specs[i] for i in missing], fmt, progress_callback)):
+        cache.put(cache_keys[i], image)
+        images[i] = image
+    return images
+
+
+def compute_missing_stats(dataset_id):
+    """Статистика пропусков по профилю колонок"""
+    profiles = compute_column_profiles(dataset_id)
     missing_df = pd.DataFrame({
-        'Количество': missing_data,
-        'Процент': missing_percent
+        'Количество': profile_series(profiles, 'null_count'),
+        'Процент': profile_series(profiles, 'null_pct')
     })
     return missing_df[missing_df['Количество'] > 0].sort_values('Количество', ascending=False)
 
@@ -436,8 +3153,10 @@ def download_kaggle_dataset(dataset_name, dataset_path):
 
 # ========== ФУНКЦИИ ДЛЯ ЭКСПОРТА ОТЧЕТОВ ==========
 
-def generate_html_report(df, numeric_cols, categorical_cols, target_col, correlation_matrix=None, vif_data=None, hypotheses=None):
+def generate_html_report(dataset_id, numeric_cols, categorical_cols, target_col, correlation_matrix=None, vif_data=None, hypotheses=None,
+                         outlier_summary=None):
     """Генерирует HTML отчет с результатами анализа"""
+    df = get_dataset(dataset_id)
     from datetime import datetime
     import base64
     import io
@@ -531,8 +3250,9 @@ def generate_html_report(df, numeric_cols, categorical_cols, target_col, correla
                 </tr>
     """
     
-    missing_data = df.isnull().sum()
-    missing_percent = (missing_data / len(df)) * 100
+    profiles = compute_column_profiles(dataset_id)
+    missing_data = profile_series(profiles, 'null_count')
+    missing_percent = profile_series(profiles, 'null_pct')
     for col in df.columns:
         if missing_data[col] > 0:
             html_content += f"""
@@ -547,15 +3267,37 @@ def generate_html_report(df, numeric_cols, categorical_cols, target_col, correla
             </table>
     """
     
+    if outlier_summary:
+        html_content += """
+            <h2>3. Выбросы (IQR)</h2>
+            <table>
+                <tr>
+                    <th>Признак</th>
+                    <th>Количество выбросов</th>
+                    <th>Процент</th>
+                </tr>
+        """
+        for outlier_row in outlier_summary:
+            html_content += f"""
+                <tr>
+                    <td>{outlier_row['Признак']}</td>
+                    <td>{outlier_row['Выбросов']}</td>
+                    <td>{outlier_row['Процент']}</td>
+                </tr>
+            """
+        html_content += """
+            </table>
+        """
+    
     if correlation_matrix is not None:
         html_content += """
-            <h2>3. Корреляционный анализ</h2>
+            <h2>4. Корреляционный анализ</h2>
             <p>Корреляционная матрица вычислена для числовых признаков.</p>
         """
         
         if vif_data:
             html_content += """
-                <h3>3.1. Анализ мультиколлинеарности (VIF)</h3>
+                <h3>4.1. Анализ мультиколлинеарности (VIF)</h3>
                 <table>
                     <tr>
                         <th>Признак</th>
@@ -577,8 +3319,12 @@ def generate_html_report(df, numeric_cols, categorical_cols, target_col, correla
     
     if hypotheses:
         html_content += """
-            <h2>4. Сгенерированные гипотезы</h2>
+            <h2>5. Сгенерированные гипотезы</h2>
         """
+        # Графики гипотез берутся из кэша картинок, недостающие рисуются одним пакетом
+        with_plot = [hyp for hyp in hypotheses if hyp.get('plot') is not None]
+        images = cached_plot_specs(dataset_id, [hyp['plot_key'] for hyp in with_plot], [hyp['plot'] for hyp in with_plot])
+        plot_images = {id(hyp): image for hyp, image in zip(with_plot, images)}
         for i, hyp in enumerate(hypotheses, 1):
             html_content += f"""
                 <div class="stat-box">
@@ -588,6 +3334,8 @@ def generate_html_report(df, numeric_cols, categorical_cols, target_col, correla
             """
             if 'statistical_test' in hyp and hyp['statistical_test']:
                 html_content += f"<p><strong>Статистический тест:</strong><br>{hyp['statistical_test'].replace(chr(10), '<br>')}</p>"
+            if id(hyp) in plot_images:
+                html_content += f'<img src="data:image/png;base64,{base64.b64encode(plot_images[id(hyp)]).decode()}" style="max-width: 100%;">'
             html_content += "</div>"
     
     html_content += """
@@ -599,8 +3347,10 @@ def generate_html_report(df, numeric_cols, categorical_cols, target_col, correla
     return html_content
 
 
-def generate_pdf_report(df, numeric_cols, categorical_cols, target_col, correlation_matrix=None, vif_data=None, hypotheses=None):
+def generate_pdf_report(dataset_id, numeric_cols, categorical_cols, target_col, correlation_matrix=None, vif_data=None, hypotheses=None,
+                        outlier_summary=None):
     """Генерирует PDF отчет с результатами анализа"""
+    df = get_dataset(dataset_id)
     from reportlab.lib.pagesizes import letter, A4
     from reportlab.lib import colors
     from reportlab.lib.units import inch
@@ -654,8 +3404,9 @@ def generate_pdf_report(df, numeric_cols, categorical_cols, target_col, correlat
     
     # Пропущенные значения
     story.append(Paragraph("2. Пропущенные значения", styles['Heading2']))
-    missing_data = df.isnull().sum()
-    missing_percent = (missing_data / len(df)) * 100
+    profiles = compute_column_profiles(dataset_id)
+    missing_data = profile_series(profiles, 'null_count')
+    missing_percent = profile_series(profiles, 'null_pct')
     missing_table_data = [['Признак', 'Количество пропусков', 'Процент']]
     for col in df.columns:
         if missing_data[col] > 0:
@@ -678,9 +3429,29 @@ def generate_pdf_report(df, numeric_cols, categorical_cols, target_col, correlat
     
     story.append(Spacer(1, 0.3*inch))
     
+    # Выбросы
+    if outlier_summary:
+        story.append(Paragraph("3. Выбросы (IQR)", styles['Heading2']))
+        outlier_table_data = [['Признак', 'Количество выбросов', 'Процент']]
+        for outlier_row in outlier_summary:
+            outlier_table_data.append([outlier_row['Признак'], str(outlier_row['Выбросов']), outlier_row['Процент']])
+        
+        outlier_table = Table(outlier_table_data, colWidths=[2.5*inch, 2*inch, 1.5*inch])
+        outlier_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        story.append(outlier_table)
+        story.append(Spacer(1, 0.3*inch))
+    
     # VIF анализ
     if vif_data:
-        story.append(Paragraph("3. Анализ мультиколлинеарности (VIF)", styles['Heading2']))
+        story.append(Paragraph("4. Анализ мультиколлинеарности (VIF)", styles['Heading2']))
         vif_table_data = [['Признак', 'VIF', 'Оценка']]
         for vif_row in vif_data:
             vif_table_data.append([vif_row['Признак'], vif_row['VIF'], vif_row['Оценка']])
@@ -700,7 +3471,7 @@ def generate_pdf_report(df, numeric_cols, categorical_cols, target_col, correlat
     
     # Гипотезы
     if hypotheses:
-        story.append(Paragraph("4. Сгенерированные гипотезы", styles['Heading2']))
+        story.append(Paragraph("5. Сгенерированные гипотезы", styles['Heading2']))
         for i, hyp in enumerate(hypotheses, 1):
             story.append(Paragraph(f"<b>Гипотеза {i}:</b> {hyp.get('Гипотеза', 'N/A')}", styles['Heading3']))
             story.append(Paragraph(f"<b>Обоснование:</b> {hyp.get('Обоснование', 'N/A')}", styles['Normal']))
@@ -712,3 +3483,91 @@ def generate_pdf_report(df, numeric_cols, categorical_cols, target_col, correlat
     doc.build(story)
     buffer.seek(0)
     return buffer.getvalue()
+
+
+# ========== ФОНОВАЯ СБОРКА ОТЧЕТОВ ==========
+
+# Форматы отчетов: функция сборки, MIME-тип и подпись кнопки
+REPORT_FORMATS = {
+    'html': {'label': 'HTML', 'icon': '📄', 'mime': 'text/html', 'builder': generate_html_report},
+    'pdf': {'label': 'PDF', 'icon': '📑', 'mime': 'application/pdf', 'builder': generate_pdf_report},
+}
+
+# Сколько готовых отчетов хранится в памяти (старые вытесняются)
+REPORT_JOBS_MAX_ENTRIES = 16
+
+
+class ReportJob:
+    """Фоновая сборка одного отчета: этап, прогресс, результат или ошибка"""
+    
+    def __init__(self, report_format):
+        self.report_format = report_format
+        self.progress = 0.0
+        self.stage = "В очереди"
+        self.result = None
+        self.error = None
+        self.future = None
+        self.dataset = None
+    
+    @property
+    def running(self):
+        return self.future is not None and not self.future.done()
+    
+    @property
+    def ready(self):
+        return self.result is not None
+    
+    def run(self, dataset_id, numeric_cols, categorical_cols, target_col, hypotheses):
+        """Собирает отчет (выполняется в пуле потоков)"""
+        try:
+            self.progress, self.stage = 0.1, "Корреляционная матрица"
+            correlation_matrix = compute_correlation_matrix(dataset_id, numeric_cols) if len(numeric_cols) > 1 else None
+            self.progress, self.stage = 0.4, "Анализ мультиколлинеарности (VIF)"
+            try:
+                vif_data = compute_vif_data(dataset_id, numeric_cols)
+            except Exception:
+                vif_data = None
+            self.progress, self.stage = 0.6, "Выбросы"
+            outlier_summary = compute_outlier_summary(dataset_id) if numeric_cols else None
+            self.progress, self.stage = 0.7, f"Сборка {REPORT_FORMATS[self.report_format]['label']}"
+            self.result = REPORT_FORMATS[self.report_format]['builder'](
+                dataset_id, numeric_cols, categorical_cols, target_col, correlation_matrix, vif_data, hypotheses, outlier_summary)
+            self.progress, self.stage = 1.0, "Готово"
+        except Exception as e:
+            self.error = str(e)
+            self.stage = "Ошибка"
+        finally:
+            self.dataset = None
+
+
+@st.cache_resource(show_spinner=False)
+def _report_jobs():
+    """Общие для всех сессий задачи сборки отчетов и пул потоков для них"""
+    from concurrent.futures import ThreadPoolExecutor
+    return OrderedDict(), threading.Lock(), ThreadPoolExecutor(max_workers=2, thread_name_prefix='eda-report')
+
+
+def get_report_job(job_key):
+    """Задача сборки отчета по ключу (датасет, формат, параметры) или None"""
+    jobs, lock, _ = _report_jobs()
+    with lock:
+        return jobs.get(job_key)
+
+
+def start_report_job(job_key, dataset_id, report_format, numeric_cols, categorical_cols, target_col, hypotheses=None):
+    """Запускает фоновую сборку отчета; уже запущенная или собранная задача переиспользуется"""
+    jobs, lock, executor = _report_jobs()
+    with lock:
+        job = jobs.get(job_key)
+        if job is not None and job.error is None:
+            jobs.move_to_end(job_key)
+            return job
+        job = ReportJob(report_format)
+        # Задача держит ссылку на датасет до конца сборки, даже если сессия уже переключилась на другой
+        job.dataset = get_dataset(dataset_id)
+        job.future = executor.submit(job.run, dataset_id, list(numeric_cols), list(categorical_cols), target_col, hypotheses)
+        jobs[job_key] = job
+        # Вытесняем самые старые завершенные задачи
+        for key in [key for key, old_job in jobs.items() if key != job_key and not old_job.running][:max(len(jobs) - REPORT_JOBS_MAX_ENTRIES, 0)]:
+            del jobs[key]
+        return job